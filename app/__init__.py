@@ -37,6 +37,12 @@ def create_app(test_config=None):
             SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
             SQLALCHEMY_DATABASE_URI=db_url, # 環境変数から取得
             SQLALCHEMY_TRACK_MODIFICATIONS=False,
+            # ジョブキューのワーカー設定 (0の場合はワーカースレッドを起動しない)
+            # Vercelではレスポンス後にスレッドが停止されるため、デフォルトでは起動しない
+            JOB_WORKER_THREADS=int(os.environ.get('JOB_WORKER_THREADS', '0' if os.environ.get('VERCEL') else '2')),
+            JOB_POLL_INTERVAL=float(os.environ.get('JOB_POLL_INTERVAL', '5')),
+            # 1以上の場合はワーカースレッドの代わりに非同期ランナーで指定数のジョブを同時に処理する
+            JOB_ASYNC_CONCURRENCY=int(os.environ.get('JOB_ASYNC_CONCURRENCY', '0')),
         )
         print("--- Configuring app settings END ---", file=sys.stderr)
         logging.warning("--- Configuring app settings END ---")
@@ -80,7 +86,7 @@ def create_app(test_config=None):
         with app.app_context():
             print("--- App context entered ---", file=sys.stderr)
             logging.warning("--- App context entered ---")
-            from app.models import Settings, MinutesHistory
+            from app.models import Settings, MinutesHistory, JobQueue
             print("--- Models imported within context ---", file=sys.stderr)
             logging.warning("--- Models imported within context ---")
             print("--- Attempting db.create_all() START ---", file=sys.stderr)
@@ -89,6 +95,12 @@ def create_app(test_config=None):
             print("--- Attempting db.create_all() END ---", file=sys.stderr)
             logging.warning("--- Attempting db.create_all() END ---")
 
+            # 既存テーブルに追加されたカラム・インデックスを反映
+            from app.models import upgrade_schema
+            upgrade_schema()
+            print("--- Schema upgraded (if needed) ---", file=sys.stderr)
+            logging.warning("--- Schema upgraded (if needed) ---")
+
             # デフォルト設定がなければ作成
             from app.models import initialize_default_settings
             initialize_default_settings()
@@ -99,6 +111,30 @@ def create_app(test_config=None):
         logging.error(f"--- ERROR within app_context (likely db.create_all): {context_e} ---", exc_info=True)
         # ここでraiseするかどうかは状況による (起動はするがDB操作でエラーになる)
 
+    # ステータス配信 (SSE) の初期化
+    from app.services import status_events
+    status_events.init_app(app)
+
+    # ジョブキューの非同期ランナーまたはワーカースレッドを起動
+    if app.config.get('JOB_WORKER_THREADS', 0) > 0 and app.config.get('JOB_ASYNC_CONCURRENCY', 0) > 0:
+        from app.services.job_queue import start_async_runner
+        app.extensions['worker_pool'] = start_async_runner(
+            app,
+            concurrency=app.config['JOB_ASYNC_CONCURRENCY'],
+            poll_interval=app.config['JOB_POLL_INTERVAL']
+        )
+        print(f"--- Async job runner started (concurrency: {app.config['JOB_ASYNC_CONCURRENCY']}) ---", file=sys.stderr)
+        logging.warning(f"--- Async job runner started (concurrency: {app.config['JOB_ASYNC_CONCURRENCY']}) ---")
+    elif app.config.get('JOB_WORKER_THREADS', 0) > 0:
+        from app.services.job_queue import start_worker_pool
+        app.extensions['worker_pool'] = start_worker_pool(
+            app,
+            num_threads=app.config['JOB_WORKER_THREADS'],
+            poll_interval=app.config['JOB_POLL_INTERVAL']
+        )
+        print(f"--- Worker pool started ({app.config['JOB_WORKER_THREADS']} threads) ---", file=sys.stderr)
+        logging.warning(f"--- Worker pool started ({app.config['JOB_WORKER_THREADS']} threads) ---")
+
     print("--- create_app END ---", file=sys.stderr)
     logging.warning("--- create_app END ---")
     return app 
\ No newline at end of file
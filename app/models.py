@@ -2,8 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import json
+import zlib
+import logging
 from datetime import datetime
+from sqlalchemy import inspect, text
 from app import db
+from app.services import transcript_store
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
 
 class Settings(db.Model):
     """アプリケーション設定を保存するモデル"""
@@ -17,12 +24,26 @@ class Settings(db.Model):
     anthropic_thinking_mode = db.Column(db.Boolean, default=True)
     openai_chatgpt_model = db.Column(db.String(50), nullable=False, default="gpt-4o")
     
+    # 生成オプション
+    single_call_mode = db.Column(db.Boolean, default=True)  # 議事録とタイトルを1回の呼び出しで生成する
+    streaming_mode = db.Column(db.Boolean, default=False)  # ストリーミングで生成しながらNotionに書き込む
+    normalize_transcript = db.Column(db.Boolean, default=True)  # フィラー・タイムスタンプの削除、同じ話者の発言の結合
+    dedupe_transcript = db.Column(db.Boolean, default=False)  # 繰り返された文・句を削除する
+    
+    # ヘッジリクエスト（主プロバイダーの応答が遅い場合に副プロバイダーでも並行して生成する）
+    hedge_enabled = db.Column(db.Boolean, default=False)
+    hedge_provider = db.Column(db.String(50), nullable=True)  # 副プロバイダー（モデルは各プロバイダーのモデル設定を使用）
+    hedge_percentile = db.Column(db.Integer, nullable=False, default=95)  # 主プロバイダーの直近の応答時間のパーセンタイル
+    
     # Notion設定
     notion_parent_page_id = db.Column(db.String(50), nullable=True)
     
     # 最終更新日時
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 設定のバージョン（保存のたびに増やし、各プロセスの設定キャッシュの更新判定に使用する）
+    version = db.Column(db.Integer, nullable=False, default=1)
+    
     def __repr__(self):
         return f'<Settings {self.id}>'
     
@@ -35,14 +56,29 @@ class Settings(db.Model):
             'anthropic_claude_model': self.anthropic_claude_model,
             'anthropic_thinking_mode': self.anthropic_thinking_mode,
             'openai_chatgpt_model': self.openai_chatgpt_model,
+            'single_call_mode': self.single_call_mode,
+            'streaming_mode': self.streaming_mode,
+            'normalize_transcript': self.normalize_transcript,
+            'dedupe_transcript': self.dedupe_transcript,
+            'hedge_enabled': self.hedge_enabled,
+            'hedge_provider': self.hedge_provider,
+            'hedge_percentile': self.hedge_percentile,
             'notion_parent_page_id': self.notion_parent_page_id,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version
         }
 
 
 class MinutesHistory(db.Model):
     """生成された議事録履歴を保存するモデル"""
     
+    __table_args__ = (
+        # 一覧のキーセットページネーション (received_at DESC, id DESC) 用
+        db.Index('ix_minutes_history_received_at_id', 'received_at', 'id'),
+        # ステータスで絞り込んだ一覧用
+        db.Index('ix_minutes_history_status_received_at_id', 'status', 'received_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     
     # Notta情報
@@ -58,13 +94,45 @@ class MinutesHistory(db.Model):
     # 生成された議事録
     generated_title = db.Column(db.String(255), nullable=True)
     notion_page_url = db.Column(db.String(255), nullable=True)
+    notion_api_calls = db.Column(db.Integer, nullable=True)  # ページ作成に使用したNotion API呼び出し回数
     
     # 元データ（Webhookで受け取ったデータを保存）
-    raw_data = db.Column(db.Text, nullable=True)
+    # 旧形式の元データ（非圧縮JSON）。新しいデータは TranscriptBlob に圧縮して保存する
+    raw_data = db.deferred(db.Column(db.Text, nullable=True))
+    transcript = db.relationship(
+        'TranscriptBlob', uselist=False, lazy='select', cascade='all, delete-orphan'
+    )
+    
+    # 重複受信の抑止用キー（Idempotency-Keyヘッダー、またはタイトル・作成時間・内容から算出）
+    idempotency_key = db.Column(db.String(64), nullable=True, unique=True, index=True)
     
     # 処理状態
     status = db.Column(db.String(20), default="pending")  # pending, processing, completed, failed
     error_message = db.Column(db.Text, nullable=True)  # エラーが発生した場合のメッセージ
+    cache_hit = db.Column(db.Boolean, default=False)  # 生成キャッシュから結果を取得したかどうか
+    transcript_chars = db.Column(db.Integer, nullable=True)  # 受信した文字起こしの文字数
+    normalized_chars = db.Column(db.Integer, nullable=True)  # 正規化後（プロンプトに入れた）文字起こしの文字数
+    
+    # LLMのトークン使用量（議事録生成1件で行った全呼び出しの合計）
+    input_tokens = db.Column(db.Integer, nullable=True)  # 入力トークン数（プロンプトキャッシュの読み書き分を含む）
+    cached_input_tokens = db.Column(db.Integer, nullable=True)  # プロンプトキャッシュから読み込んだ入力トークン数
+    cache_write_tokens = db.Column(db.Integer, nullable=True)  # プロンプトキャッシュに書き込んだ入力トークン数
+    output_tokens = db.Column(db.Integer, nullable=True)
+    first_token_ms = db.Column(db.Integer, nullable=True)  # 最初の呼び出しで最初の出力を受け取るまでの時間
+    cost_usd = db.Column(db.Float, nullable=True)  # 料金表から計算したLLM呼び出しのコスト（米ドル）
+    # 呼び出しの種類（議事録・タイトルなど）とモデルごとの内訳
+    token_usage = db.relationship('TokenUsage', lazy='select', cascade='all, delete-orphan')
+    
+    # ヘッジリクエストの記録（ai_provider / ai_model には採用した結果のプロバイダー・モデルを保存する）
+    hedge_provider = db.Column(db.String(50), nullable=True)
+    hedge_model = db.Column(db.String(50), nullable=True)
+    hedge_triggered = db.Column(db.Boolean, default=False)  # 副プロバイダーへのリクエストを開始したかどうか
+    hedge_won = db.Column(db.Boolean, default=False)  # 副プロバイダーの結果を採用したかどうか
+    primary_latency_ms = db.Column(db.Integer, nullable=True)  # 主プロバイダーの応答時間（キャンセルした場合はそれまでの時間）
+    hedge_latency_ms = db.Column(db.Integer, nullable=True)  # 副プロバイダーの応答時間（同上）
+    
+    # 最終更新日時（ステータス変更の配信で変更のあったレコードを検出するために使用）
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<MinutesHistory {self.id}>'
@@ -81,12 +149,43 @@ class MinutesHistory(db.Model):
             'ai_model': self.ai_model,
             'generated_title': self.generated_title,
             'notion_page_url': self.notion_page_url,
+            'notion_api_calls': self.notion_api_calls,
             'status': self.status,
-            'error_message': self.error_message
+            'error_message': self.error_message,
+            'cache_hit': self.cache_hit,
+            'transcript_chars': self.transcript_chars,
+            'normalized_chars': self.normalized_chars,
+            'input_tokens': self.input_tokens,
+            'cached_input_tokens': self.cached_input_tokens,
+            'cache_write_tokens': self.cache_write_tokens,
+            'output_tokens': self.output_tokens,
+            'first_token_ms': self.first_token_ms,
+            'cost_usd': self.cost_usd,
+            'hedge_provider': self.hedge_provider,
+            'hedge_model': self.hedge_model,
+            'hedge_triggered': self.hedge_triggered,
+            'hedge_won': self.hedge_won,
+            'primary_latency_ms': self.primary_latency_ms,
+            'hedge_latency_ms': self.hedge_latency_ms,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
     
+    def set_raw_data(self, data, raw=None):
+        """Webhookで受信したデータを圧縮して別テーブルに保存する（raw を指定した場合は受信した本文をそのまま保存する）"""
+        codec, payload, raw_size = transcript_store.encode(data, raw)
+        self.transcript = TranscriptBlob(
+            codec=codec, data=payload, raw_size=raw_size, compressed_size=len(payload)
+        )
+        self.raw_data = None
+    
     def get_raw_data_dict(self):
-        """保存されたJSONデータをディクショナリに変換"""
+        """保存されたJSONデータをディクショナリに変換（参照時に初めて読み込んで展開する）"""
+        if self.transcript is not None:
+            try:
+                return self.transcript.get_data()
+            except (ValueError, zlib.error) as e:
+                logger.error(f"元データの展開に失敗しました (history_id: {self.id}): {str(e)}")
+                return {}
         if self.raw_data:
             try:
                 return json.loads(self.raw_data)
@@ -95,10 +194,187 @@ class MinutesHistory(db.Model):
         return {}
 
 
+class TranscriptBlob(db.Model):
+    """Webhookで受信した元データ（文字起こし全文を含むJSON）を圧縮して保存するモデル
+
+    履歴テーブルの行を小さく保つため、元データは別テーブルに分けて保存する。
+    """
+    
+    id = db.Column(db.Integer, primary_key=True)
+    history_id = db.Column(db.Integer, db.ForeignKey('minutes_history.id'), nullable=False, unique=True, index=True)
+    codec = db.Column(db.String(10), nullable=False)  # zlib, zstd
+    data = db.Column(db.LargeBinary, nullable=False)
+    raw_size = db.Column(db.Integer, nullable=False)  # 圧縮前のバイト数
+    compressed_size = db.Column(db.Integer, nullable=False)  # 圧縮後のバイト数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TranscriptBlob history_id={self.history_id} {self.codec}>'
+    
+    def get_data(self):
+        """展開した元データを取得する"""
+        return transcript_store.decode(self.codec, self.data)
+
+
+class GenerationCache(db.Model):
+    """生成された議事録のキャッシュを保存するモデル（入力内容のハッシュをキーとする）"""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), nullable=False, unique=True)
+    
+    # 生成条件
+    ai_provider = db.Column(db.String(50), nullable=True)
+    ai_model = db.Column(db.String(50), nullable=True)
+    
+    # 生成結果
+    minutes_content = db.Column(db.Text, nullable=False)
+    generated_title = db.Column(db.String(255), nullable=True)
+    
+    # 利用状況（エビクション用）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_hit_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<GenerationCache {self.cache_key[:12]}>'
+
+
+class JobQueue(db.Model):
+    """議事録生成ジョブのキューを保存するモデル（DBベースの永続キュー）"""
+    
+    __table_args__ = (
+        db.Index('ix_job_queue_status_available_at', 'status', 'available_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    history_id = db.Column(db.Integer, db.ForeignKey('minutes_history.id'), nullable=False, index=True)
+    
+    # ジョブ状態
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    # スケジューリング・ロック情報
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # 最後の実行の処理段階ごとの時間（stage_timing の記録をJSONで保存）
+    spans = db.Column(db.Text, nullable=True)
+    
+    def __repr__(self):
+        return f'<JobQueue {self.id} history={self.history_id} {self.status}>'
+    
+    def to_dict(self):
+        """ジョブをディクショナリに変換"""
+        return {
+            'id': self.id,
+            'history_id': self.history_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'locked_by': self.locked_by,
+            'locked_at': self.locked_at.isoformat() if self.locked_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'spans': self.get_spans()
+        }
+    
+    def get_spans(self):
+        """処理段階ごとの時間の記録をリストに変換"""
+        if not self.spans:
+            return []
+        try:
+            return json.loads(self.spans)
+        except json.JSONDecodeError:
+            return []
+
+
+class TokenUsage(db.Model):
+    """議事録生成1件のLLM呼び出しのトークン使用量・コストを、プロバイダー・モデル・呼び出しの種類ごとに保存するモデル"""
+    
+    __table_args__ = (
+        db.Index('ix_token_usage_created_at_provider_model', 'created_at', 'ai_provider', 'ai_model'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    history_id = db.Column(db.Integer, db.ForeignKey('minutes_history.id'), nullable=False, index=True)
+    ai_provider = db.Column(db.String(50), nullable=True)
+    ai_model = db.Column(db.String(50), nullable=True)
+    stage = db.Column(db.String(50), nullable=True)  # llm.minutes, llm.title, llm.chunk_summary, llm.minutes_stream
+    
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    input_tokens = db.Column(db.Integer, nullable=False, default=0)  # プロンプトキャッシュの読み書き分を含む
+    cached_input_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cache_write_tokens = db.Column(db.Integer, nullable=False, default=0)
+    output_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=True)  # 料金表にないモデルの場合はNone
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TokenUsage history={self.history_id} {self.ai_model} {self.stage}>'
+    
+    def to_dict(self):
+        """使用量をディクショナリに変換"""
+        return {
+            'ai_provider': self.ai_provider,
+            'ai_model': self.ai_model,
+            'stage': self.stage,
+            'calls': self.calls,
+            'input_tokens': self.input_tokens,
+            'cached_input_tokens': self.cached_input_tokens,
+            'cache_write_tokens': self.cache_write_tokens,
+            'output_tokens': self.output_tokens,
+            'cost_usd': self.cost_usd
+        }
+
+
 def initialize_default_settings():
-    """デフォルト設定の初期化（存在しない場合）"""
-    if not Settings.query.first():
-        default_settings = Settings()
-        db.session.add(default_settings)
-        db.session.commit()
-        print("デフォルト設定を初期化しました。") 
\ No newline at end of file
+    """デフォルト設定の初期化（存在しない場合）と設定キャッシュの準備"""
+    # 循環インポートを避けるため関数内でインポート
+    from app.services.settings_cache import get_settings
+    get_settings()
+
+
+def upgrade_schema():
+    """既存テーブルに不足しているカラムとインデックスを追加する
+
+    db.create_all() は既存テーブルを変更しないため、モデルに追加したカラムを
+    既存のデータベースに反映する（追加のみ。型変更や削除は行わない）。
+    """
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        # 不足カラムの追加
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                literal = db.literal(default, type_=column.type).compile(
+                    dialect=dialect, compile_kwargs={"literal_binds": True}
+                )
+                ddl += f' DEFAULT {literal}'
+            logger.warning(f"カラムを追加します: {table.name}.{column.name}")
+            with db.engine.begin() as connection:
+                connection.execute(text(ddl))
+        
+        # 不足インデックスの追加
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                logger.warning(f"インデックスを追加します: {index.name}")
+                index.create(bind=db.engine, checkfirst=True)
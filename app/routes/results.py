@@ -1,46 +1,104 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, render_template, jsonify, request
+import os
+from datetime import datetime
+from flask import Blueprint, Response, current_app, render_template, jsonify, request
+from sqlalchemy.orm import load_only
 from app.models import MinutesHistory
+from app.services import metrics
+from app.services.client_pool import get_pool_stats
+from app.services.job_queue import queue_counts
+from app.services.usage_report import usage_summary
+from app.services.history_query import count_histories, history_page
+from app.services.status_events import fetch_changes, parse_event_id, stream_available
 
 # Blueprintの作成
 bp = Blueprint('results', __name__)
 
+# 議事録一覧ページの1ページあたりの件数
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '50'))
+
+# 議事録一覧ページで表示するカラム
+_LIST_COLUMNS = (
+    MinutesHistory.id,
+    MinutesHistory.status,
+    MinutesHistory.notta_title,
+    MinutesHistory.generated_title,
+    MinutesHistory.received_at,
+    MinutesHistory.processed_at,
+    MinutesHistory.ai_provider,
+    MinutesHistory.ai_model,
+    MinutesHistory.notion_page_url,
+)
+
 @bp.route('/', methods=['GET'])
 def index():
-    """ホームページ (議事録一覧)の表示"""
-    # 議事録履歴の取得（最新順）
-    histories = MinutesHistory.query.order_by(MinutesHistory.received_at.desc()).all()
+    """ホームページ (議事録一覧)の表示
+
+    一覧はキーセットページネーションでサーバー側でページ分割し、テンプレートで表示する
+    カラムのみを読み込む（raw_data・error_message は詳細表示の際に個別に取得する）。
+    """
+    cursor = request.args.get('cursor')
+    status = request.args.get('status')
+    per_page = request.args.get('per_page', HISTORY_PAGE_SIZE, type=int)
+
+    query = MinutesHistory.query.options(load_only(*_LIST_COLUMNS))
+    if status:
+        query = query.filter(MinutesHistory.status == status)
+
+    try:
+        histories, next_cursor = history_page(query, cursor=cursor, per_page=per_page)
+    except ValueError:
+        # 不正なカーソルの場合は先頭ページを表示
+        cursor = None
+        histories, next_cursor = history_page(query, per_page=per_page)
     
-    # テンプレートにデータを渡す
-    return render_template('results.html', histories=histories)
+    # テンプレートにデータを渡す（stream_since 以降の変更はステータス配信で反映する。
+    # 配信を使用できない場合は /api/status のポーリングで処理中の行を更新する）
+    return render_template(
+        'results.html',
+        histories=histories,
+        status_filter=status,
+        is_first_page=not cursor,
+        next_cursor=next_cursor,
+        total=count_histories(status),
+        status_stream=stream_available(request.environ),
+        stream_since=datetime.utcnow().isoformat()
+    )
 
 @bp.route('/api/histories', methods=['GET'])
 def get_histories():
-    """議事録履歴をJSON形式で取得するAPI (フロントエンドからのAjaxリクエスト用)"""
+    """議事録履歴をJSON形式で取得するAPI (フロントエンドからのAjaxリクエスト用)
+
+    キーセットページネーションで取得する。次ページはレスポンスの next_cursor を
+    cursor パラメータに指定して取得する（最終ページでは next_cursor が null）。
+    total は一定時間キャッシュした件数のため、直近の受信が反映されていない場合がある。
+    """
     # クエリパラメータの取得
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = request.args.get('per_page', 10, type=int)
     status = request.args.get('status')
     
     # クエリの作成
-    query = MinutesHistory.query.order_by(MinutesHistory.received_at.desc())
+    query = MinutesHistory.query
     
     # ステータスでフィルタリング（指定がある場合）
     if status:
         query = query.filter(MinutesHistory.status == status)
     
     # ページネーション
-    total = query.count()
-    histories = query.limit(per_page).offset((page - 1) * per_page).all()
+    try:
+        histories, next_cursor = history_page(query, cursor=cursor, per_page=per_page)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    total = count_histories(status)
     
     # 結果をJSON形式で返す
     return jsonify({
         "total": total,
-        "page": page,
         "per_page": per_page,
-        "total_pages": (total + per_page - 1) // per_page,
+        "next_cursor": next_cursor,
         "data": [history.to_dict() for history in histories]
     })
 
@@ -50,6 +108,26 @@ def get_history(history_id):
     history = MinutesHistory.query.get_or_404(history_id)
     return jsonify(history.to_dict())
 
+@bp.route('/api/history/<int:history_id>/usage', methods=['GET'])
+def get_history_usage(history_id):
+    """特定の議事録生成のトークン使用量・コストの内訳（呼び出しの種類・モデル別）を取得するAPI"""
+    history = MinutesHistory.query.get_or_404(history_id)
+    return jsonify({
+        "history_id": history.id,
+        "cost_usd": history.cost_usd,
+        "usage": [usage.to_dict() for usage in history.token_usage]
+    })
+
+@bp.route('/api/usage/summary', methods=['GET'])
+def get_usage_summary():
+    """トークン使用量・コストを日・プロバイダー・モデル別などに集計して取得するAPI
+
+    days パラメータで集計する日数（デフォルト: 30、最大: 366）、provider パラメータでプロバイダーを指定できる。
+    """
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    summary = usage_summary(days=days, ai_provider=request.args.get('provider') or None)
+    return jsonify(dict(summary, days=days))
+
 @bp.route('/api/status/<int:history_id>')
 def get_status(history_id):
     """履歴ステータスを取得するAPIエンドポイント"""
@@ -66,7 +144,51 @@ def get_status(history_id):
         "status": history.status,
         "notta_title": history.notta_title,
         "generated_title": history.generated_title,
+        "received_at": history.received_at.isoformat() if history.received_at else None,
         "processed_at": history.processed_at.isoformat() if history.processed_at else None,
         "notion_page_url": history.notion_page_url,
+        "ai_provider": history.ai_provider,
+        "ai_model": history.ai_model,
         "error_message": history.error_message
-    }) 
\ No newline at end of file
+    })
+
+@bp.route('/api/status/stream')
+def stream_status():
+    """履歴ステータスの変化を Server-Sent Events で配信するAPIエンドポイント
+
+    再接続時はブラウザが送る Last-Event-ID（初回は since パラメータ）以降の変更を先に送信する。
+    配信を使用できないサーバーでは 204 を返す（ブラウザは再接続しない）。
+    """
+    if not stream_available(request.environ):
+        return Response(status=204)
+
+    since = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    broadcaster = current_app.extensions['status_broadcaster']
+
+    # 取りこぼしを防ぐため、未配信分を取得する前に購読を開始する
+    subscription = broadcaster.subscribe()
+    try:
+        backlog = fetch_changes(since) if since else []
+    except Exception:
+        broadcaster.unsubscribe(subscription)
+        raise
+
+    return Response(
+        broadcaster.stream(subscription, backlog),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # リバースプロキシでのバッファリングを無効化
+        }
+    )
+
+@bp.route('/api/client-pool', methods=['GET'])
+def get_client_pool_stats():
+    """プロバイダー・Notionクライアントプールのヒット・ミス数を取得するAPI"""
+    return jsonify(get_pool_stats())
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """処理段階ごとの時間・キューの状態などのメトリクスをPrometheus形式で取得するAPI"""
+    metrics.set_queue_counts(queue_counts())
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -4,6 +4,7 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from app import db
 from app.models import Settings
+from app.services.settings_cache import bump_version, get_settings, invalidate
 
 # Blueprintの作成
 bp = Blueprint('settings', __name__, url_prefix='/settings')
@@ -12,11 +13,7 @@ bp = Blueprint('settings', __name__, url_prefix='/settings')
 def index():
     """設定ページの表示"""
     # 設定を取得 (なければ作成)
-    settings = Settings.query.first()
-    if not settings:
-        settings = Settings()
-        db.session.add(settings)
-        db.session.commit()
+    settings = get_settings()
     
     # テンプレートにデータを渡す
     return render_template('settings.html', settings=settings)
@@ -37,10 +34,19 @@ def update():
         settings.anthropic_claude_model = request.form.get('anthropic_claude_model', 'claude-3.7-sonnet')
         settings.anthropic_thinking_mode = bool(request.form.get('anthropic_thinking_mode', False))
         settings.openai_chatgpt_model = request.form.get('openai_chatgpt_model', 'gpt-4o')
+        settings.single_call_mode = bool(request.form.get('single_call_mode', False))
+        settings.streaming_mode = bool(request.form.get('streaming_mode', False))
+        settings.normalize_transcript = bool(request.form.get('normalize_transcript', False))
+        settings.dedupe_transcript = bool(request.form.get('dedupe_transcript', False))
+        settings.hedge_enabled = bool(request.form.get('hedge_enabled', False))
+        settings.hedge_provider = request.form.get('hedge_provider') or None
+        settings.hedge_percentile = min(max(request.form.get('hedge_percentile', 95, type=int), 50), 99)
         settings.notion_parent_page_id = request.form.get('notion_parent_page_id')
         
-        # データベースに保存
+        # データベースに保存（他のプロセスの設定キャッシュも更新されるよう version を増やす）
+        bump_version(settings)
         db.session.commit()
+        invalidate()
         
         # 保存成功のメッセージ
         flash('設定が正常に保存されました', 'success')
@@ -2,19 +2,38 @@
 # -*- coding: utf-8 -*-
 
 import json
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
 from app import db
-from app.models import MinutesHistory, Settings
-from app.services.ai_service import generate_minutes
-from app.services.notion_service import create_notion_page
+from app.models import MinutesHistory, TokenUsage
+from app.services.ai_service import agenerate_minutes, generate_minutes, stream_minutes
+from app.services.job_queue import enqueue, notify_workers
+from app.services import stage_timing, transcript_store
+from app.services.pricing import calculate_cost
+from app.services.settings_cache import get_settings
+from app.services.transcript_normalizer import normalize_or_keep as normalize_transcript
+from app.services.notion_service import (
+    StreamingPagePublisher, apublish_page, build_content_blocks, build_metadata_blocks, format_page_id, publish_page
+)
 import os
-from notion_client import Client
+from app.services.client_pool import get_async_notion_client, get_notion_client
 
 # Blueprintの作成
 bp = Blueprint('webhook', __name__, url_prefix='/webhook')
 
+# リクエストの本文の最大バイト数（超える場合は413を返す）
+WEBHOOK_MAX_BODY_BYTES = int(os.environ.get('WEBHOOK_MAX_BODY_BYTES', str(32 * 1024 * 1024)))
+WEBHOOK_BATCH_MAX_BODY_BYTES = int(os.environ.get('WEBHOOK_BATCH_MAX_BODY_BYTES', str(256 * 1024 * 1024)))
+# 一括登録で1回のリクエストに含められる最大件数
+WEBHOOK_BATCH_MAX_ITEMS = int(os.environ.get('WEBHOOK_BATCH_MAX_ITEMS', '1000'))
+# 登録済みの重複判定用キーを1回のクエリで照会する件数
+BATCH_KEY_LOOKUP_SIZE = 500
+
 @bp.route('/notta', methods=['POST'])
 def notta_webhook():
     """Zapier経由でNottaからのWebhookを受け取るエンドポイント"""
@@ -26,22 +45,28 @@ def notta_webhook():
         current_app.logger.info(f"GOOGLE_API_KEY set: {'Yes' if os.environ.get('GOOGLE_API_KEY') else 'No'}")
         # 他の主要なキーも同様に追加可能
 
-        # リクエストデータのログ記録
-        current_app.logger.info(f"Webhook received: {request.data}")
+        # リクエストの本文の読み込み（文字起こし全文を含むため、ログには大きさのみ記録する）
+        try:
+            body = _read_body(WEBHOOK_MAX_BODY_BYTES)
+        except RequestEntityTooLarge:
+            return _too_large_response(WEBHOOK_MAX_BODY_BYTES)
+        current_app.logger.info(f"Webhook received: {len(body)} bytes")
         
-        # リクエストデータのJSONパース
-        data = request.json
+        # リクエストデータのJSONパース（本文は保存にも使うため、Flaskにはキャッシュさせない）
+        try:
+            data = json.loads(body) if body else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Invalid JSON: {str(e)}"}), 400
         if not data:
             return jsonify({"status": "error", "message": "No data received"}), 400
         
         # 必須フィールドの確認
-        required_fields = ["content", "title"]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    "status": "error", 
-                    "message": f"Missing required field: {field}"
-                }), 400
+        error_message = _validate_payload(data)
+        if error_message:
+            return jsonify({
+                "status": "error", 
+                "message": error_message
+            }), 400
         
         # 受信データの確認とログ記録（デバッグ用）
         current_app.logger.info(f"Received content length: {len(data.get('content', ''))}")
@@ -49,48 +74,318 @@ def notta_webhook():
         current_app.logger.info(f"Received creation_time: {data.get('creation_time', 'Not provided')}")
         current_app.logger.info(f"Received speakers: {data.get('speakers', 'Not provided (will be extracted from content if available)')}")
         
-        # Notta作成時間のパース (存在する場合、formatは "YYYY-MM-DD HH:MM:SS" を想定)
-        notta_creation_time = None
-        if "creation_time" in data and data["creation_time"]:
-            try:
-                # Unixタイムスタンプ文字列を整数に変換し、datetimeオブジェクトへ
-                timestamp = int(str(data["creation_time"])) # 文字列化してからintへ
-                notta_creation_time = datetime.fromtimestamp(timestamp)
-            except (ValueError, TypeError) as e:
-                current_app.logger.warning(f"Invalid creation_time format (input: '{data['creation_time']}', type: {type(data['creation_time'])}) - Error: {e}")
-                notta_creation_time = None # パース失敗時は None を設定
+        # Notta作成時間のパース
+        notta_creation_time = _parse_creation_time(data)
         current_app.logger.info(f"Parsed creation_time: {notta_creation_time}")
         
-        # 履歴レコードの作成
+        # 重複受信（Zapierの再送など）の場合は処理を開始せず元の履歴を返す
+        idempotency_key = make_idempotency_key(data, request.headers.get('Idempotency-Key'))
+        existing = MinutesHistory.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            current_app.logger.info(f"--- Duplicate delivery detected, returning history ID: {existing.id} ---")
+            return _duplicate_response(existing)
+        
+        # 履歴レコードの作成とキューへの投入（同一トランザクション）
         history = MinutesHistory(
             notta_title=data["title"],
             notta_creation_time=notta_creation_time,
-            raw_data=json.dumps(data),
+            idempotency_key=idempotency_key,
             status="pending"
         )
+        # 受信した本文をそのまま圧縮して保存する（再シリアライズしない）
+        history.set_raw_data(data, raw=body)
+        del body
         current_app.logger.info("--- Attempting to add history to session ---")
         db.session.add(history)
-        current_app.logger.info("--- Attempting to commit session (add history) ---")
-        db.session.commit()
-        current_app.logger.info(f"--- History record created with ID: {history.id} ---")
-        
-        # 非同期で議事録生成処理を開始（本来はCeleryなどのタスクキューを使うべき）
-        # ここでは簡易的に同期処理として実装
-        current_app.logger.info(f"--- Calling process_minutes_generation for history_id: {history.id} ---")
-        process_minutes_generation(history.id)
-        current_app.logger.info(f"--- process_minutes_generation finished for history_id: {history.id} ---")
+        try:
+            db.session.flush()
+            enqueue(history.id, commit=False)
+            current_app.logger.info("--- Attempting to commit session (add history and job) ---")
+            db.session.commit()
+        except IntegrityError:
+            # 同時に届いた重複リクエストが先に登録した場合
+            db.session.rollback()
+            existing = MinutesHistory.query.filter_by(idempotency_key=idempotency_key).first()
+            if not existing:
+                raise
+            current_app.logger.info(f"--- Concurrent duplicate delivery detected, returning history ID: {existing.id} ---")
+            return _duplicate_response(existing)
+        notify_workers()
+        current_app.logger.info(f"--- History record created and enqueued with ID: {history.id} ---")
         
+        # 議事録生成はワーカーが非同期に処理するため、ここでは受付完了のみを返す
         return jsonify({
-            "status": "success", 
+            "status": "accepted", 
             "message": "Webhook received successfully",
-            "history_id": history.id
-        }), 200
+            "history_id": history.id,
+            "status_url": url_for('results.get_status', history_id=history.id, _external=True)
+        }), 202
         
     except Exception as e:
         current_app.logger.error(f"Error processing webhook: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@bp.route('/notta/batch', methods=['POST'])
+def notta_webhook_batch():
+    """複数の文字起こしをまとめて受け付けるエンドポイント（過去分の一括登録用）
+    
+    JSON配列（または {"items": [...]}）、もしくはNDJSON（1行に1件のJSON、Content-Type: application/x-ndjson）で受け取る。
+    各項目は /webhook/notta と同じ形式で、重複判定用のキーは項目の idempotency_key で指定できる。
+    有効な項目の履歴とジョブは1回のトランザクションでまとめて登録し、項目ごとの結果を返す。
+    """
+    current_app.logger.info("--- Webhook /notta/batch endpoint START ---")
+    try:
+        items, parse_errors = _read_batch_items()
+    except RequestEntityTooLarge:
+        return _too_large_response(WEBHOOK_BATCH_MAX_BODY_BYTES)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if not items and not parse_errors:
+        return jsonify({"status": "error", "message": "No items received"}), 400
+    if len(items) + len(parse_errors) > WEBHOOK_BATCH_MAX_ITEMS:
+        return jsonify({
+            "status": "error",
+            "message": f"Too many items (max: {WEBHOOK_BATCH_MAX_ITEMS})"
+        }), 413
+    
+    try:
+        results = dict(parse_errors)
+        valid = []  # [(番号, データ, 元の本文, 重複判定用のキー)]
+        seen_keys = {}
+        for index, data, raw in items:
+            error_message = _validate_payload(data)
+            if error_message:
+                results[index] = {"index": index, "status": "error", "message": error_message}
+                continue
+            key = make_idempotency_key(data, data.get("idempotency_key"))
+            if key in seen_keys:
+                # 同じバッチ内の重複は最初の項目の結果を参照する
+                results[index] = {"index": index, "status": "duplicate", "duplicate_of": seen_keys[key]}
+                continue
+            seen_keys[key] = index
+            valid.append((index, data, raw, key))
+        
+        created = _insert_batch(valid, results)
+        if created:
+            notify_workers()
+        
+        # 同じバッチ内の重複に、参照先の履歴IDを設定する
+        for result in results.values():
+            if "duplicate_of" in result:
+                result["history_id"] = results[result.pop("duplicate_of")].get("history_id")
+        
+        ordered = [results[index] for index in sorted(results)]
+        summary = {status: sum(1 for result in ordered if result["status"] == status)
+                   for status in ("accepted", "duplicate", "error")}
+        current_app.logger.info(f"--- Batch webhook processed: {summary} ---")
+        return jsonify({
+            "status": "accepted" if summary["accepted"] else "no_items_accepted",
+            **summary,
+            "results": ordered
+        }), 202 if summary["accepted"] else 200
+    
+    except Exception as e:
+        current_app.logger.error(f"Error processing batch webhook: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _read_batch_items():
+    """一括登録のリクエストから項目を読み込む
+    
+    Returns:
+        tuple: ([(番号, データ, 元の本文)], {番号: エラーの結果}) 。NDJSONの場合は各行を元の本文として保存に使う。
+            解析に失敗した行はエラーの結果に含める
+        
+    Raises:
+        RequestEntityTooLarge: 本文が WEBHOOK_BATCH_MAX_BODY_BYTES を超える場合
+        ValueError: リクエスト全体の形式が不正な場合
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonl", "application/json-seq"):
+        if request.content_length is not None and request.content_length > WEBHOOK_BATCH_MAX_BODY_BYTES:
+            raise RequestEntityTooLarge()
+        # 1行ずつ読み込み、リクエスト全体をまとめて展開しない
+        items, errors = [], {}
+        index = 0
+        size = 0
+        for line in request.stream:
+            size += len(line)
+            if size > WEBHOOK_BATCH_MAX_BODY_BYTES:
+                raise RequestEntityTooLarge()
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append((index, json.loads(line), line))
+            except ValueError as e:
+                errors[index] = {"index": index, "status": "error", "message": f"Invalid JSON: {str(e)}"}
+            index += 1
+            if index > WEBHOOK_BATCH_MAX_ITEMS:
+                break
+        return items, errors
+    
+    body = _read_body(WEBHOOK_BATCH_MAX_BODY_BYTES)
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+    del body
+    if isinstance(data, dict):
+        data = data.get("items")
+    if not isinstance(data, list):
+        raise ValueError("Request body must be a JSON array, {\"items\": [...]}, or NDJSON")
+    return [(index, item, None) for index, item in enumerate(data)], {}
+
+
+def _read_body(max_bytes):
+    """リクエストの本文を読み込む（Flaskの request.data と異なり、リクエストにキャッシュしない）
+    
+    Raises:
+        RequestEntityTooLarge: 本文が max_bytes を超える場合
+    """
+    if request.content_length is not None:
+        if request.content_length > max_bytes:
+            raise RequestEntityTooLarge()
+        return request.get_data(cache=False)
+    # 長さが不明な場合（chunked）は上限まで読み込む
+    chunks = []
+    size = 0
+    while True:
+        chunk = request.stream.read(64 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise RequestEntityTooLarge()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _too_large_response(max_bytes):
+    return jsonify({
+        "status": "error",
+        "message": f"Request body too large (max: {max_bytes} bytes)"
+    }), 413
+
+
+def _insert_batch(valid, results):
+    """検証済みの項目の履歴とジョブを1回のトランザクションで登録し、項目ごとの結果を results に設定する
+    
+    Args:
+        valid (list): [(番号, データ, 元の本文, 重複判定用のキー)]
+        results (dict): 番号 -> 結果（この関数で追加する）
+        
+    Returns:
+        int: 登録した件数
+    """
+    for attempt in range(2):
+        # すでに登録されている項目（再送など）は登録せず、元の履歴を返す
+        existing = {}
+        keys = [key for _, _, _, key in valid]
+        for offset in range(0, len(keys), BATCH_KEY_LOOKUP_SIZE):
+            chunk = keys[offset:offset + BATCH_KEY_LOOKUP_SIZE]
+            for history in MinutesHistory.query.filter(MinutesHistory.idempotency_key.in_(chunk)):
+                existing[history.idempotency_key] = history
+        
+        histories = []
+        for index, data, raw, key in valid:
+            if key in existing:
+                history = existing[key]
+                results[index] = {
+                    "index": index, "status": "duplicate", "history_id": history.id,
+                    "processing_status": history.status
+                }
+                continue
+            history = MinutesHistory(
+                notta_title=data["title"],
+                notta_creation_time=_parse_creation_time(data),
+                idempotency_key=key,
+                status="pending"
+            )
+            history.set_raw_data(data, raw=raw)
+            histories.append((index, history))
+        
+        if not histories:
+            return 0
+        db.session.add_all([history for _, history in histories])
+        try:
+            db.session.flush()
+            for _, history in histories:
+                enqueue(history.id, commit=False)
+            current_app.logger.info(f"--- Attempting to commit session (add {len(histories)} histories and jobs) ---")
+            db.session.commit()
+        except IntegrityError:
+            # 同時に届いた重複リクエストが先に登録した場合は、重複を除いてやり直す
+            db.session.rollback()
+            if attempt:
+                raise
+            current_app.logger.info("--- Concurrent duplicate delivery detected in batch, retrying ---")
+            continue
+        
+        for index, history in histories:
+            results[index] = {
+                "index": index, "status": "accepted", "history_id": history.id,
+                "status_url": url_for('results.get_status', history_id=history.id, _external=True)
+            }
+        return len(histories)
+
+
+def _validate_payload(data):
+    """Webhookのデータを検証する（問題がなければNone、あればエラーメッセージを返す）"""
+    if not isinstance(data, dict):
+        return "Item must be a JSON object"
+    for field in ("content", "title"):
+        if field not in data:
+            return f"Missing required field: {field}"
+    return None
+
+
+def _parse_creation_time(data):
+    """Notta作成時間（Unixタイムスタンプ）をdatetimeに変換する（ない場合・不正な場合はNone）"""
+    if not data.get("creation_time"):
+        return None
+    try:
+        # Unixタイムスタンプ文字列を整数に変換し、datetimeオブジェクトへ
+        timestamp = int(str(data["creation_time"])) # 文字列化してからintへ
+        return datetime.fromtimestamp(timestamp)
+    except (ValueError, TypeError, OverflowError, OSError) as e:
+        current_app.logger.warning(f"Invalid creation_time format (input: '{data['creation_time']}', type: {type(data['creation_time'])}) - Error: {e}")
+        return None
+
+
+def make_idempotency_key(data, header_key=None):
+    """Webhookの重複受信を判定するためのキーを作成する
+    
+    Args:
+        data (dict): Webhookで受信したデータ
+        header_key (str, optional): Idempotency-Key ヘッダーの値
+        
+    Returns:
+        str: 64文字の16進ハッシュ
+    """
+    if header_key:
+        return hashlib.sha256(f"header:{header_key}".encode('utf-8')).hexdigest()
+    
+    # ヘッダーがない場合はタイトル・作成時間・内容のハッシュから算出する
+    content_digest = hashlib.sha256()
+    transcript_store.update_digest(content_digest, str(data.get("content", "")))
+    content_hash = content_digest.hexdigest()
+    source = "\0".join([str(data.get("title", "")), str(data.get("creation_time", "")), content_hash])
+    return hashlib.sha256(f"derived:{source}".encode('utf-8')).hexdigest()
+
+
+def _duplicate_response(history):
+    """重複受信時のレスポンスを作成する（元の履歴IDと現在の状態を返す）"""
+    return jsonify({
+        "status": "duplicate",
+        "message": "Webhook already received",
+        "history_id": history.id,
+        "processing_status": history.status,
+        "status_url": url_for('results.get_status', history_id=history.id, _external=True)
+    }), 200
+
+
 def process_minutes_generation(history_id):
     """議事録生成処理を実行する
     
@@ -99,219 +394,412 @@ def process_minutes_generation(history_id):
     """
     current_app.logger.info(f"--- process_minutes_generation START for history_id: {history_id} ---")
     try:
+        job = _begin_processing(history_id)
+        if job is None:
+            return
+        history = job["history"]
+        settings = job["settings"]
+        raw_data = job["raw_data"]
+        
+        if settings.streaming_mode and settings.notion_parent_page_id:
+            # ストリーミングで生成しながら段落ごとにNotionへ書き込む
+            ai_response, notion_response = _generate_and_publish_streaming(
+                job["notta_title"], settings, raw_data, job["ai_provider"], job["ai_model"], job["thinking_mode"]
+            )
+        else:
+            # AIを使って議事録を生成
+            ai_response = generate_minutes(
+                raw_data.get("content", ""),
+                raw_data.get("title", ""),
+                raw_data.get("creation_time", ""),
+                raw_data.get("speakers", []),  # speakersがない場合は空リストを渡す
+                job["ai_provider"],
+                job["ai_model"],
+                anthropic_thinking_mode=job["thinking_mode"],
+                single_call=bool(settings.single_call_mode),
+                hedge_provider=job["hedge_provider"],
+                hedge_model=job["hedge_model"],
+                hedge_percentile=settings.hedge_percentile or 95
+            )
+            
+            if not ai_response or not ai_response.get("minutes_content"):
+                raise Exception("議事録生成に失敗しました")
+            
+            # Notionページの作成
+            generated_title = ai_response.get("generated_title") or job["notta_title"]
+            notion_response = _publish_to_notion(history, settings, generated_title, ai_response["minutes_content"])
+        
+        _finish_processing(job, ai_response, notion_response)
+        
+    except Exception as e:
+        _record_failure(history_id, e)
+
+
+async def aprocess_minutes_generation(history_id):
+    """議事録生成処理を実行する（非同期版）
+    
+    LLM・Notionの呼び出しはイベントループ上で行い、データベースの読み書きはスレッドで実行する。
+    ストリーミングモードの場合は同期版の処理をスレッドで実行する。
+    
+    Args:
+        history_id (int): 処理する履歴レコードのID
+    """
+    current_app.logger.info(f"--- aprocess_minutes_generation START for history_id: {history_id} ---")
+    try:
+        job = await asyncio.to_thread(_begin_processing, history_id)
+        if job is None:
+            return
+        settings = job["settings"]
+        raw_data = job["raw_data"]
+        
+        if settings.streaming_mode and settings.notion_parent_page_id:
+            ai_response, notion_response = await asyncio.to_thread(
+                _generate_and_publish_streaming,
+                job["notta_title"], settings, raw_data, job["ai_provider"], job["ai_model"], job["thinking_mode"]
+            )
+        else:
+            ai_response = await agenerate_minutes(
+                raw_data.get("content", ""),
+                raw_data.get("title", ""),
+                raw_data.get("creation_time", ""),
+                raw_data.get("speakers", []),
+                job["ai_provider"],
+                job["ai_model"],
+                anthropic_thinking_mode=job["thinking_mode"],
+                single_call=bool(settings.single_call_mode),
+                hedge_provider=job["hedge_provider"],
+                hedge_model=job["hedge_model"],
+                hedge_percentile=settings.hedge_percentile or 95
+            )
+            
+            if not ai_response or not ai_response.get("minutes_content"):
+                raise Exception("議事録生成に失敗しました")
+            
+            generated_title = ai_response.get("generated_title") or job["notta_title"]
+            notion_response = await _apublish_to_notion(job, generated_title, ai_response["minutes_content"])
+        
+        await asyncio.to_thread(_finish_processing, job, ai_response, notion_response)
+        
+    except Exception as e:
+        await asyncio.to_thread(_record_failure, history_id, e)
+
+
+def _begin_processing(history_id):
+    """履歴を処理中に更新し、議事録生成に必要な情報を取得する
+    
+    Returns:
+        dict: history, settings, raw_data, notta_title, ai_provider, ai_model, thinking_mode
+            （履歴が見つからない、または設定がない場合はNone）
+    """
+    with stage_timing.span("db.begin"):
         # 履歴レコードの取得
         current_app.logger.info(f"--- Querying MinutesHistory for id: {history_id} ---")
         history = MinutesHistory.query.get(history_id)
         current_app.logger.info(f"--- Found history record: {'Yes' if history else 'No'} ---")
         if not history:
             current_app.logger.error(f"History record not found: {history_id}")
-            return
+            return None
         
         # 処理中に更新
         history.status = "processing"
         current_app.logger.info("--- Attempting to commit session (update status to processing) ---")
         db.session.commit()
         current_app.logger.info("--- Status updated to processing ---")
-        
-        # 設定の取得
-        current_app.logger.info("--- Querying Settings ---")
-        settings = Settings.query.first()
-        current_app.logger.info(f"--- Found settings record: {'Yes' if settings else 'No'} ---")
-        if not settings:
-            current_app.logger.error("Settings not found")
+    
+    # 設定の取得
+    current_app.logger.info("--- Querying Settings ---")
+    settings = get_settings()
+    current_app.logger.info(f"--- Found settings record: {'Yes' if settings else 'No'} ---")
+    if not settings:
+        current_app.logger.error("Settings not found")
+        history.status = "failed"
+        history.error_message = "設定が見つかりません"
+        db.session.commit()
+        return None
+    
+    # AIプロバイダーと使用モデルの設定
+    ai_provider = settings.ai_provider
+    ai_model = _provider_model(settings, ai_provider)
+    
+    # ヘッジ先（副プロバイダー）の設定
+    hedge_provider = settings.hedge_provider if settings.hedge_enabled else None
+    if hedge_provider == ai_provider:
+        hedge_provider = None
+    hedge_model = _provider_model(settings, hedge_provider) if hedge_provider else None
+    
+    # AI設定をログに記録
+    current_app.logger.info(f"Using AI provider: {ai_provider}, model: {ai_model}")
+    if hedge_provider:
+        current_app.logger.info(f"Hedge provider: {hedge_provider}, model: {hedge_model}")
+    
+    # 保存されたデータの取得
+    with stage_timing.span("db.load_transcript"):
+        raw_data = history.get_raw_data_dict()
+    
+    # 文字起こしの正規化（フィラー・タイムスタンプの削除など）。削減量は履歴に記録する
+    content = raw_data.get("content") or ""
+    history.transcript_chars = len(content)
+    if settings.normalize_transcript:
+        with stage_timing.span("transcript.normalize"):
+            content, normalized = normalize_transcript(
+                content, raw_data.get("speakers"), dedupe=bool(settings.dedupe_transcript)
+            )
+        if not normalized:
+            current_app.logger.warning(
+                f"Transcript became empty after normalization; using the original ({history.transcript_chars} chars)"
+            )
+        raw_data["content"] = content
+    history.normalized_chars = len(content)
+    if history.transcript_chars:
+        reduction = 100 * (1 - history.normalized_chars / history.transcript_chars)
+        current_app.logger.info(
+            f"Transcript normalized: {history.transcript_chars} -> {history.normalized_chars} chars ({reduction:.1f}% reduction)"
+        )
+    
+    notta_title = history.notta_title
+    # LLMの呼び出し（レート制限による送信待ちを含む）の間に接続を保持しないよう、
+    # ここでトランザクションを終了して接続をプールに返す
+    db.session.commit()
+    
+    return {
+        "history": history,
+        "settings": settings,
+        "raw_data": raw_data,
+        "notta_title": notta_title,
+        "ai_provider": ai_provider,
+        "ai_model": ai_model,
+        "hedge_provider": hedge_provider,
+        "hedge_model": hedge_model,
+        "thinking_mode": settings.anthropic_thinking_mode if ai_provider == "anthropic_claude" else False
+    }
+
+
+def _provider_model(settings, ai_provider):
+    """設定からプロバイダーで使用するモデル名を取得する"""
+    if ai_provider == "google_gemini":
+        return settings.google_gemini_model
+    elif ai_provider == "anthropic_claude":
+        return settings.anthropic_claude_model
+    elif ai_provider == "openai_chatgpt":
+        return settings.openai_chatgpt_model
+    return None
+
+
+def _finish_processing(job, ai_response, notion_response):
+    """生成結果を履歴に保存して完了にする"""
+    history = job["history"]
+    
+    # 履歴の更新（ヘッジした場合は採用した結果のプロバイダー・モデルを保存する）
+    hedge = ai_response.get("hedge") or {}
+    history.processed_at = datetime.utcnow()
+    history.ai_provider = hedge.get("ai_provider") or job["ai_provider"]
+    history.ai_model = hedge.get("ai_model") or job["ai_model"]
+    history.hedge_provider = hedge.get("hedge_provider")
+    history.hedge_model = hedge.get("hedge_model")
+    history.hedge_triggered = bool(hedge.get("hedge_triggered"))
+    history.hedge_won = bool(hedge.get("hedge_won"))
+    history.primary_latency_ms = _to_ms(hedge.get("primary_latency"))
+    history.hedge_latency_ms = _to_ms(hedge.get("hedge_latency"))
+    
+    # トークン使用量とプロンプトキャッシュの利用状況（生成キャッシュにヒットした場合はなし）
+    usage = ai_response.get("usage") or {}
+    history.input_tokens = usage.get("input_tokens")
+    history.cached_input_tokens = usage.get("cached_input_tokens")
+    history.cache_write_tokens = usage.get("cache_write_tokens")
+    history.output_tokens = usage.get("output_tokens")
+    history.first_token_ms = _to_ms(usage.get("first_token_seconds"))
+    history.cost_usd = _record_token_usage(history, usage)
+    if usage.get("input_tokens"):
+        current_app.logger.info(
+            f"Token usage: input={usage['input_tokens']} (cached={usage['cached_input_tokens']}), "
+            f"output={usage['output_tokens']}, first_token_ms={history.first_token_ms}, cost_usd={history.cost_usd}"
+        )
+    history.generated_title = ai_response.get("generated_title") or job["notta_title"]
+    history.notion_page_url = notion_response["url"] if notion_response else None
+    history.cache_hit = bool(ai_response.get("cache_hit"))
+    history.notion_api_calls = notion_response["api_calls"] if notion_response else 0
+    history.status = "completed"
+    with stage_timing.span("db.finish"):
+        db.session.commit()
+    
+    current_app.logger.info(f"Minutes generation completed for history_id: {history.id}")
+
+
+def _record_token_usage(history, usage):
+    """呼び出しの種類・モデルごとのトークン使用量とコストを履歴に追加する
+    
+    Returns:
+        float: コストの合計（米ドル）。料金のわかるモデルの呼び出しがない場合はNone
+    """
+    total_cost = None
+    for entry in usage.get("models") or []:
+        cost = calculate_cost(
+            entry["ai_model"], entry["input_tokens"], entry["cached_input_tokens"],
+            entry["cache_write_tokens"], entry["output_tokens"]
+        )
+        history.token_usage.append(TokenUsage(
+            ai_provider=entry["ai_provider"],
+            ai_model=entry["ai_model"],
+            stage=entry["stage"],
+            calls=entry["calls"],
+            input_tokens=entry["input_tokens"],
+            cached_input_tokens=entry["cached_input_tokens"],
+            cache_write_tokens=entry["cache_write_tokens"],
+            output_tokens=entry["output_tokens"],
+            cost_usd=cost
+        ))
+        if cost is not None:
+            total_cost = (total_cost or 0.0) + cost
+    return total_cost
+
+
+def _to_ms(seconds):
+    """秒をミリ秒の整数に変換する（Noneの場合はNone）"""
+    return int(seconds * 1000) if seconds is not None else None
+
+
+def _record_failure(history_id, error):
+    """エラー情報を履歴に保存する"""
+    current_app.logger.error(f"Error in minutes generation (history_id: {history_id}): {str(error)}", exc_info=error)
+    
+    try:
+        db.session.rollback()
+        history = MinutesHistory.query.get(history_id)
+        if history:
             history.status = "failed"
-            history.error_message = "設定が見つかりません"
+            history.error_message = str(error)
             db.session.commit()
-            return
-        
-        # 保存されたデータの取得
-        raw_data = history.get_raw_data_dict()
+    except Exception as db_error:
+        current_app.logger.error(f"Error updating history record: {str(db_error)}")
+
+
+def _publish_to_notion(history, settings, generated_title, minutes_content):
+    """生成された議事録をNotionページとして作成する
+    
+    Returns:
+        dict: 作成されたNotionページの情報 (id, url, api_calls)。親ページIDが未設定の場合はNone
+    """
+    current_app.logger.info(f"Notion連携を開始します:")
+    current_app.logger.info(f"  タイトル: {generated_title}")
+    current_app.logger.info(f"  親ページID: {settings.notion_parent_page_id}")
+    
+    try:
+        # 親ページIDの処理
+        parent_id = settings.notion_parent_page_id
+        if not parent_id:
+            # 親ページIDがない場合
+            current_app.logger.warning("親ページIDが設定されていません。Notionページの作成をスキップします。")
+            return None
         
-        # AIプロバイダーと使用モデルの設定
-        ai_provider = settings.ai_provider
-        ai_model = None
+        # Notionクライアントの取得（直接APIキーを使用、接続プールを再利用）
+        notion = get_notion_client(os.environ.get("NOTION_API_KEY"))
         
-        if ai_provider == "google_gemini":
-            ai_model = settings.google_gemini_model
-        elif ai_provider == "anthropic_claude":
-            ai_model = settings.anthropic_claude_model
-        elif ai_provider == "openai_chatgpt":
-            ai_model = settings.openai_chatgpt_model
+        # IDの処理: テストスクリプトと同じ方法（ハイフンなし32文字はハイフン付きに変換）
+        page_id = format_page_id(parent_id)
+        current_app.logger.info(f"使用するページID: {page_id}")
         
-        # AI設定をログに記録
-        current_app.logger.info(f"Using AI provider: {ai_provider}, model: {ai_model}")
+        # メタデータと本文をできるだけ少ないAPI呼び出しでページとして作成
+        blocks = build_metadata_blocks(history.notta_title) + build_content_blocks(minutes_content)
+        notion_response = publish_page(
+            notion,
+            parent={"page_id": page_id},
+            properties={
+                "title": {
+                    "title": [{"text": {"content": generated_title}}]
+                }
+            },
+            blocks=blocks
+        )
+        current_app.logger.info(f"Notionページの作成が完了しました: {notion_response['url']} (API呼び出し回数: {notion_response['api_calls']})")
+        return notion_response
+            
+    except Exception as notion_error:
+        current_app.logger.error(f"Notionページ作成中にエラーが発生しました: {str(notion_error)}")
+        current_app.logger.error(f"エラーの種類: {type(notion_error).__name__}")
         
-        # AIを使って議事録を生成
-        ai_response = generate_minutes(
+        # エラー情報を履歴に記録して再スロー
+        history.status = "failed"
+        history.error_message = f"Notion連携エラー: {str(notion_error)}"
+        db.session.commit()
+        raise notion_error
+
+
+async def _apublish_to_notion(job, generated_title, minutes_content):
+    """生成された議事録をNotionページとして作成する（非同期版）
+    
+    Returns:
+        dict: 作成されたNotionページの情報 (id, url, api_calls)。親ページIDが未設定の場合はNone
+    """
+    parent_id = job["settings"].notion_parent_page_id
+    if not parent_id:
+        current_app.logger.warning("親ページIDが設定されていません。Notionページの作成をスキップします。")
+        return None
+    
+    try:
+        notion = get_async_notion_client(os.environ.get("NOTION_API_KEY"))
+        blocks = build_metadata_blocks(job["notta_title"]) + build_content_blocks(minutes_content)
+        notion_response = await apublish_page(
+            notion,
+            parent={"page_id": format_page_id(parent_id)},
+            properties={
+                "title": {
+                    "title": [{"text": {"content": generated_title}}]
+                }
+            },
+            blocks=blocks
+        )
+        current_app.logger.info(f"Notionページの作成が完了しました: {notion_response['url']} (API呼び出し回数: {notion_response['api_calls']})")
+        return notion_response
+    except Exception as notion_error:
+        current_app.logger.error(f"Notionページ作成中にエラーが発生しました ({type(notion_error).__name__}): {str(notion_error)}")
+        raise Exception(f"Notion連携エラー: {str(notion_error)}") from notion_error
+
+
+def _generate_and_publish_streaming(notta_title, settings, raw_data, ai_provider, ai_model, thinking_mode):
+    """議事録をストリーミングで生成し、完成した段落から順にNotionページへ書き込む
+    
+    Returns:
+        tuple: (生成結果のディクショナリ, 作成されたNotionページの情報)
+    """
+    notion = get_notion_client(os.environ.get("NOTION_API_KEY"))
+    publisher = StreamingPagePublisher(
+        notion,
+        parent={"page_id": format_page_id(settings.notion_parent_page_id)},
+        title=notta_title,
+        header_blocks=build_metadata_blocks(notta_title)
+    )
+    
+    ai_response = None
+    try:
+        for event in stream_minutes(
             raw_data.get("content", ""),
             raw_data.get("title", ""),
             raw_data.get("creation_time", ""),
-            raw_data.get("speakers", []),  # speakersがない場合は空リストを渡す
+            raw_data.get("speakers", []),
             ai_provider,
             ai_model,
-            anthropic_thinking_mode=settings.anthropic_thinking_mode if ai_provider == "anthropic_claude" else False
-        )
-        
-        if not ai_response or not ai_response.get("minutes_content"):
-            raise Exception("議事録生成に失敗しました")
-        
-        # 生成された議事録の内容とタイトルを取得
-        minutes_content = ai_response.get("minutes_content", "")
-        generated_title = ai_response.get("generated_title", history.notta_title)
-        
-        # Notionページの作成（テストで成功した処理方法を直接使用）
-        current_app.logger.info(f"Notion連携を開始します:")
-        current_app.logger.info(f"  タイトル: {generated_title}")
-        current_app.logger.info(f"  親ページID: {settings.notion_parent_page_id}")
-        
-        # テストで成功したコードをそのまま使用
-        try:
-            # Notionクライアントの初期化（直接APIキーを使用）
-            notion_api_key = os.environ.get("NOTION_API_KEY")
-            notion = Client(auth=notion_api_key)
-            current_app.logger.info(f"Notionクライアントを初期化しました")
-            
-            # 親ページIDの処理
-            parent_id = settings.notion_parent_page_id
-            if parent_id:
-                # IDの処理: テストスクリプトと同じ方法
-                if '-' not in parent_id and len(parent_id) == 32:
-                    formatted_id = f"{parent_id[0:8]}-{parent_id[8:12]}-{parent_id[12:16]}-{parent_id[16:20]}-{parent_id[20:32]}"
-                    page_id = formatted_id
-                else:
-                    page_id = parent_id
-                
-                current_app.logger.info(f"使用するページID: {page_id}")
-                
-                # ページのプロパティ定義
-                new_page = notion.pages.create(
-                    parent={"page_id": page_id},
-                    properties={
-                        "title": {
-                            "title": [{"text": {"content": generated_title}}]
-                        }
-                    },
-                    children=[
-                        {
-                            "object": "block",
-                            "type": "paragraph",
-                            "paragraph": {
-                                "rich_text": [
-                                    {
-                                        "type": "text",
-                                        "text": {"content": f"元の録音タイトル: {history.notta_title}"},
-                                        "annotations": {"bold": True}
-                                    }
-                                ]
-                            }
-                        },
-                        {
-                            "object": "block",
-                            "type": "paragraph",
-                            "paragraph": {
-                                "rich_text": [
-                                    {
-                                        "type": "text",
-                                        "text": {"content": f"生成日時: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}"}
-                                    }
-                                ]
-                            }
-                        },
-                        {
-                            "object": "block",
-                            "type": "divider",
-                            "divider": {}
-                        }
-                    ]
-                )
-                
-                # ページIDとURLを取得
-                page_id = new_page["id"]
-                page_url = new_page.get("url", "")
-                current_app.logger.info(f"Notionページを初期作成しました: {page_url}")
-                
-                # 議事録本文を追加
-                chunks = []
-                current_chunk = []
-                for line in minutes_content.split("\n"):
-                    block = {
-                        "object": "block",
-                        "type": "paragraph",
-                        "paragraph": {
-                            "rich_text": []
-                        }
-                    }
-                    
-                    if line.strip():
-                        block["paragraph"]["rich_text"] = [
-                            {
-                                "type": "text",
-                                "text": {"content": line}
-                            }
-                        ]
-                    
-                    current_chunk.append(block)
-                    
-                    # 100ブロックごとにチャンクを区切る
-                    if len(current_chunk) >= 100:
-                        chunks.append(current_chunk)
-                        current_chunk = []
-                
-                # 最後のチャンクがあれば追加
-                if current_chunk:
-                    chunks.append(current_chunk)
-                
-                # チャンクごとにページに本文を追加
-                for i, chunk in enumerate(chunks):
-                    current_app.logger.info(f"本文ブロック {i+1}/{len(chunks)} を追加中...")
-                    notion.blocks.children.append(
-                        block_id=page_id,
-                        children=chunk
-                    )
-                
-                # 結果を返す
-                notion_response = {
-                    "id": page_id,
-                    "url": page_url
-                }
-                notion_url = page_url
-                current_app.logger.info(f"Notionページの作成が完了しました: {notion_url}")
-            else:
-                # 親ページIDがない場合
-                current_app.logger.warning("親ページIDが設定されていません。Notionページの作成をスキップします。")
-                notion_response = None
-                notion_url = None
-                
-        except Exception as notion_error:
-            current_app.logger.error(f"Notionページ作成中にエラーが発生しました: {str(notion_error)}")
-            current_app.logger.error(f"エラーの種類: {type(notion_error).__name__}")
-            
-            # エラー情報を履歴に記録して再スロー
-            history.status = "failed"
-            history.error_message = f"Notion連携エラー: {str(notion_error)}"
-            db.session.commit()
-            raise notion_error
-        
-        # 履歴の更新
-        history.processed_at = datetime.utcnow()
-        history.ai_provider = ai_provider
-        history.ai_model = ai_model
-        history.generated_title = generated_title
-        history.notion_page_url = notion_url
-        history.status = "completed"
-        db.session.commit()
-        
-        current_app.logger.info(f"Minutes generation completed for history_id: {history_id}")
-        
-    except Exception as e:
-        current_app.logger.error(f"Error in minutes generation (history_id: {history_id}): {str(e)}", exc_info=True)
-        
-        # エラー情報を保存
-        try:
-            history = MinutesHistory.query.get(history_id)
-            if history:
-                history.status = "failed"
-                history.error_message = str(e)
-                db.session.commit()
-        except Exception as db_error:
-            current_app.logger.error(f"Error updating history record: {str(db_error)}") 
\ No newline at end of file
+            anthropic_thinking_mode=thinking_mode
+        ):
+            if event["type"] == "title":
+                publisher.set_title(event["title"])
+            elif event["type"] == "paragraph":
+                publisher.add_paragraph(event["text"])
+            elif event["type"] == "done":
+                ai_response = event
+                publisher.set_title(event.get("generated_title"))
+    except Exception:
+        # 途中まで書き込んだページがあれば、生成が中断されたことを追記する
+        if publisher.page_id:
+            try:
+                publisher.add_paragraph("（議事録の生成中にエラーが発生したため、内容は途中までです）")
+                publisher.finish()
+            except Exception as notion_error:
+                current_app.logger.error(f"中断メッセージの書き込みに失敗しました: {str(notion_error)}")
+        raise
+    
+    if not ai_response or not ai_response.get("minutes_content"):
+        raise Exception("議事録生成に失敗しました")
+    
+    notion_response = publisher.finish()
+    current_app.logger.info(f"Notionページの作成が完了しました: {notion_response['url']} (API呼び出し回数: {notion_response['api_calls']})")
+    return ai_response, notion_response
@@ -2,28 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
+import time
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
-import google.generativeai as genai
-import anthropic
-import openai
+from app.services.async_engine import iterate_sync, run_sync
+from app.services.client_pool import GEMINI_API_ENDPOINT, get_anthropic_client, get_openai_client
+from app.services import generation_cache, hedging, llm_usage, prompt_cache, rate_limiter, stage_timing, transcript_store
 
 # 環境変数から各APIキーを取得
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
-# Google Geminiの初期化
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-
-# OpenAIの初期化
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
-
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
+# 議事録生成の最大出力トークン数
+MINUTES_MAX_TOKENS = int(os.environ.get('MINUTES_MAX_TOKENS', '4000'))
+
+# 長時間会議向けの分割要約（map-reduce）設定
+# 推定入力トークン数がしきい値を超えた場合、文字起こしを分割して並列に要約してから議事録を生成する
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.environ.get('MAP_REDUCE_THRESHOLD_TOKENS', '60000'))
+MAP_CHUNK_TOKENS = int(os.environ.get('MAP_CHUNK_TOKENS', '12000'))
+MAP_MAX_TOKENS = int(os.environ.get('MAP_MAX_TOKENS', '2000'))
+MAP_CONCURRENCY = int(os.environ.get('MAP_CONCURRENCY', '4'))
+
 # 議事録生成用のシステムプロンプト
 MINUTES_SYSTEM_PROMPT = """
 # 目的
@@ -35,8 +41,48 @@ MINUTES_SYSTEM_PROMPT = """
 ・文量はコピペしたときにGoogleドキュメント5ページ分程度になるようにまとめ、コピペしてそのまま視覚的に見やすくなるような体裁で出力してください。
 """
 
-def generate_minutes(content, title, creation_time, speakers, ai_provider, ai_model, anthropic_thinking_mode=False):
-    """AIを使用して議事録を生成する
+# 分割要約（map）用のシステムプロンプト
+CHUNK_SUMMARY_SYSTEM_PROMPT = """
+# 目的
+長時間の会議の文字起こしの一部（区間）が渡されます。後で全区間をまとめて議事録を作成するための中間メモを作成してください。
+# 注意点
+・この区間で話された議題、決定事項、未決事項、数値や固有名詞、担当者と期限が明示されたタスクを漏れなく箇条書きで記載してください。
+・誰が発言したかが重要な内容は発言者名を残してください。
+・会話調ではなく事実ベースで簡潔に記載し、区間に含まれない内容を推測で補わないでください。
+"""
+
+# 議事録とタイトルを1回の呼び出しで生成する場合に追加する出力形式の指示
+COMBINED_OUTPUT_INSTRUCTION = """
+# 出力形式
+・1行目に「タイトル: 」に続けて、会議の内容を端的に表す日本語のタイトルを30文字以内で記載してください。
+・2行目には「---」のみを記載してください。
+・3行目以降に議事録本文を記載してください。
+"""
+
+# プロンプトのバージョン（プロンプトを変更すると生成キャッシュが自動的に無効になる）
+PROMPT_VERSION = hashlib.sha256(
+    (MINUTES_SYSTEM_PROMPT + CHUNK_SUMMARY_SYSTEM_PROMPT + COMBINED_OUTPUT_INSTRUCTION).encode('utf-8')
+).hexdigest()[:12]
+
+# 1回呼び出しの出力からタイトルと本文を分離するパターン
+_COMBINED_OUTPUT_PATTERN = re.compile(
+    r'\A\s*(?:[#*]+\s*)?(?:タイトル|Title)\s*[:：]\s*(?P<title>[^\n]+?)\s*(?:\*+)?\s*\n'
+    r'(?:\s*-{3,}\s*\n)?(?P<minutes>.*)\Z',
+    re.DOTALL | re.IGNORECASE
+)
+
+# ストリーミング出力の先頭からタイトル行（と区切り線）を取り出すパターン
+_COMBINED_HEADER_PATTERN = re.compile(
+    r'\A\s*(?:[#*]+\s*)?(?:タイトル|Title)\s*[:：]\s*(?P<title>[^\n]+?)\s*(?:\*+)?\s*\n(?:\s*-{3,}\s*\n)?',
+    re.IGNORECASE
+)
+
+# 分割要約を元に議事録を生成する際に文字起こしの代わりに渡す前置き
+REDUCE_CONTENT_PREFACE = "※以下は長時間の会議の文字起こしを時系列順に区間分割し、区間ごとに要点を抽出したメモです。全区間を統合して1つの議事録にまとめてください。\n"
+
+def generate_minutes(content, title, creation_time, speakers, ai_provider, ai_model, anthropic_thinking_mode=False, single_call=False,
+                     hedge_provider=None, hedge_model=None, hedge_percentile=95):
+    """AIを使用して議事録を生成する（agenerate_minutes を同期的に実行するラッパー）
     
     Args:
         content (str): 文字起こしの内容
@@ -46,11 +92,39 @@ def generate_minutes(content, title, creation_time, speakers, ai_provider, ai_mo
         ai_provider (str): 使用するAIプロバイダー (google_gemini, anthropic_claude, openai_chatgpt)
         ai_model (str): 使用するAIモデル名
         anthropic_thinking_mode (bool): Anthropic Claudeで思考モードを使用するかどうか
+        single_call (bool): 議事録とタイトルを1回の呼び出しで生成するかどうか
+            （出力の解析に失敗した場合はタイトルのみ別途生成する）
+        hedge_provider (str, optional): 主プロバイダーの応答が遅い場合に並行して使用する副プロバイダー
+        hedge_model (str, optional): 副プロバイダーで使用するモデル名
+        hedge_percentile (int): 副プロバイダーへの送信を開始する、主プロバイダーの直近の応答時間のパーセンタイル
         
     Returns:
         dict: 生成結果を含むディクショナリ
             - minutes_content: 生成された議事録内容
             - generated_title: 生成されたタイトル
+            - cache_hit: 生成キャッシュから取得した結果かどうか
+            - hedge: 使用したプロバイダー・ヘッジの有無・応答時間（hedging.run_hedged のヘッジ情報。キャッシュヒット時はなし）
+    """
+    return run_sync(agenerate_minutes(
+        content, title, creation_time, speakers, ai_provider, ai_model,
+        anthropic_thinking_mode=anthropic_thinking_mode, single_call=single_call,
+        hedge_provider=hedge_provider, hedge_model=hedge_model, hedge_percentile=hedge_percentile
+    ))
+
+
+async def agenerate_minutes(content, title, creation_time, speakers, ai_provider, ai_model, anthropic_thinking_mode=False, single_call=False,
+                            hedge_provider=None, hedge_model=None, hedge_percentile=95):
+    """AIを使用して議事録を生成する（非同期版）
+    
+    プロバイダーの応答を待つ間はイベントループを他のジョブに譲るため、
+    1つのワーカープロセスで多数の議事録を同時に生成できる。
+    生成キャッシュの読み書き（データベース）はスレッドで実行する。
+    
+    Args:
+        generate_minutes と同じ
+        
+    Returns:
+        dict: generate_minutes と同じ
     """
     # 入力データのログ記録
     logger.info(f"Generating minutes with {ai_provider}, model={ai_model}")
@@ -61,138 +135,326 @@ def generate_minutes(content, title, creation_time, speakers, ai_provider, ai_mo
     
     try:
         # 対象の日時情報を整形
-        formatted_date = ""
-        if creation_time:
-            try:
-                if isinstance(creation_time, datetime):
-                    dt = creation_time
-                else:
-                    # Unixタイムスタンプ形式 (数値文字列) か試す
-                    try:
-                        timestamp = int(creation_time)
-                        dt = datetime.fromtimestamp(timestamp)
-                    except ValueError:
-                        # 数値でなければ %Y-%m-%d %H:%M:%S 形式としてパースを試みる
-                        dt = datetime.strptime(creation_time, "%Y-%m-%d %H:%M:%S")
-                
-                # 日本語形式にフォーマット
-                formatted_date = dt.strftime("%Y年%m月%d日 %H:%M")
-            except (ValueError, TypeError) as e:
-                # パース失敗時のログを強化
-                logger.warning(f"日時のパースに失敗しました (入力値: '{creation_time}'): {str(e)}")
-                formatted_date = str(creation_time) # パース失敗時は元の値をそのまま使う
+        formatted_date = _format_creation_time(creation_time)
         
-        # AIプロバイダー別の処理
-        if ai_provider == "google_gemini":
-            return _generate_with_gemini(content, title, formatted_date, speakers, ai_model)
-        elif ai_provider == "anthropic_claude":
-            return _generate_with_claude(content, title, formatted_date, speakers, ai_model, anthropic_thinking_mode)
-        elif ai_provider == "openai_chatgpt":
-            return _generate_with_openai(content, title, formatted_date, speakers, ai_model)
-        else:
-            raise ValueError(f"不明なAIプロバイダー: {ai_provider}")
+        # 同じ入力・生成条件の結果がキャッシュにあればプロバイダーを呼ばずに返す
+        cache_key = generation_cache.make_cache_key(
+            content, title, formatted_date, speakers, ai_provider, ai_model,
+            anthropic_thinking_mode, PROMPT_VERSION
+        )
+        cached = await asyncio.to_thread(generation_cache.get_cached, cache_key)
+        if cached:
+            logger.info(f"生成キャッシュにヒットしました (key: {cache_key[:12]})")
+            cached["cache_hit"] = True
+            return cached
+        
+        # 区間ごとの要約で content を置き換えるため、キャッシュのキーに使う元の内容を保持する
+        content_key = content
+        
+        # プロバイダーのレスポンスからトークン使用量・プロンプトキャッシュの利用状況を集計する
+        with llm_usage.recording() as usage:
+            # 長い文字起こしは分割して並列に要約し、その要約を元に議事録を生成する
+            if _estimate_tokens(content) > MAP_REDUCE_THRESHOLD_TOKENS:
+                content = await _amap_transcript(content, title, formatted_date, speakers, ai_provider, ai_model)
+            
+            user_prompt = _build_user_prompt(content, title, formatted_date, speakers)
+            
+            def generate(provider, model):
+                return _agenerate_minutes_and_title(
+                    provider, model,
+                    _minutes_system_prompt(provider, anthropic_thinking_mode),
+                    user_prompt, title, formatted_date, single_call
+                )
+            
+            # 副プロバイダーが設定されていれば、主プロバイダーの応答が遅い場合に並行して生成する
+            # （ヘッジするのは最後の議事録・タイトルの生成のみで、区間ごとの要約は副プロバイダーでも再利用する）
+            secondary = None
+            if hedge_provider and hedge_model and hedge_provider != ai_provider:
+                secondary = (hedge_provider, hedge_model, lambda: generate(hedge_provider, hedge_model))
+            result, hedge_info = await hedging.run_hedged(
+                (ai_provider, ai_model, lambda: generate(ai_provider, ai_model)),
+                secondary, hedge_percentile, input_tokens=_estimate_tokens(user_prompt)
+            )
+        
+        if result.get("minutes_content"):
+            # 副プロバイダーの結果は、そのプロバイダー・モデルで生成した場合のキーで保存する
+            if hedge_info["hedge_won"]:
+                cache_key = generation_cache.make_cache_key(
+                    content_key, title, formatted_date, speakers, hedge_info["ai_provider"], hedge_info["ai_model"],
+                    anthropic_thinking_mode, PROMPT_VERSION
+                )
+            await asyncio.to_thread(
+                generation_cache.store, cache_key, result, hedge_info["ai_provider"], hedge_info["ai_model"]
+            )
+        result["cache_hit"] = False
+        result["hedge"] = hedge_info
+        result["usage"] = usage.to_dict()
+        return result
     
     except Exception as e:
-        logger.error(f"議事録生成中にエラーが発生しました: {str(e)}")
+        logger.error(f"議事録生成中にエラーが発生しました ({ai_provider}): {str(e)}")
         raise
 
 
-def _generate_with_gemini(content, title, formatted_date, speakers, model_name):
-    """Google Geminiを使用して議事録を生成する"""
-    try:
-        # Geminiモデルの取得
-        model = genai.GenerativeModel(model_name)
-        
-        # 話者情報の整形
-        speakers_text = ", ".join([speaker for speaker in speakers if speaker]) if speakers else "不明"
+def stream_minutes(content, title, creation_time, speakers, ai_provider, ai_model, anthropic_thinking_mode=False):
+    """ストリーミングで議事録を生成し、完成した段落から順に返す（astream_minutes の同期版）
+    
+    議事録とタイトルを1回の呼び出しで生成する形式（先頭行がタイトル）で出力させ、
+    空行で区切られた段落が完成するたびにイベントを返す。
+    
+    Args:
+        generate_minutes と同じ
         
-        # ユーザープロンプトの構築
-        user_prompt = f"""
-# 会議情報
-- タイトル: {title}
-- 日時: {formatted_date}
-- 参加者: {speakers_text}
+    Yields:
+        dict: 生成イベント
+            - {"type": "title", "title": str}: 出力の先頭からタイトルを抽出した時点
+            - {"type": "paragraph", "text": str}: 段落が完成した時点
+            - {"type": "done", "minutes_content": str, "generated_title": str, "cache_hit": bool}: 生成完了時
+    """
+    yield from iterate_sync(astream_minutes(
+        content, title, creation_time, speakers, ai_provider, ai_model,
+        anthropic_thinking_mode=anthropic_thinking_mode
+    ))
 
-# 文字起こし内容
-{content}
-"""
+
+async def astream_minutes(content, title, creation_time, speakers, ai_provider, ai_model, anthropic_thinking_mode=False):
+    """ストリーミングで議事録を生成し、完成した段落から順に返す（非同期版）
+    
+    Args:
+        generate_minutes と同じ
+        
+    Yields:
+        dict: stream_minutes と同じ生成イベント
+    """
+    logger.info(f"Streaming minutes with {ai_provider}, model={ai_model}")
+    logger.info(f"Content length: {len(content)} chars")
+    
+    formatted_date = _format_creation_time(creation_time)
+    
+    # キャッシュにヒットした場合は段落に分割してまとめて返す
+    cache_key = generation_cache.make_cache_key(
+        content, title, formatted_date, speakers, ai_provider, ai_model,
+        anthropic_thinking_mode, PROMPT_VERSION
+    )
+    cached = await asyncio.to_thread(generation_cache.get_cached, cache_key)
+    if cached:
+        logger.info(f"生成キャッシュにヒットしました (key: {cache_key[:12]})")
+        if cached.get("generated_title"):
+            yield {"type": "title", "title": cached["generated_title"]}
+        assembler = _ParagraphAssembler(expect_header=False)
+        for event in assembler.feed(cached["minutes_content"]) + assembler.close():
+            yield event
+        yield dict(cached, type="done", cache_hit=True)
+        return
+    
+    with llm_usage.recording() as usage:
+        # 長い文字起こしは分割して並列に要約し、その要約を元に議事録を生成する
+        if _estimate_tokens(content) > MAP_REDUCE_THRESHOLD_TOKENS:
+            content = await _amap_transcript(content, title, formatted_date, speakers, ai_provider, ai_model)
         
-        # 修正: システムプロンプトとユーザープロンプトを結合して渡す
-        full_prompt = f"{MINUTES_SYSTEM_PROMPT}\\n\\n{user_prompt}"
-        response = model.generate_content(full_prompt)
+        system_prompt = _minutes_system_prompt(ai_provider, anthropic_thinking_mode) + COMBINED_OUTPUT_INSTRUCTION
+        user_prompt = _build_user_prompt(content, title, formatted_date, speakers)
         
-        # 応答の処理
-        minutes_content = response.text if hasattr(response, 'text') else str(response)
+        assembler = _ParagraphAssembler()
+        deltas = rate_limiter.stream(
+            ai_provider, ai_model, _request_tokens(ai_provider, system_prompt, user_prompt, MINUTES_MAX_TOKENS),
+            lambda: _astream(ai_provider, ai_model, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS)
+        )
+        with stage_timing.span("llm.minutes_stream", ai_provider, ai_model), llm_usage.stage("llm.minutes_stream"):
+            async for delta in deltas:
+                for event in assembler.feed(delta):
+                    yield event
+        for event in assembler.close():
+            yield event
         
-        # タイトルの生成
-        title_prompt = f"""
-以下は会議の文字起こしから生成した議事録です。この議事録に適切なタイトルを30文字以内で考えてください。
-日本語で、会議の内容を端的に表すタイトルにしてください。タイトルのみを出力してください。
+        minutes_content = assembler.minutes_content
+        generated_title = assembler.title
+        if not generated_title:
+            # 先頭からタイトルを抽出できなかった場合はタイトルのみ別途生成する
+            logger.warning("ストリーミング出力からタイトルを抽出できなかったため、タイトルを別途生成します")
+            title_prompt = _build_title_prompt(minutes_content, title, formatted_date)
+            generated_title = await _acomplete(ai_provider, ai_model, None, title_prompt, max_tokens=50, stage="llm.title")
+    
+    result = {
+        "minutes_content": minutes_content,
+        "generated_title": _normalize_title(generated_title)
+    }
+    if result["minutes_content"]:
+        await asyncio.to_thread(generation_cache.store, cache_key, result, ai_provider, ai_model)
+    yield dict(result, type="done", cache_hit=False, usage=usage.to_dict())
 
-# 会議情報
-- 元のタイトル: {title}
-- 日時: {formatted_date}
 
-# 議事録
-{minutes_content[:500]}...
-"""
-        title_response = model.generate_content(title_prompt)
-        generated_title = title_response.text.strip() if hasattr(title_response, 'text') else str(title_response).strip()
+class _ParagraphAssembler:
+    """ストリーミング出力の断片を段落単位に組み立てる"""
+    
+    def __init__(self, expect_header=True):
+        """
+        Args:
+            expect_header (bool): 出力の先頭にタイトル行があることを想定するかどうか
+        """
+        self.title = None
+        self._header_resolved = not expect_header
+        self._buffer = ""
+        self._body = []
+    
+    @property
+    def minutes_content(self):
+        """タイトル行を除いた議事録本文"""
+        return "".join(self._body).lstrip("\n")
+    
+    def feed(self, delta):
+        """出力の断片を追加し、完成した段落のイベントを返す"""
+        self._buffer += delta
+        events = []
         
-        # 文字数制限（30文字）
-        if len(generated_title) > 30:
-            generated_title = generated_title[:30]
+        if not self._header_resolved:
+            # タイトル行と区切り線の2行が揃うまで判定を待つ
+            if self._buffer.lstrip().count("\n") < 2:
+                return events
+            events.extend(self._resolve_header())
         
-        return {
-            "minutes_content": minutes_content,
-            "generated_title": generated_title
-        }
+        while "\n\n" in self._buffer:
+            paragraph, self._buffer = self._buffer.split("\n\n", 1)
+            # タイトル行と区切り線の間に空行がある場合の区切り線は本文に含めない
+            if self.title and not self._body and re.fullmatch(r'\s*-{3,}\s*', paragraph):
+                continue
+            self._body.append(paragraph + "\n\n")
+            if paragraph.strip():
+                events.append({"type": "paragraph", "text": paragraph.strip("\n")})
+        return events
     
-    except Exception as e:
-        logger.error(f"Geminiでの議事録生成中にエラーが発生しました: {str(e)}")
-        raise
+    def close(self):
+        """出力の終了時に残りのテキストを段落として返す"""
+        events = []
+        if not self._header_resolved:
+            self._buffer += "\n"
+            events.extend(self._resolve_header())
+        if self._buffer.strip():
+            self._body.append(self._buffer.rstrip("\n"))
+            events.append({"type": "paragraph", "text": self._buffer.strip("\n")})
+        self._buffer = ""
+        return events
+    
+    def _resolve_header(self):
+        """バッファの先頭からタイトル行を取り出す"""
+        self._header_resolved = True
+        match = _COMBINED_HEADER_PATTERN.match(self._buffer)
+        if not match:
+            return []
+        self.title = _clean_title(match.group('title'))
+        self._buffer = self._buffer[match.end():]
+        return [{"type": "title", "title": self.title}] if self.title else []
 
 
-def _generate_with_claude(content, title, formatted_date, speakers, model_name, thinking_mode=False):
-    """Anthropic Claudeを使用して議事録を生成する"""
-    try:
-        # Anthropicクライアントの初期化
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-        
-        # 話者情報の整形
-        speakers_text = ", ".join([speaker for speaker in speakers if speaker]) if speakers else "不明"
-        
-        # ユーザープロンプトの構築
-        user_prompt = f"""
+async def _agenerate_minutes_and_title(ai_provider, model_name, system_prompt, user_prompt, title, formatted_date, single_call=False):
+    """議事録とタイトルを生成する（プロバイダー共通の処理）
+
+    Args:
+        ai_provider (str): 使用するAIプロバイダー
+        model_name (str): 使用するモデル名
+        system_prompt (str): 議事録生成用のシステムプロンプト
+        user_prompt (str): 議事録生成用のユーザープロンプト
+        title (str): 元のタイトル
+        formatted_date (str): 整形済みの日時
+        single_call (bool): 議事録とタイトルを1回の呼び出しで生成するかどうか
+
+    Returns:
+        dict: minutes_content と generated_title を含むディクショナリ
+    """
+    if single_call:
+        output = await _acomplete(ai_provider, model_name, system_prompt + COMBINED_OUTPUT_INSTRUCTION, user_prompt, MINUTES_MAX_TOKENS)
+        generated_title, minutes_content = _split_combined_output(output)
+        if generated_title:
+            return {
+                "minutes_content": minutes_content,
+                "generated_title": _normalize_title(generated_title)
+            }
+        # 解析に失敗した場合は出力全体を議事録として扱い、タイトルのみ別途生成する
+        logger.warning("1回呼び出しの出力からタイトルを抽出できなかったため、タイトルを別途生成します")
+    else:
+        minutes_content = await _acomplete(ai_provider, model_name, system_prompt, user_prompt, MINUTES_MAX_TOKENS)
+    
+    # タイトルの生成
+    title_prompt = _build_title_prompt(minutes_content, title, formatted_date)
+    generated_title = await _acomplete(ai_provider, model_name, None, title_prompt, 50, stage="llm.title")
+    
+    return {
+        "minutes_content": minutes_content,
+        "generated_title": _normalize_title(generated_title)
+    }
+
+
+def _split_combined_output(output):
+    """1回呼び出しの出力をタイトルと議事録本文に分離する
+
+    Returns:
+        tuple: (タイトル, 議事録本文)。タイトルを抽出できなかった場合は (None, 出力全体)
+    """
+    match = _COMBINED_OUTPUT_PATTERN.match(output or "")
+    if not match or not match.group('minutes').strip():
+        return None, output or ""
+    return _clean_title(match.group('title')), match.group('minutes').lstrip("\n")
+
+
+def _clean_title(raw_title):
+    """出力から抽出したタイトルの見出し・強調記号を除去する"""
+    generated_title = (raw_title or "").strip().strip('*"').strip()
+    return generated_title or None
+
+
+def _format_creation_time(creation_time):
+    """作成時間を日本語形式の日時文字列に整形する"""
+    formatted_date = ""
+    if creation_time:
+        try:
+            if isinstance(creation_time, datetime):
+                dt = creation_time
+            else:
+                # Unixタイムスタンプ形式 (数値文字列) か試す
+                try:
+                    timestamp = int(creation_time)
+                    dt = datetime.fromtimestamp(timestamp)
+                except ValueError:
+                    # 数値でなければ %Y-%m-%d %H:%M:%S 形式としてパースを試みる
+                    dt = datetime.strptime(creation_time, "%Y-%m-%d %H:%M:%S")
+            
+            # 日本語形式にフォーマット
+            formatted_date = dt.strftime("%Y年%m月%d日 %H:%M")
+        except (ValueError, TypeError) as e:
+            # パース失敗時のログを強化
+            logger.warning(f"日時のパースに失敗しました (入力値: '{creation_time}'): {str(e)}")
+            formatted_date = str(creation_time) # パース失敗時は元の値をそのまま使う
+    return formatted_date
+
+
+def _minutes_system_prompt(ai_provider, thinking_mode=False):
+    """議事録生成用のシステムプロンプトを取得する"""
+    system_prompt = MINUTES_SYSTEM_PROMPT
+    # システムプロンプトの拡張（Claudeの思考モードの場合）
+    if ai_provider == "anthropic_claude" and thinking_mode:
+        system_prompt += "\n\n思考プロセスを示すために、まず文字起こしを分析し、重要なポイントを抽出し、それから最終的な議事録を作成してください。"
+    return system_prompt
+
+
+def _build_user_prompt(content, title, formatted_date, speakers, preface=""):
+    """議事録生成用のユーザープロンプトを構築する（preface は文字起こしの前に付ける。中間の文字列を作らずに1回で組み立てる）"""
+    # 話者情報の整形
+    speakers_text = ", ".join([speaker for speaker in speakers if speaker]) if speakers else "不明"
+    
+    return f"""
 # 会議情報
 - タイトル: {title}
 - 日時: {formatted_date}
 - 参加者: {speakers_text}
 
 # 文字起こし内容
-{content}
+{preface}{content}
 """
-        
-        # システムプロンプトの拡張（思考モードの場合）
-        system_prompt = MINUTES_SYSTEM_PROMPT
-        if thinking_mode:
-            system_prompt += "\n\n思考プロセスを示すために、まず文字起こしを分析し、重要なポイントを抽出し、それから最終的な議事録を作成してください。"
-        
-        # Claudeに送信
-        response = client.messages.create(
-            model=model_name,
-            system=system_prompt,
-            max_tokens=4000,
-            messages=[
-                {"role": "user", "content": user_prompt}
-            ]
-        )
-        
-        # 応答の処理
-        minutes_content = response.content[0].text if hasattr(response, 'content') and response.content else ""
-        
-        # タイトルの生成
-        title_prompt = f"""
+
+
+def _build_title_prompt(minutes_content, title, formatted_date):
+    """タイトル生成用のプロンプトを構築する"""
+    return f"""
 以下は会議の文字起こしから生成した議事録です。この議事録に適切なタイトルを30文字以内で考えてください。
 日本語で、会議の内容を端的に表すタイトルにしてください。タイトルのみを出力してください。
 
@@ -203,92 +465,290 @@ def _generate_with_claude(content, title, formatted_date, speakers, model_name,
 # 議事録
 {minutes_content[:500]}...
 """
-        title_response = client.messages.create(
-            model=model_name,
-            max_tokens=50,
-            messages=[
-                {"role": "user", "content": title_prompt}
-            ]
-        )
-        
-        generated_title = title_response.content[0].text.strip() if hasattr(title_response, 'content') and title_response.content else ""
-        
-        # 文字数制限（30文字）
-        if len(generated_title) > 30:
-            generated_title = generated_title[:30]
-        
-        return {
-            "minutes_content": minutes_content,
-            "generated_title": generated_title
-        }
+
+
+def _normalize_title(generated_title):
+    """生成されたタイトルを整形する（文字数制限: 30文字）"""
+    generated_title = (generated_title or "").strip()
+    if len(generated_title) > 30:
+        generated_title = generated_title[:30]
+    return generated_title
+
+
+async def _acomplete(ai_provider, model_name, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS, stage="llm.minutes"):
+    """指定したプロバイダーで1回分のテキスト生成を行う（所要時間は stage の処理段階として記録する）
+
+    プロバイダーのレート制限の範囲で送信できるまで待ち、429の場合は再送する（rate_limiter）。
+    """
+    if ai_provider == "google_gemini":
+        complete = _acomplete_with_gemini
+    elif ai_provider == "anthropic_claude":
+        complete = _acomplete_with_claude
+    elif ai_provider == "openai_chatgpt":
+        complete = _acomplete_with_openai
+    else:
+        raise ValueError(f"不明なAIプロバイダー: {ai_provider}")
+
+    async def call():
+        # レート制限による送信待ちの後に呼ばれるため、ヘッジの応答時間には送信待ちを含めない
+        with stage_timing.span(stage, ai_provider, model_name), llm_usage.stage(stage), hedging.provider_call():
+            return await complete(model_name, system_prompt, user_prompt, max_tokens=max_tokens)
+
+    tokens = _request_tokens(ai_provider, system_prompt, user_prompt, max_tokens)
+    return await rate_limiter.run(ai_provider, model_name, tokens, call)
+
+
+def _request_tokens(ai_provider, system_prompt, user_prompt, max_tokens):
+    """レート制限の計算に使う推定トークン数"""
+    input_tokens = _estimate_tokens(system_prompt) + _estimate_tokens(user_prompt)
+    return rate_limiter.request_tokens(ai_provider, input_tokens, max_tokens)
+
+
+async def _acomplete_with_gemini(model_name, system_prompt, user_prompt, max_tokens=None):
+    """Google Geminiで1回分のテキスト生成を行う
+
+    Note:
+        Gemini 2.5系は思考トークンも出力上限に含めるため、max_tokens は指定せずモデルの既定値に任せる
+    """
+    # システムプロンプトは system_instruction（またはプロンプトキャッシュ）として渡す
+    model = await prompt_cache.gemini_model(GOOGLE_API_KEY, model_name, system_prompt)
+    started = time.monotonic()
+    if GEMINI_API_ENDPOINT:
+        # REST接続ではSDKの非同期クライアントが使えないため、同期版をスレッドで実行する
+        response = await asyncio.to_thread(model.generate_content, user_prompt)
+    else:
+        response = await model.generate_content_async(user_prompt)
+    llm_usage.record_first_token(time.monotonic() - started)
+    llm_usage.record("google_gemini", model_name, **llm_usage.from_gemini(getattr(response, "usage_metadata", None)))
     
-    except Exception as e:
-        logger.error(f"Claudeでの議事録生成中にエラーが発生しました: {str(e)}")
-        raise
+    return response.text if hasattr(response, 'text') else str(response)
 
 
-def _generate_with_openai(content, title, formatted_date, speakers, model_name):
-    """OpenAI GPTを使用して議事録を生成する"""
-    try:
-        # 話者情報の整形
-        speakers_text = ", ".join([speaker for speaker in speakers if speaker]) if speakers else "不明"
-        
-        # ユーザープロンプトの構築
-        user_prompt = f"""
-# 会議情報
-- タイトル: {title}
-- 日時: {formatted_date}
-- 参加者: {speakers_text}
+async def _acomplete_with_claude(model_name, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS):
+    """Anthropic Claudeで1回分のテキスト生成を行う"""
+    client = get_anthropic_client(ANTHROPIC_API_KEY)
+    
+    kwargs = {
+        "model": model_name,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": user_prompt}
+        ]
+    }
+    if system_prompt:
+        kwargs["system"] = prompt_cache.anthropic_system(system_prompt)
+    started = time.monotonic()
+    response = await client.messages.create(**kwargs)
+    llm_usage.record_first_token(time.monotonic() - started)
+    llm_usage.record("anthropic_claude", model_name, **llm_usage.from_anthropic(getattr(response, "usage", None)))
+    
+    return response.content[0].text if hasattr(response, 'content') and response.content else ""
 
-# 文字起こし内容
-{content}
-"""
-        
-        # OpenAIに送信
-        response = openai.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": MINUTES_SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=4000
-        )
-        
-        # 応答の処理
-        minutes_content = response.choices[0].message.content if response.choices else ""
-        
-        # タイトルの生成
-        title_prompt = f"""
-以下は会議の文字起こしから生成した議事録です。この議事録に適切なタイトルを30文字以内で考えてください。
-日本語で、会議の内容を端的に表すタイトルにしてください。タイトルのみを出力してください。
 
-# 会議情報
-- 元のタイトル: {title}
-- 日時: {formatted_date}
+async def _acomplete_with_openai(model_name, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS):
+    """OpenAI GPTで1回分のテキスト生成を行う（1024トークン以上の共通の先頭部分は自動的にキャッシュされる）"""
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+    
+    client = get_openai_client(OPENAI_API_KEY)
+    started = time.monotonic()
+    response = await client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        max_tokens=max_tokens
+    )
+    llm_usage.record_first_token(time.monotonic() - started)
+    llm_usage.record("openai_chatgpt", model_name, **llm_usage.from_openai(getattr(response, "usage", None)))
+    
+    return response.choices[0].message.content if response.choices else ""
 
-# 議事録
-{minutes_content[:500]}...
-"""
-        
-        title_response = openai.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "user", "content": title_prompt}
-            ],
-            max_tokens=50
-        )
-        
-        generated_title = title_response.choices[0].message.content.strip() if title_response.choices else ""
-        
-        # 文字数制限（30文字）
-        if len(generated_title) > 30:
-            generated_title = generated_title[:30]
-        
-        return {
-            "minutes_content": minutes_content,
-            "generated_title": generated_title
-        }
+
+def _astream(ai_provider, model_name, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS):
+    """指定したプロバイダーでストリーミング生成を行い、テキストの断片を返す非同期ジェネレーターを取得する"""
+    if ai_provider == "google_gemini":
+        return _astream_with_gemini(model_name, system_prompt, user_prompt, max_tokens=max_tokens)
+    elif ai_provider == "anthropic_claude":
+        return _astream_with_claude(model_name, system_prompt, user_prompt, max_tokens=max_tokens)
+    elif ai_provider == "openai_chatgpt":
+        return _astream_with_openai(model_name, system_prompt, user_prompt, max_tokens=max_tokens)
+    else:
+        raise ValueError(f"不明なAIプロバイダー: {ai_provider}")
+
+
+async def _astream_with_gemini(model_name, system_prompt, user_prompt, max_tokens=None):
+    """Google Geminiでストリーミング生成を行う"""
+    model = await prompt_cache.gemini_model(GOOGLE_API_KEY, model_name, system_prompt)
+    started = time.monotonic()
+    if GEMINI_API_ENDPOINT:
+        # REST接続ではSDKの非同期クライアントが使えないため、同期版をスレッドで実行する
+        response = _aiterate_in_thread(await asyncio.to_thread(model.generate_content, user_prompt, stream=True))
+    else:
+        response = await model.generate_content_async(user_prompt, stream=True)
+    usage_metadata = None
+    async for chunk in response:
+        # 使用量は最後のチャンクの値が全体の合計になる
+        usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+        try:
+            text = chunk.text
+        except ValueError:
+            # テキストを含まないチャンク（安全性評価のみ等）は読み飛ばす
+            continue
+        if text:
+            llm_usage.record_first_token(time.monotonic() - started)
+            yield text
+    llm_usage.record("google_gemini", model_name, **llm_usage.from_gemini(usage_metadata))
+
+
+async def _astream_with_claude(model_name, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS):
+    """Anthropic Claudeでストリーミング生成を行う"""
+    client = get_anthropic_client(ANTHROPIC_API_KEY)
+    kwargs = {
+        "model": model_name,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": user_prompt}
+        ],
+        "stream": True
+    }
+    if system_prompt:
+        kwargs["system"] = prompt_cache.anthropic_system(system_prompt)
+    started = time.monotonic()
+    usage = {}
+    async for event in await client.messages.create(**kwargs):
+        event_type = getattr(event, "type", None)
+        if event_type == "content_block_delta":
+            text = getattr(event.delta, "text", None)
+            if text:
+                llm_usage.record_first_token(time.monotonic() - started)
+                yield text
+        elif event_type == "message_start":
+            # 入力トークン数（キャッシュの読み書きを含む）は開始時、出力トークン数は終了時に通知される
+            usage = llm_usage.from_anthropic(getattr(event.message, "usage", None))
+        elif event_type == "message_delta" and getattr(event, "usage", None) is not None:
+            usage["output_tokens"] = getattr(event.usage, "output_tokens", None) or 0
+    llm_usage.record("anthropic_claude", model_name, **usage)
+
+
+async def _astream_with_openai(model_name, system_prompt, user_prompt, max_tokens=MINUTES_MAX_TOKENS):
+    """OpenAI GPTでストリーミング生成を行う"""
+    client = get_openai_client(OPENAI_API_KEY)
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+    started = time.monotonic()
+    stream = await client.chat.completions.create(
+        model=model_name, messages=messages, max_tokens=max_tokens, stream=True,
+        stream_options={"include_usage": True}
+    )
+    usage = None
+    async for chunk in stream:
+        # 使用量は choices が空の最後のチャンクで通知される
+        usage = getattr(chunk, "usage", None) or usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            llm_usage.record_first_token(time.monotonic() - started)
+            yield chunk.choices[0].delta.content
+    llm_usage.record("openai_chatgpt", model_name, **llm_usage.from_openai(usage))
+
+
+async def _aiterate_in_thread(iterable):
+    """同期イテレーターの各要素をスレッドで取得する非同期ジェネレーター"""
+    iterator = iter(iterable)
+    end = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, end)
+        if item is end:
+            return
+        yield item
+
+
+def _estimate_tokens(text):
+    """テキストのトークン数を概算する
+
+    日本語は概ね1文字1トークン、英数字は概ね4文字1トークンになるため、
+    UTF-8のバイト数を3で割った値を推定値として使う。
+    """
+    if not text:
+        return 0
+    return transcript_store.utf8_length(text) // 3
+
+
+# 話者の切り替わり（改行）と文末（。）での分割用パターン
+_TURN_PATTERN = re.compile(r'[^\n]*\n|[^\n]+')
+_SENTENCE_PATTERN = re.compile(r'[^。！？!?]*[。！？!?]|[^。！？!?]+')
+
+
+def _split_transcript(content, max_tokens=MAP_CHUNK_TOKENS):
+    """文字起こしをトークン数の上限に収まる区間に分割する
+
+    話者の切り替わり（行）単位でまとめ、1行が上限を超える場合は文（。）単位、
+    それでも超える場合は文字数で分割する。
+
+    Args:
+        content (str): 文字起こしの内容
+        max_tokens (int): 1区間あたりの推定トークン数の上限
+
+    Returns:
+        list: 分割された文字起こしのリスト
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    # 行・文の全体のリストは作らず、区間を順に組み立てる（文字起こしのコピーは区間のリストの1つだけにする）
+    for piece in _iter_transcript_pieces(content, max_tokens):
+        piece_tokens = _estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("".join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("".join(current))
     
-    except Exception as e:
-        logger.error(f"OpenAIでの議事録生成中にエラーが発生しました: {str(e)}")
-        raise 
\ No newline at end of file
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _iter_transcript_pieces(content, max_tokens):
+    """文字起こしを行単位（上限を超える行は文単位、さらに文字数）で順に返す"""
+    for match in _TURN_PATTERN.finditer(content):
+        turn = match.group()
+        if _estimate_tokens(turn) <= max_tokens:
+            yield turn
+            continue
+        for sentence_match in _SENTENCE_PATTERN.finditer(turn):
+            sentence = sentence_match.group()
+            if _estimate_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+            # 文が長すぎる場合は文字数で強制的に分割する（日本語1文字≒1トークン）
+            for i in range(0, len(sentence), max_tokens):
+                yield sentence[i:i + max_tokens]
+
+
+async def _amap_transcript(content, title, formatted_date, speakers, ai_provider, ai_model):
+    """長い文字起こしを区間ごとに並列で要約し、議事録生成用のメモにまとめる（map フェーズ）
+
+    Returns:
+        str: 区間ごとの要約を時系列順に結合したテキスト
+    """
+    chunks = _split_transcript(content, MAP_CHUNK_TOKENS)
+    logger.info(f"文字起こしを {len(chunks)} 区間に分割して要約します (並列数: {MAP_CONCURRENCY})")
+    semaphore = asyncio.Semaphore(max(1, MAP_CONCURRENCY))
+    
+    async def summarize(index, chunk):
+        async with semaphore:
+            # プロンプトは実行する直前に作成し、待機中の区間のプロンプトを保持しない
+            user_prompt = _build_user_prompt(
+                chunk, title, formatted_date, speakers, preface=f"（全{len(chunks)}区間中 第{index + 1}区間）\n"
+            )
+            return await _acomplete(
+                ai_provider, ai_model, CHUNK_SUMMARY_SYSTEM_PROMPT, user_prompt, max_tokens=MAP_MAX_TOKENS, stage="llm.chunk_summary"
+            )
+    
+    summaries = await asyncio.gather(*(summarize(i, chunk) for i, chunk in enumerate(chunks)))
+    
+    sections = [f"## 区間 {i + 1}/{len(chunks)}\n{summary.strip()}" for i, summary in enumerate(summaries)]
+    return REDUCE_CONTENT_PREFACE + "\n\n".join(sections)
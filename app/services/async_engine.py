@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+非同期処理の実行基盤
+
+プロセスごとに1つのイベントループを専用スレッドで動かし、LLM・Notionへの非同期呼び出しは
+すべてこのループ上で実行する（非同期クライアントの接続プールは作成したループに紐づくため）。
+同期コードからは run_sync() / iterate_sync() でコルーチン・非同期ジェネレーターを実行する。
+
+呼び出し元のコンテキスト変数（Flaskのアプリケーションコンテキストなど）はタスクに引き継がれ、
+タスク内の asyncio.to_thread() にもそのまま引き継がれる。
+"""
+
+import os
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# ループの asyncio.to_thread() で使うスレッド数。既定値（CPU数+4）ではCPU数の少ない環境で
+# 同期処理を待つジョブ（ストリーミング生成など）がスレッドを使い切り、処理が止まるため明示的に指定する
+ASYNC_ENGINE_THREADS = int(os.environ.get('ASYNC_ENGINE_THREADS', '64'))
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# iterate_sync() でジェネレーターの終了を表す値
+_END = object()
+
+
+def get_loop():
+    """処理用のイベントループを取得する（初回はループを動かすスレッドを起動する）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                max_workers=ASYNC_ENGINE_THREADS, thread_name_prefix="async-engine-worker"
+            ))
+            thread = threading.Thread(target=loop.run_forever, name="async-engine", daemon=True)
+            thread.start()
+            _loop = loop
+            logger.info("非同期処理用のイベントループを起動しました")
+        return _loop
+
+
+def submit(coro):
+    """コルーチンをイベントループ上のタスクとして実行する
+
+    Args:
+        coro (coroutine): 実行するコルーチン
+
+    Returns:
+        concurrent.futures.Future: 実行結果を受け取るFuture
+    """
+    loop = get_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+
+    def on_done(task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        if not future.set_running_or_notify_cancel():
+            coro.close()
+            return
+        # 呼び出し元のコンテキストの中でタスクを作成し、コンテキスト変数を引き継ぐ
+        task = context.run(loop.create_task, coro)
+        task.add_done_callback(on_done)
+
+    loop.call_soon_threadsafe(start)
+    return future
+
+
+def run_sync(coro, timeout=None):
+    """コルーチンをイベントループ上で実行し、完了まで待って結果を返す
+
+    Args:
+        coro (coroutine): 実行するコルーチン
+        timeout (float, optional): タイムアウト（秒）
+
+    Returns:
+        コルーチンの戻り値
+    """
+    if _in_loop_thread():
+        coro.close()
+        raise RuntimeError("イベントループのスレッドから run_sync() は呼び出せません（await を使用してください）")
+    return submit(coro).result(timeout)
+
+
+def iterate_sync(agen):
+    """非同期ジェネレーターをイベントループ上で実行し、同期ジェネレーターとして値を返す
+
+    Args:
+        agen (async generator): 実行する非同期ジェネレーター
+
+    Yields:
+        非同期ジェネレーターが返す値
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    async def pump():
+        try:
+            async for item in agen:
+                # 呼び出し側が途中で読むのをやめた場合は生成を中断する
+                if stop.is_set():
+                    break
+                items.put(item)
+        except Exception as e:
+            items.put(_Failure(e))
+        finally:
+            await agen.aclose()
+            items.put(_END)
+
+    submit(pump())
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+class _Failure:
+    """iterate_sync() で非同期ジェネレーターの例外を受け渡すための入れ物"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _in_loop_thread():
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
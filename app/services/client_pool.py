@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import logging
+import hashlib
+import inspect
+import importlib
+import threading
+import httpx
+from app.services.async_engine import run_sync
+from app.services import rate_limiter
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 接続プールの設定
+CLIENT_POOL_MAX_CONNECTIONS = int(os.environ.get('CLIENT_POOL_MAX_CONNECTIONS', '20'))
+CLIENT_POOL_MAX_KEEPALIVE = int(os.environ.get('CLIENT_POOL_MAX_KEEPALIVE', '10'))
+CLIENT_KEEPALIVE_EXPIRY = float(os.environ.get('CLIENT_KEEPALIVE_EXPIRY', '60'))
+
+# タイムアウト設定（秒）: LLMは長文生成に時間がかかるため読み取りタイムアウトを長めにする
+CLIENT_CONNECT_TIMEOUT = float(os.environ.get('CLIENT_CONNECT_TIMEOUT', '10'))
+LLM_READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT', '600'))
+NOTION_READ_TIMEOUT = float(os.environ.get('NOTION_READ_TIMEOUT', '60'))
+
+# APIの接続先（ローカルの代替サーバーで計測する場合など。未設定の場合は各サービスの既定の接続先）
+# Anthropic・OpenAIはSDKが ANTHROPIC_BASE_URL・OPENAI_BASE_URL を読み込む
+GEMINI_API_ENDPOINT = os.environ.get('GEMINI_API_ENDPOINT')  # 指定した場合はRESTで接続する
+NOTION_BASE_URL = os.environ.get('NOTION_BASE_URL')
+
+# プロバイダーSDKのレジストリ: 名前 -> モジュール名
+# SDKのインポートは重いため（合計で数秒）、起動時には読み込まず最初にクライアントを作成するときに読み込む
+SDK_MODULES = {
+    "anthropic": "anthropic",
+    "openai": "openai",
+    "genai": "google.generativeai",
+    "notion_client": "notion_client",
+}
+
+# LLMクライアントの応答フック: レート制限のヘッダー・429を流量制御に反映する
+_LLM_EVENT_HOOKS = {"response": [rate_limiter.observe_response]}
+
+# 読み込み済みのSDK: 名前 -> モジュール
+_sdks = {}
+_sdk_lock = threading.Lock()
+
+# クライアントのレジストリ: (プロバイダー, モデル, APIキー) -> クライアント
+_clients = {}
+_lock = threading.Lock()
+
+# プロバイダー別のヒット・ミス数
+_stats = {}
+
+# genai.configure() はプロセス全体の設定を変更するため、設定済みのAPIキーを記録する
+_gemini_configured_key = None
+
+
+def load_sdk(name):
+    """SDKを読み込む（初回のみインポートし、以降は読み込み済みのモジュールを返す）
+
+    Args:
+        name (str): SDK_MODULES のキー
+
+    Returns:
+        module: SDKのモジュール
+    """
+    module = _sdks.get(name)
+    if module is not None:
+        return module
+
+    with _sdk_lock:
+        module = _sdks.get(name)
+        if module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(SDK_MODULES[name])
+            _sdks[name] = module
+            logger.info(f"SDK {name} を読み込みました ({time.perf_counter() - start:.2f}秒)")
+    return module
+
+
+def loaded_sdks():
+    """読み込み済みのSDK名の一覧を取得する"""
+    return sorted(_sdks)
+
+
+def _build_http_client(read_timeout, sdk=None):
+    """キープアライブ付きの接続プールを持つHTTPクライアントを作成する
+
+    Args:
+        read_timeout (float): 読み取りタイムアウト（秒）
+        sdk (module, optional): SDKが独自のHTTPクライアントクラス (DefaultHttpxClient) を
+            提供している場合はそれを使う（SDKのバージョンによっては httpx.Client を受け付けないため）
+    """
+    client_class = getattr(sdk, "DefaultHttpxClient", None) or httpx.Client
+    return _create_http_client(client_class, read_timeout)
+
+
+def _build_async_http_client(read_timeout, sdk=None, event_hooks=None):
+    """非同期クライアント用の接続プールを持つHTTPクライアントを作成する（設定は _build_http_client と同じ）"""
+    client_class = getattr(sdk, "DefaultAsyncHttpxClient", None) or httpx.AsyncClient
+    return _create_http_client(client_class, read_timeout, event_hooks)
+
+
+def _create_http_client(client_class, read_timeout, event_hooks=None):
+    """HTTPクライアントを作成する
+
+    SDKのバージョンによってはクライアントが httpx 以外の互換パッケージ（httpx2 など）を基にしているため、
+    接続数の上限・タイムアウトはクライアントクラスと同じパッケージの型で指定する。
+    """
+    base_module = next(
+        (base.__module__ for base in client_class.__mro__ if base.__name__ in ("Client", "AsyncClient")),
+        client_class.__module__
+    )
+    http = sys.modules.get(base_module.split(".")[0], httpx)
+    return client_class(
+        limits=http.Limits(
+            max_connections=CLIENT_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=CLIENT_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=CLIENT_KEEPALIVE_EXPIRY
+        ),
+        timeout=http.Timeout(read_timeout, connect=CLIENT_CONNECT_TIMEOUT),
+        event_hooks=event_hooks
+    )
+
+
+def _get_or_create(provider, model, api_key, factory):
+    """レジストリからクライアントを取得し、なければ作成して登録する"""
+    key = (provider, model, api_key)
+    with _lock:
+        provider_stats = _stats.setdefault(provider, {"hits": 0, "misses": 0})
+        client = _clients.get(key)
+        if client is not None:
+            provider_stats["hits"] += 1
+            return client
+
+        provider_stats["misses"] += 1
+        logger.info(f"{provider} クライアントを作成します (model: {model})")
+        client = factory()
+        _clients[key] = client
+        return client
+
+
+def get_anthropic_client(api_key):
+    """Anthropic Claude用の非同期クライアントを取得する（async_engine のイベントループ上で使用する）"""
+    def factory():
+        anthropic = load_sdk("anthropic")
+        return anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=_build_async_http_client(LLM_READ_TIMEOUT, anthropic, _LLM_EVENT_HOOKS)
+        )
+
+    return _get_or_create("anthropic_claude", None, api_key, factory)
+
+
+def get_openai_client(api_key):
+    """OpenAI用の非同期クライアントを取得する（async_engine のイベントループ上で使用する）"""
+    def factory():
+        openai = load_sdk("openai")
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=_build_async_http_client(LLM_READ_TIMEOUT, openai, _LLM_EVENT_HOOKS)
+        )
+
+    return _get_or_create("openai_chatgpt", None, api_key, factory)
+
+
+def get_gemini_model(api_key, model_name, system_instruction=None):
+    """Google Gemini用のモデルを取得する
+
+    Gemini SDKはプロセス全体で1つの接続（gRPC チャネル）を共有するため、
+    APIキーの設定を一度だけ行い、モデルのインスタンスを再利用する。
+    （非同期の generate_content_async は async_engine のイベントループ上で使用する）
+    system_instruction を指定した場合は、モデル名とシステムプロンプトの組み合わせごとに再利用する。
+    """
+    def factory():
+        global _gemini_configured_key
+        genai = load_sdk("genai")
+        if api_key and api_key != _gemini_configured_key:
+            if GEMINI_API_ENDPOINT:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+            else:
+                genai.configure(api_key=api_key)
+            _gemini_configured_key = api_key
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+    registry_model = model_name
+    if system_instruction:
+        registry_model = f"{model_name}#{hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()[:12]}"
+    return _get_or_create("google_gemini", registry_model, api_key, factory)
+
+
+def get_notion_client(api_key):
+    """Notion用のクライアントを取得する"""
+    def factory():
+        notion_client = load_sdk("notion_client")
+        return notion_client.Client(
+            auth=api_key,
+            timeout_ms=int(NOTION_READ_TIMEOUT * 1000),
+            client=_build_http_client(NOTION_READ_TIMEOUT),
+            **_notion_options()
+        )
+
+    return _get_or_create("notion", None, api_key, factory)
+
+
+def get_async_notion_client(api_key):
+    """Notion用の非同期クライアントを取得する（async_engine のイベントループ上で使用する）"""
+    def factory():
+        notion_client = load_sdk("notion_client")
+        return notion_client.AsyncClient(
+            auth=api_key,
+            timeout_ms=int(NOTION_READ_TIMEOUT * 1000),
+            client=_build_async_http_client(NOTION_READ_TIMEOUT),
+            **_notion_options()
+        )
+
+    return _get_or_create("notion_async", None, api_key, factory)
+
+
+def _notion_options():
+    """Notionクライアントの接続先の設定"""
+    return {"base_url": NOTION_BASE_URL} if NOTION_BASE_URL else {}
+
+
+def get_pool_stats():
+    """クライアントプールのヒット・ミス数を取得する
+
+    Returns:
+        dict: プロバイダー別の hits / misses / clients（保持中のクライアント数）
+    """
+    with _lock:
+        result = {}
+        for provider, provider_stats in _stats.items():
+            result[provider] = dict(provider_stats)
+            result[provider]["clients"] = sum(1 for key in _clients if key[0] == provider)
+        return result
+
+
+def close_all():
+    """保持している全クライアントの接続を閉じる"""
+    with _lock:
+        for client in _clients.values():
+            close = getattr(client, "close", None) or getattr(client, "aclose", None)
+            if callable(close):
+                try:
+                    result = close()
+                    if inspect.isawaitable(result):
+                        # 非同期クライアントは作成したイベントループ上で閉じる
+                        run_sync(result)
+                except Exception as e:
+                    logger.warning(f"クライアントのクローズに失敗しました: {str(e)}")
+        _clients.clear()
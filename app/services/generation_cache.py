@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from app import db
+from app.models import GenerationCache
+from app.services import transcript_store
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# キャッシュ設定
+GENERATION_CACHE_ENABLED = os.environ.get('GENERATION_CACHE_ENABLED', '1') != '0'
+GENERATION_CACHE_MAX_ENTRIES = int(os.environ.get('GENERATION_CACHE_MAX_ENTRIES', '1000'))
+GENERATION_CACHE_MAX_AGE_DAYS = int(os.environ.get('GENERATION_CACHE_MAX_AGE_DAYS', '30'))
+
+
+def make_cache_key(content, title, formatted_date, speakers, ai_provider, ai_model, thinking_mode, prompt_version):
+    """生成条件からキャッシュキー（SHA-256）を作成する
+
+    プロンプトに含まれる入力（文字起こし・タイトル・日時・話者）と生成条件
+    （プロバイダー・モデル・思考モード・プロンプトのバージョン）が全て同じ場合のみ同じキーになる。
+
+    Returns:
+        str: 64文字の16進ハッシュ
+    """
+    digest = hashlib.sha256()
+    header = json.dumps({
+        "title": title,
+        "date": formatted_date,
+        "speakers": list(speakers or []),
+        "provider": ai_provider,
+        "model": ai_model,
+        "thinking": bool(thinking_mode),
+        "prompt_version": prompt_version
+    }, ensure_ascii=False, sort_keys=True)
+    digest.update(header.encode('utf-8'))
+    digest.update(b"\0")
+    transcript_store.update_digest(digest, content or "")
+    return digest.hexdigest()
+
+
+def get_cached(cache_key):
+    """キャッシュから生成結果を取得する
+
+    Returns:
+        dict: minutes_content と generated_title を含むディクショナリ（キャッシュがない場合はNone）
+    """
+    if not GENERATION_CACHE_ENABLED:
+        return None
+    try:
+        entry = GenerationCache.query.filter_by(cache_key=cache_key).first()
+        if not entry:
+            return None
+        if entry.created_at and entry.created_at < datetime.utcnow() - timedelta(days=GENERATION_CACHE_MAX_AGE_DAYS):
+            return None
+        
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_hit_at = datetime.utcnow()
+        db.session.commit()
+        return {
+            "minutes_content": entry.minutes_content,
+            "generated_title": entry.generated_title
+        }
+    except Exception as e:
+        # キャッシュの障害で生成自体を失敗させない
+        logger.warning(f"生成キャッシュの取得に失敗しました: {str(e)}")
+        db.session.rollback()
+        return None
+
+
+def store(cache_key, result, ai_provider, ai_model):
+    """生成結果をキャッシュに保存し、古いエントリを削除する
+
+    Args:
+        cache_key (str): キャッシュキー
+        result (dict): minutes_content と generated_title を含む生成結果
+        ai_provider (str): 使用したAIプロバイダー
+        ai_model (str): 使用したAIモデル
+    """
+    if not GENERATION_CACHE_ENABLED:
+        return
+    try:
+        entry = GenerationCache.query.filter_by(cache_key=cache_key).first()
+        if not entry:
+            entry = GenerationCache(cache_key=cache_key)
+            db.session.add(entry)
+        entry.ai_provider = ai_provider
+        entry.ai_model = ai_model
+        entry.minutes_content = result.get("minutes_content", "")
+        entry.generated_title = result.get("generated_title")
+        entry.created_at = datetime.utcnow()
+        entry.last_hit_at = entry.created_at
+        db.session.commit()
+        evict()
+    except Exception as e:
+        logger.warning(f"生成キャッシュの保存に失敗しました: {str(e)}")
+        db.session.rollback()
+
+
+def evict(max_entries=None, max_age_days=None):
+    """期限切れ・上限超過のキャッシュエントリを削除する
+
+    Args:
+        max_entries (int, optional): 保持する最大エントリ数（最終利用日時が古いものから削除）
+        max_age_days (int, optional): エントリの最大保持日数
+
+    Returns:
+        int: 削除したエントリ数
+    """
+    max_entries = GENERATION_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_age_days = GENERATION_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    
+    # 期限切れのエントリを削除
+    threshold = datetime.utcnow() - timedelta(days=max_age_days)
+    deleted = GenerationCache.query.filter(GenerationCache.created_at < threshold).delete(synchronize_session=False)
+    
+    # 上限を超えた分を最終利用日時が古いものから削除
+    overflow_ids = [
+        row.id for row in db.session.query(GenerationCache.id)
+        .order_by(GenerationCache.last_hit_at.desc(), GenerationCache.id.desc())
+        .offset(max_entries)
+        .all()
+    ]
+    if overflow_ids:
+        deleted += GenerationCache.query.filter(GenerationCache.id.in_(overflow_ids)).delete(synchronize_session=False)
+    
+    db.session.commit()
+    if deleted:
+        logger.info(f"生成キャッシュを {deleted} 件削除しました")
+    return deleted
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AIプロバイダー間のヘッジリクエスト
+
+主プロバイダーが直近の応答時間の指定パーセンタイルを過ぎても応答しない場合に、
+副プロバイダーへ同じリクエストを並行して送り、先に成功した結果を採用する（もう一方はキャンセルする）。
+応答時間はプロバイダー・モデル・入力の大きさの区分ごとに直近 HEDGE_LATENCY_WINDOW 件をプロセス内に保持する。
+応答時間にはレート制限による送信待ちを含めず、プロバイダーへの呼び出し（provider_call() のブロック）の時間だけを数える。
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# パーセンタイルの計算に使用する直近の応答時間の件数
+HEDGE_LATENCY_WINDOW = int(os.environ.get('HEDGE_LATENCY_WINDOW', '100'))
+# パーセンタイルを使用するのに必要な最小件数（これ未満の場合は HEDGE_DEFAULT_DELAY を使用する）
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+# 応答時間の記録が少ない場合の待ち時間（秒）
+HEDGE_DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', '60'))
+# 待ち時間の下限（秒）: 応答の速いモデルで副プロバイダーへの送信が多発しないようにする
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', '5'))
+# 入力の大きさの区分の基準（推定トークン数）: これ以下を区分0とし、2倍ごとに区分を分ける
+HEDGE_SIZE_BUCKET_BASE = int(os.environ.get('HEDGE_SIZE_BUCKET_BASE', '2000'))
+
+_current_timer = contextvars.ContextVar("hedge_call_timer", default=None)
+
+
+class LatencyTracker:
+    """プロバイダー・モデル・入力の大きさの区分ごとの直近の応答時間を保持する"""
+
+    def __init__(self, window=HEDGE_LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, ai_provider, ai_model, seconds, bucket=0):
+        """応答時間を記録する"""
+        key = (ai_provider, ai_model, bucket)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, ai_provider, ai_model, percentile, bucket=0, min_samples=HEDGE_MIN_SAMPLES):
+        """応答時間のパーセンタイル（秒）を返す（記録が min_samples 件未満の場合はNone）"""
+        with self._lock:
+            samples = sorted(self._samples.get((ai_provider, ai_model, bucket), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        # nearest-rank 法
+        rank = max(1, -(-len(samples) * percentile // 100))
+        return samples[min(int(rank), len(samples)) - 1]
+
+
+_tracker = LatencyTracker()
+
+
+class CallTimer:
+    """1つのリクエスト（主または副プロバイダーでの生成）で行ったプロバイダー呼び出しの時間を集計する"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        # 最初の呼び出しを開始した（レート制限による送信待ちが終わった）ことを知らせるイベント
+        self.started = asyncio.Event()
+
+
+@contextmanager
+def provider_call():
+    """このブロックの時間をプロバイダーの応答時間として数える（ヘッジの対象外の呼び出しでは何もしない）
+
+    レート制限による送信待ちの後、プロバイダーを呼び出す部分だけを囲む。
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    timer.started.set()
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timer.seconds += time.monotonic() - started
+
+
+def size_bucket(input_tokens):
+    """入力の推定トークン数を応答時間の区分に変換する（HEDGE_SIZE_BUCKET_BASE 以下を0とし、2倍ごとに1増やす）"""
+    if not input_tokens or input_tokens <= HEDGE_SIZE_BUCKET_BASE:
+        return 0
+    return math.ceil(math.log2(input_tokens / HEDGE_SIZE_BUCKET_BASE))
+
+
+def hedge_delay(ai_provider, ai_model, percentile, bucket=0):
+    """副プロバイダーへの送信を開始するまでの待ち時間（秒）を返す"""
+    value = _tracker.percentile(ai_provider, ai_model, percentile, bucket)
+    if value is None:
+        return HEDGE_DEFAULT_DELAY
+    return max(value, HEDGE_MIN_DELAY)
+
+
+async def _run_timed(factory, timer):
+    """タスク内の provider_call() の時間を timer に集計しながら実行する"""
+    # タスクごとにコンテキストがコピーされるため、他のタスクの集計先には影響しない
+    _current_timer.set(timer)
+    return await factory()
+
+
+async def run_hedged(primary, secondary=None, percentile=95, input_tokens=0):
+    """主プロバイダーで生成し、応答が遅い場合は副プロバイダーでも並行して生成する
+
+    待ち時間は主プロバイダーへの最初の呼び出しを開始した時点（レート制限による送信待ちの後）から数える。
+
+    Args:
+        primary (tuple): (ai_provider, ai_model, コルーチンを返す関数)
+        secondary (tuple, optional): 副プロバイダーの (ai_provider, ai_model, コルーチンを返す関数)。
+            Noneの場合は主プロバイダーのみで生成する（応答時間の記録は行う）
+        percentile (int): 副プロバイダーへの送信を開始する、主プロバイダーの応答時間のパーセンタイル
+        input_tokens (int): 入力の推定トークン数（応答時間を入力の大きさの区分ごとに分けるために使用する）
+
+    Returns:
+        tuple: (採用した結果, ヘッジ情報)
+            ヘッジ情報は ai_provider / ai_model（採用した結果のプロバイダー・モデル）、
+            hedge_provider / hedge_model、hedge_triggered、hedge_won、
+            primary_latency / hedge_latency（秒。キャンセルした場合はそれまでの経過時間）を含む
+    """
+    primary_provider, primary_model, primary_factory = primary
+    info = {
+        "ai_provider": primary_provider,
+        "ai_model": primary_model,
+        "hedge_provider": secondary[0] if secondary else None,
+        "hedge_model": secondary[1] if secondary else None,
+        "hedge_triggered": False,
+        "hedge_won": False,
+        "primary_latency": None,
+        "hedge_latency": None,
+    }
+
+    bucket = size_bucket(input_tokens)
+    primary_timer = CallTimer()
+    primary_task = asyncio.ensure_future(_run_timed(primary_factory, primary_timer))
+    primary_started = time.monotonic()
+    tasks = {primary_task: ("primary", primary_provider, primary_model, primary_started, primary_timer)}
+    try:
+        delay = hedge_delay(primary_provider, primary_model, percentile, bucket) if secondary else None
+        if secondary:
+            # レート制限による送信待ちの間は待ち時間を数えない
+            started_waiter = asyncio.ensure_future(primary_timer.started.wait())
+            try:
+                await asyncio.wait({primary_task, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                started_waiter.cancel()
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+
+        if not done:
+            hedge_provider, hedge_model, hedge_factory = secondary
+            logger.info(
+                f"{primary_provider} ({primary_model}) の応答が {delay:.1f} 秒を超えたため、"
+                f"{hedge_provider} ({hedge_model}) にも並行してリクエストします"
+            )
+            info["hedge_triggered"] = True
+            hedge_timer = CallTimer()
+            hedge_task = asyncio.ensure_future(_run_timed(hedge_factory, hedge_timer))
+            tasks[hedge_task] = ("hedge", hedge_provider, hedge_model, time.monotonic(), hedge_timer)
+
+        # 先に成功した方を採用する（両方失敗した場合は主プロバイダーのエラーを送出する）
+        pending = set(tasks)
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                role, provider, model, started, timer = tasks[task]
+                info[f"{role}_latency"] = time.monotonic() - started
+                if task.exception() is None:
+                    # 統計には送信待ちを除いたプロバイダーの応答時間を記録する
+                    _tracker.record(provider, model, timer.seconds, bucket)
+                    winner = task
+                    break
+                logger.warning(f"{provider} ({model}) での生成に失敗しました: {str(task.exception())}")
+
+        if winner is None:
+            raise primary_task.exception()
+
+        role, provider, model, _, _ = tasks[winner]
+        info["ai_provider"] = provider
+        info["ai_model"] = model
+        info["hedge_won"] = role == "hedge"
+        return winner.result(), info
+
+    finally:
+        # 採用しなかった（または呼び出し元がキャンセルされた）リクエストをキャンセルする
+        # （途中で打ち切った時間は実際の応答時間より短いため、応答時間の統計には記録しない）
+        for task, (role, provider, model, started, _) in tasks.items():
+            if not task.done():
+                task.cancel()
+                info[f"{role}_latency"] = time.monotonic() - started
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+議事録履歴の一覧取得（キーセットページネーションと件数のキャッシュ）
+
+一覧は (received_at DESC, id DESC) の順に並べ、前ページ最後の行の (received_at, id) を
+カーソルとして次ページを取得する。OFFSET を使わないため、何ページ目でも
+インデックスを先頭から読むだけで済み、取得コストは1ページ目と変わらない。
+"""
+
+import os
+import time
+import base64
+import threading
+from datetime import datetime
+from sqlalchemy import tuple_
+from app import db
+from app.models import MinutesHistory
+
+# 1ページあたりの最大件数
+HISTORY_MAX_PER_PAGE = 100
+
+# 総件数のキャッシュ有効期間（秒）: COUNT(*) は全件を走査するため一定時間再利用する
+HISTORY_COUNT_CACHE_TTL = float(os.environ.get('HISTORY_COUNT_CACHE_TTL', '30'))
+
+# 総件数のキャッシュ: ステータス（Noneは全件） -> (件数, 有効期限)
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def encode_cursor(history):
+    """履歴レコードから次ページ取得用のカーソルを作成する
+
+    Args:
+        history (MinutesHistory): ページの最後のレコード
+
+    Returns:
+        str: URLに含められるカーソル文字列
+    """
+    raw = f"{history.received_at.isoformat()}|{history.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    """カーソル文字列を (received_at, id) に変換する
+
+    Args:
+        cursor (str): encode_cursor() で作成したカーソル
+
+    Returns:
+        tuple: (datetime, int)
+
+    Raises:
+        ValueError: カーソルの形式が不正な場合
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        received_at, history_id = base64.urlsafe_b64decode(padded).decode('utf-8').split("|")
+        return datetime.fromisoformat(received_at), int(history_id)
+    except Exception as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+
+
+def history_page(query, cursor=None, per_page=10):
+    """キーセットページネーションで履歴を1ページ分取得する
+
+    Args:
+        query (Query): 絞り込み済みの MinutesHistory のクエリ（並び順はこの関数で指定する）
+        cursor (str, optional): 前ページの next_cursor（Noneの場合は先頭ページ）
+        per_page (int): 1ページあたりの件数
+
+    Returns:
+        tuple: (履歴のリスト, 次ページのカーソル（最終ページの場合はNone）)
+
+    Raises:
+        ValueError: カーソルの形式が不正な場合
+    """
+    per_page = max(1, min(per_page, HISTORY_MAX_PER_PAGE))
+
+    if cursor:
+        received_at, history_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(MinutesHistory.received_at, MinutesHistory.id) < tuple_(received_at, history_id)
+        )
+
+    # 次ページの有無を判定するため1件多く取得する
+    histories = (
+        query.order_by(MinutesHistory.received_at.desc(), MinutesHistory.id.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(histories) > per_page:
+        histories = histories[:per_page]
+        next_cursor = encode_cursor(histories[-1])
+    return histories, next_cursor
+
+
+def count_histories(status=None):
+    """履歴の総件数を取得する（HISTORY_COUNT_CACHE_TTL 秒間はキャッシュした値を返す）
+
+    Args:
+        status (str, optional): ステータスで絞り込む場合に指定
+
+    Returns:
+        int: 件数
+    """
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(status)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    query = db.session.query(db.func.count(MinutesHistory.id))
+    if status:
+        query = query.filter(MinutesHistory.status == status)
+    total = query.scalar()
+
+    with _count_lock:
+        _count_cache[status] = (total, now + HISTORY_COUNT_CACHE_TTL)
+    return total
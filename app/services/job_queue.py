@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import JobQueue, MinutesHistory
+from app.services import metrics, stage_timing
+from app.services.async_engine import submit
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# ロックのタイムアウト（秒）: これを超えて running のままのジョブはワーカー停止とみなして再投入する
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', '900'))
+
+# 実行中のジョブのロックを更新する間隔（秒）: JOB_LOCK_TIMEOUT より十分短くする
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', str(min(60, JOB_LOCK_TIMEOUT / 3))))
+
+# 一度に取得を試みる候補ジョブ数
+CLAIM_BATCH_SIZE = 5
+
+# 同一プロセス内のワーカーを即座に起こすためのイベント
+_wakeup_event = threading.Event()
+
+
+def enqueue(history_id, commit=True):
+    """履歴レコードを処理キューに投入する
+
+    Args:
+        history_id (int): 処理対象の履歴レコードID
+        commit (bool): 投入後にコミットするかどうか（呼び出し側でまとめてコミットする場合はFalse）
+
+    Returns:
+        JobQueue: 作成されたジョブ
+    """
+    job = JobQueue(history_id=history_id, status="queued", available_at=datetime.utcnow())
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+        notify_workers()
+    return job
+
+
+def notify_workers():
+    """同一プロセス内の待機中ワーカーを起こす"""
+    _wakeup_event.set()
+
+
+def claim_next(worker_id):
+    """実行可能なジョブを1件取得してロックする
+
+    複数ワーカー・複数プロセスから同時に呼ばれても同じジョブを二重に取得しないよう、
+    status='queued' を条件にした条件付きUPDATEでロックを取得する。
+
+    Args:
+        worker_id (str): ロックを取得するワーカーの識別子
+
+    Returns:
+        JobQueue: 取得したジョブ（実行可能なジョブがない場合はNone）
+    """
+    now = datetime.utcnow()
+    candidate_ids = [
+        row.id for row in db.session.query(JobQueue.id)
+        .filter(JobQueue.status == "queued", JobQueue.available_at <= now)
+        .order_by(JobQueue.available_at, JobQueue.id)
+        .limit(CLAIM_BATCH_SIZE)
+        .all()
+    ]
+
+    for job_id in candidate_ids:
+        updated = JobQueue.query.filter(
+            JobQueue.id == job_id,
+            JobQueue.status == "queued"
+        ).update({
+            "status": "running",
+            "locked_by": worker_id,
+            "locked_at": now,
+            "attempts": JobQueue.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if updated:
+            job = JobQueue.query.get(job_id)
+            metrics.QUEUE_WAIT.observe(max(0.0, (now - job.available_at).total_seconds()))
+            return job
+
+    return None
+
+
+def heartbeat(job_id, worker_id):
+    """実行中のジョブのロックを更新する（長時間のジョブが再投入されないようにする）
+
+    Args:
+        job_id (int): 対象ジョブのID
+        worker_id (str): ロックを保持しているワーカーの識別子
+
+    Returns:
+        bool: ロックを更新できたかどうか（再投入などでロックを失っている場合はFalse）
+    """
+    updated = JobQueue.query.filter(
+        JobQueue.id == job_id,
+        JobQueue.status == "running",
+        JobQueue.locked_by == worker_id
+    ).update({"locked_at": datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return bool(updated)
+
+
+class LockHeartbeat:
+    """ジョブの実行中、別スレッドから一定間隔でロックを更新する
+
+    with ブロックの間だけ動作する。データベースへの接続はスレッドごとに
+    アプリケーションコンテキストを作成して行う。
+    """
+
+    def __init__(self, app, job_id, worker_id, interval=None):
+        """
+        Args:
+            app (Flask): アプリケーションコンテキストを作成するためのFlaskアプリ
+            job_id (int): 対象ジョブのID
+            worker_id (str): ロックを保持しているワーカーの識別子
+            interval (float, optional): 更新間隔（秒）。省略時は JOB_HEARTBEAT_INTERVAL
+        """
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval or JOB_HEARTBEAT_INTERVAL
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"job-heartbeat-{self.job_id}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # 終了は待たない（ジョブの完了後は status の条件により更新されない）
+        self._stop_event.set()
+        return False
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    if not heartbeat(self.job_id, self.worker_id):
+                        logger.warning(f"ジョブ {self.job_id} のロックを失ったため、ロックの更新を停止します")
+                        return
+            except Exception as e:
+                logger.error(f"ジョブ {self.job_id} のロックの更新中にエラーが発生しました: {str(e)}")
+
+
+def finish(job, error=None, spans=None):
+    """ジョブを完了（または失敗）としてマークする
+
+    Args:
+        job (JobQueue): 対象ジョブ
+        error (str, optional): 失敗した場合のエラーメッセージ
+        spans (list, optional): 処理段階ごとの時間の記録（SpanRecorder.to_list() の戻り値）
+    """
+    job.status = "failed" if error else "done"
+    job.last_error = error
+    if spans is not None:
+        job.spans = json.dumps(spans, ensure_ascii=False)
+    job.finished_at = datetime.utcnow()
+    job.locked_by = None
+    db.session.commit()
+
+
+def requeue_stale(timeout=JOB_LOCK_TIMEOUT):
+    """ロックがタイムアウトしたジョブを再投入する（ワーカーのクラッシュ対策）
+
+    Args:
+        timeout (int): ロックのタイムアウト（秒）
+
+    Returns:
+        int: 再投入または失敗扱いにしたジョブ数
+    """
+    threshold = datetime.utcnow() - timedelta(seconds=timeout)
+    stale_jobs = JobQueue.query.filter(
+        JobQueue.status == "running",
+        JobQueue.locked_at < threshold
+    ).all()
+
+    for job in stale_jobs:
+        history = MinutesHistory.query.get(job.history_id)
+        if job.attempts >= job.max_attempts:
+            logger.error(f"ジョブ {job.id} は最大試行回数に達したため失敗として扱います")
+            job.status = "failed"
+            job.last_error = "ワーカーのタイムアウトにより最大試行回数に達しました"
+            job.finished_at = datetime.utcnow()
+            if history and history.status in ("pending", "processing"):
+                history.status = "failed"
+                history.error_message = job.last_error
+        else:
+            logger.warning(f"ジョブ {job.id} のロックがタイムアウトしたため再投入します (locked_by: {job.locked_by})")
+            job.status = "queued"
+            job.available_at = datetime.utcnow()
+            if history and history.status == "processing":
+                history.status = "pending"
+        job.locked_by = None
+        job.locked_at = None
+
+    if stale_jobs:
+        db.session.commit()
+    return len(stale_jobs)
+
+
+def queue_depth():
+    """待機中のジョブ数を取得する"""
+    return JobQueue.query.filter(JobQueue.status == "queued").count()
+
+
+def queue_counts():
+    """状態ごとのジョブ数を取得する
+
+    Returns:
+        dict: 状態 (queued, running, done, failed) -> ジョブ数
+    """
+    rows = db.session.query(JobQueue.status, db.func.count(JobQueue.id)).group_by(JobQueue.status).all()
+    return {status: count for status, count in rows}
+
+
+def run_job(job):
+    """ジョブを1件実行する
+
+    Args:
+        job (JobQueue): 実行するジョブ
+    """
+    # 循環インポートを避けるため関数内でインポート
+    from app.routes.webhook import process_minutes_generation
+
+    logger.info(f"ジョブ {job.id} (history_id: {job.history_id}) の処理を開始します")
+    started = time.monotonic()
+    metrics.JOBS_IN_PROGRESS.inc()
+    app = current_app._get_current_object()
+    with LockHeartbeat(app, job.id, job.locked_by), stage_timing.recording() as timings:
+        try:
+            process_minutes_generation(job.history_id)
+            history = MinutesHistory.query.get(job.history_id)
+            if history and history.status == "failed":
+                finish(job, error=history.error_message or "議事録生成に失敗しました", spans=timings.to_list())
+            else:
+                finish(job, spans=timings.to_list())
+        except Exception as e:
+            logger.error(f"ジョブ {job.id} の実行中にエラーが発生しました: {str(e)}", exc_info=True)
+            db.session.rollback()
+            finish(job, error=str(e), spans=timings.to_list())
+        finally:
+            metrics.JOBS_IN_PROGRESS.dec()
+            metrics.JOB_DURATION.observe(time.monotonic() - started, outcome=job.status)
+
+
+async def arun_job(job_id, history_id, worker_id):
+    """ジョブを1件実行する（非同期版。アプリケーションコンテキスト内で呼び出す）
+
+    Args:
+        job_id (int): 実行するジョブのID
+        history_id (int): 処理対象の履歴レコードID
+        worker_id (str): ロックを保持しているワーカーの識別子
+    """
+    # 循環インポートを避けるため関数内でインポート
+    from app.routes.webhook import aprocess_minutes_generation
+
+    logger.info(f"ジョブ {job_id} (history_id: {history_id}) の処理を開始します")
+    started = time.monotonic()
+    error = None
+    metrics.JOBS_IN_PROGRESS.inc()
+    app = current_app._get_current_object()
+    with LockHeartbeat(app, job_id, worker_id), stage_timing.recording() as timings:
+        try:
+            await aprocess_minutes_generation(history_id)
+        except Exception as e:
+            logger.error(f"ジョブ {job_id} の実行中にエラーが発生しました: {str(e)}", exc_info=True)
+            error = str(e)
+        finally:
+            metrics.JOBS_IN_PROGRESS.dec()
+
+    def complete():
+        if error:
+            db.session.rollback()
+        job = JobQueue.query.get(job_id)
+        history = MinutesHistory.query.get(history_id)
+        if error is None and history and history.status == "failed":
+            finish(job, error=history.error_message or "議事録生成に失敗しました", spans=timings.to_list())
+            return "failed"
+        finish(job, error=error, spans=timings.to_list())
+        return "failed" if error else "done"
+
+    outcome = await asyncio.to_thread(complete)
+    metrics.JOB_DURATION.observe(time.monotonic() - started, outcome=outcome)
+
+
+def drain(app, worker_id=None):
+    """キューが空になるまでジョブを順に処理する（常駐ワーカーを置かない環境で定期実行する）
+
+    Args:
+        app (Flask): Flaskアプリ
+        worker_id (str, optional): ロックを取得するワーカーの識別子
+
+    Returns:
+        int: 処理したジョブ数
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:drain"
+    processed = 0
+    while True:
+        with app.app_context():
+            requeue_stale()
+            job = claim_next(worker_id)
+            if job is None:
+                return processed
+            run_job(job)
+        processed += 1
+
+
+class WorkerPool:
+    """キューを処理するワーカースレッドのプール"""
+
+    def __init__(self, app, num_threads=2, poll_interval=5.0):
+        """
+        Args:
+            app (Flask): アプリケーションコンテキストを作成するためのFlaskアプリ
+            num_threads (int): ワーカースレッド数
+            poll_interval (float): キューが空の場合のポーリング間隔（秒）
+        """
+        self.app = app
+        self.num_threads = num_threads
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        """ワーカースレッドを起動する"""
+        for i in range(self.num_threads):
+            thread = threading.Thread(
+                target=self._run,
+                args=(f"{self._worker_prefix}:{i}",),
+                name=f"minutes-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"ワーカースレッドを {self.num_threads} 個起動しました")
+
+    def stop(self, timeout=None):
+        """ワーカースレッドを停止する（処理中のジョブは完了まで待つ）"""
+        self._stop_event.set()
+        _wakeup_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def join(self):
+        """全ワーカースレッドの終了を待つ"""
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self, worker_id):
+        """ワーカースレッドのメインループ"""
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    requeue_stale()
+                    job = claim_next(worker_id)
+                    if job:
+                        run_job(job)
+                        continue
+            except Exception as e:
+                logger.error(f"ワーカー {worker_id} でエラーが発生しました: {str(e)}", exc_info=True)
+
+            # キューが空の場合は通知かポーリング間隔まで待機
+            _wakeup_event.wait(self.poll_interval)
+            _wakeup_event.clear()
+
+
+class AsyncJobRunner:
+    """1つのイベントループで複数のジョブを同時に処理するランナー
+
+    ジョブはLLM・Notionの応答待ちがほとんどのため、スレッドを占有せずに
+    最大 concurrency 件のジョブを同時に処理する。WorkerPool と同じ操作 (start / stop / join) を持つ。
+    """
+
+    def __init__(self, app, concurrency=32, poll_interval=5.0):
+        """
+        Args:
+            app (Flask): アプリケーションコンテキストを作成するためのFlaskアプリ
+            concurrency (int): 同時に処理するジョブ数の上限
+            poll_interval (float): キューが空の場合のポーリング間隔（秒）
+        """
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._future = None
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}:async"
+        self.in_flight = 0
+
+    def start(self):
+        """ランナーをイベントループ上で起動する"""
+        self._future = submit(self._run())
+        logger.info(f"非同期ジョブランナーを起動しました (同時実行数: {self.concurrency})")
+
+    def stop(self, timeout=None):
+        """新しいジョブの取得を止め、処理中のジョブの完了を待つ"""
+        self._stop_event.set()
+        _wakeup_event.set()
+        if self._future is not None:
+            self._future.result(timeout)
+
+    def join(self):
+        """ランナーの終了を待つ"""
+        if self._future is not None:
+            self._future.result()
+
+    async def _run(self):
+        """ランナーのメインループ"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        def on_done(task):
+            tasks.discard(task)
+            self.in_flight -= 1
+            semaphore.release()
+
+        while not self._stop_event.is_set():
+            # 同時実行数の上限に達している場合は空きが出るまで待つ
+            await semaphore.acquire()
+            try:
+                claimed = await asyncio.to_thread(self._claim)
+                if claimed is None:
+                    semaphore.release()
+                    # キューが空の場合は通知かポーリング間隔まで待機
+                    await asyncio.to_thread(self._wait)
+                    continue
+            except RuntimeError:
+                # インタープリターの終了処理でスレッドプールが停止された場合は終了する
+                logger.info("スレッドプールが停止したため、非同期ジョブランナーを終了します")
+                break
+            except Exception as e:
+                logger.error(f"ジョブの取得中にエラーが発生しました: {str(e)}", exc_info=True)
+                semaphore.release()
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            self.in_flight += 1
+            task = asyncio.create_task(self._execute(*claimed))
+            tasks.add(task)
+            task.add_done_callback(on_done)
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _claim(self):
+        """ジョブを1件取得する（スレッドで実行）"""
+        with self.app.app_context():
+            requeue_stale()
+            job = claim_next(self._worker_id)
+            return (job.id, job.history_id) if job else None
+
+    def _wait(self):
+        _wakeup_event.wait(self.poll_interval)
+        _wakeup_event.clear()
+
+    async def _execute(self, job_id, history_id):
+        # タスクごとにアプリケーションコンテキスト（＝データベースセッション）を分ける
+        with self.app.app_context():
+            await arun_job(job_id, history_id, self._worker_id)
+
+
+def start_async_runner(app, concurrency, poll_interval=5.0):
+    """非同期ジョブランナーを作成して起動する
+
+    Args:
+        app (Flask): Flaskアプリ
+        concurrency (int): 同時に処理するジョブ数の上限
+        poll_interval (float): ポーリング間隔（秒）
+
+    Returns:
+        AsyncJobRunner: 起動したランナー
+    """
+    runner = AsyncJobRunner(app, concurrency=concurrency, poll_interval=poll_interval)
+    runner.start()
+    return runner
+
+
+def start_worker_pool(app, num_threads, poll_interval=5.0):
+    """ワーカープールを作成して起動する
+
+    Args:
+        app (Flask): Flaskアプリ
+        num_threads (int): ワーカースレッド数
+        poll_interval (float): ポーリング間隔（秒）
+
+    Returns:
+        WorkerPool: 起動したワーカープール
+    """
+    pool = WorkerPool(app, num_threads=num_threads, poll_interval=poll_interval)
+    pool.start()
+    return pool
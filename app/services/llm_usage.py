@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM呼び出しのトークン使用量の集計
+
+各プロバイダーのレスポンスに含まれる使用量（入力・出力トークン数、プロンプトキャッシュから
+読み込んだトークン数など）を、1件の議事録生成ごとに集計する。
+集計先はコンテキスト変数で受け渡すため、並列に実行する呼び出し（区間ごとの要約やヘッジ）も
+同じ議事録生成の使用量として集計される。内訳はプロバイダー・モデル・呼び出しの種類
+（stage() で指定した llm.minutes、llm.title など）ごとに集計する。
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("llm_usage", default=None)
+_current_stage = contextvars.ContextVar("llm_usage_stage", default=None)
+
+_COUNTERS = ("input_tokens", "cached_input_tokens", "cache_write_tokens", "output_tokens")
+
+
+class UsageRecorder:
+    """1件の議事録生成で行ったLLM呼び出しの使用量を集計する
+
+    input_tokens はキャッシュから読み込んだ分・キャッシュに書き込んだ分を含む入力トークン数の合計。
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.calls = 0
+        self.first_token_seconds = None
+
+    def add(self, ai_provider, ai_model, input_tokens=0, cached_input_tokens=0, cache_write_tokens=0, output_tokens=0,
+            stage=None):
+        """1回分の呼び出しの使用量を加算する"""
+        entry = self.models.setdefault((ai_provider, ai_model, stage), dict.fromkeys(_COUNTERS + ("calls",), 0))
+        entry["input_tokens"] += input_tokens or 0
+        entry["cached_input_tokens"] += cached_input_tokens or 0
+        entry["cache_write_tokens"] += cache_write_tokens or 0
+        entry["output_tokens"] += output_tokens or 0
+        entry["calls"] += 1
+        self.calls += 1
+
+    def to_dict(self):
+        """集計結果をディクショナリに変換する（合計とプロバイダー・モデル・呼び出しの種類別の内訳）"""
+        totals = dict.fromkeys(_COUNTERS, 0)
+        models = []
+        for (ai_provider, ai_model, stage), entry in self.models.items():
+            for name in _COUNTERS:
+                totals[name] += entry[name]
+            models.append(dict(entry, ai_provider=ai_provider, ai_model=ai_model, stage=stage))
+        return dict(totals, calls=self.calls, first_token_seconds=self.first_token_seconds, models=models)
+
+
+@contextmanager
+def recording():
+    """このブロック内（およびそこから作成したタスク）のLLM呼び出しの使用量を集計する
+
+    Yields:
+        UsageRecorder: 集計先
+    """
+    recorder = UsageRecorder()
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """このブロック内の呼び出しの使用量を name の種類（llm.minutes、llm.title など）として集計する"""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def record(ai_provider, ai_model, **counts):
+    """現在の集計先に使用量を加算する（集計中でなければ何もしない）"""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add(ai_provider, ai_model, stage=_current_stage.get(), **counts)
+
+
+def record_first_token(seconds):
+    """最初の呼び出しで最初の出力を受け取るまでの時間を記録する（2回目以降は無視する）"""
+    recorder = _current.get()
+    if recorder is not None and recorder.first_token_seconds is None:
+        recorder.first_token_seconds = seconds
+
+
+def from_anthropic(usage):
+    """Anthropicのusageを使用量に変換する"""
+    if usage is None:
+        return {}
+    cached = getattr(usage, "cache_read_input_tokens", None) or 0
+    written = getattr(usage, "cache_creation_input_tokens", None) or 0
+    return {
+        "input_tokens": (getattr(usage, "input_tokens", None) or 0) + cached + written,
+        "cached_input_tokens": cached,
+        "cache_write_tokens": written,
+        "output_tokens": getattr(usage, "output_tokens", None) or 0,
+    }
+
+
+def from_gemini(usage_metadata):
+    """Geminiのusage_metadataを使用量に変換する（思考トークンは出力として課金されるため出力に含める）"""
+    if usage_metadata is None:
+        return {}
+    return {
+        "input_tokens": getattr(usage_metadata, "prompt_token_count", None) or 0,
+        "cached_input_tokens": getattr(usage_metadata, "cached_content_token_count", None) or 0,
+        "output_tokens": (getattr(usage_metadata, "candidates_token_count", None) or 0)
+        + (getattr(usage_metadata, "thoughts_token_count", None) or 0),
+    }
+
+
+def from_openai(usage):
+    """OpenAIのusageを使用量に変換する"""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "input_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "cached_input_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+        "output_tokens": getattr(usage, "completion_tokens", None) or 0,
+    }
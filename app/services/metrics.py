@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Prometheus形式のメトリクス
+
+処理段階ごとの時間のヒストグラム、キューの状態、処理中のジョブ数をプロセス内で集計し、
+テキスト形式（Prometheus exposition format）で出力する。
+prometheus_client には依存せず、このアプリで使う種類（ヒストグラム・ゲージ・カウンター）のみ実装する。
+
+値はプロセスごとに集計するため、複数のプロセスで動かす場合はプロセスごとに収集する
+（Webプロセスは /metrics、worker.py は WORKER_METRICS_PORT で公開する）。
+"""
+
+import os
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 処理段階の時間のバケット（秒）。DBの読み書き（ミリ秒）からLLMの呼び出し（数分）までを対象にする
+STAGE_BUCKETS = tuple(
+    float(value) for value in os.environ.get(
+        'METRICS_STAGE_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,20,30,60,120,300'
+    ).split(',')
+)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    """ラベルごとに値の分布を集計するヒストグラム"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # ラベルの値 -> [バケットごとの件数, 合計]
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value, **labels):
+        """値を1件記録する"""
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+
+    def collect(self):
+        """出力する行を返す"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le=le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """ラベルごとに現在の値を保持するゲージ"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_values(self.labelnames, labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self):
+        """出力する行を返す"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Gauge):
+    """ラベルごとに増加のみする値を保持するカウンター"""
+
+    metric_type = "counter"
+
+    def dec(self, amount=1, **labels):
+        raise ValueError("カウンターは減らせません")
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+
+
+def _label_values(labelnames, labels):
+    return tuple("" if labels.get(name) is None else str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, values, **extra):
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# 議事録生成の処理段階ごとの時間（stage_timing.span で記録する）
+STAGE_DURATION = Histogram(
+    "minutes_stage_duration_seconds",
+    "議事録生成の処理段階ごとの時間（秒）",
+    ("stage", "ai_provider", "ai_model", "outcome")
+)
+# ジョブ1件の処理時間（取得から完了まで）
+JOB_DURATION = Histogram(
+    "minutes_job_duration_seconds",
+    "ジョブ1件の処理時間（秒）",
+    ("outcome",)
+)
+# ジョブが実行可能になってからワーカーが取得するまでの時間
+QUEUE_WAIT = Histogram(
+    "minutes_queue_wait_seconds",
+    "ジョブが実行可能になってからワーカーが取得するまでの時間（秒）"
+)
+# キューの状態ごとのジョブ数（出力時にデータベースから取得する。全プロセス共通の値）
+QUEUE_JOBS = Gauge(
+    "minutes_queue_jobs",
+    "キューの状態ごとのジョブ数（queued は待機中、running は処理中）",
+    ("status",)
+)
+# このプロセスで処理中のジョブ数
+JOBS_IN_PROGRESS = Gauge(
+    "minutes_jobs_in_progress",
+    "このプロセスで処理中のジョブ数"
+)
+JOBS_IN_PROGRESS.set(0)
+
+
+def set_queue_counts(counts):
+    """キューの状態ごとのジョブ数を設定する
+
+    Args:
+        counts (dict): 状態 -> ジョブ数（job_queue.queue_counts() の戻り値）
+    """
+    for status in ("queued", "running", "done", "failed"):
+        QUEUE_JOBS.set(counts.get(status, 0), status=status)
+
+
+def render():
+    """登録されているすべてのメトリクスをテキスト形式で出力する"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port, refresh=None, host="0.0.0.0"):
+    """メトリクスを返すHTTPサーバーを別スレッドで起動する（Webサーバーを持たない worker.py 用）
+
+    Args:
+        port (int): 待ち受けるポート
+        refresh (callable, optional): 出力の前に呼び出す関数（キューの状態の取得など）
+        host (str): 待ち受けるアドレス
+
+    Returns:
+        ThreadingHTTPServer: 起動したサーバー
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            try:
+                if refresh:
+                    refresh()
+                body = render().encode("utf-8")
+            except Exception as e:
+                logger.error(f"メトリクスの出力中にエラーが発生しました: {str(e)}", exc_info=True)
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"メトリクスを公開しました: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AIが出力したMarkdown形式の議事録をNotionのブロックに変換するコンパイラ
+
+外部サービスやデータベースに依存しない純粋な関数のみで構成する。
+"""
+
+import re
+
+# Notion APIの制限
+MAX_TEXT_LENGTH = 2000  # rich_text 1要素あたりの文字数上限
+MAX_RICH_TEXT_ITEMS = 100  # 1ブロックあたりの rich_text 要素数の上限
+MAX_NESTING_DEPTH = 2  # 1リクエストで作成できる子ブロックの入れ子の深さ
+
+# ブロック単位のパターン
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_DIVIDER_PATTERN = re.compile(r'^(?:(?:-\s*){3,}|(?:\*\s*){3,}|(?:_\s*){3,}|(?:━)+|(?:―){3,})$')
+_LIST_ITEM_PATTERN = re.compile(
+    r'^(?P<indent>[ \t　]*)'
+    r'(?:(?P<bullet>[-*+•])\s+|(?P<dot>・)\s*|(?P<number>\d+)[.)．]\s+)'
+    r'(?P<text>.*)$'
+)
+_TODO_PATTERN = re.compile(r'^\[(?P<checked>[ xX])\]\s+(?P<text>.*)$')
+_QUOTE_PATTERN = re.compile(r'^\s*>\s?(.*)$')
+_FENCE_PATTERN = re.compile(r'^\s*(```|~~~)\s*([\w+-]*)\s*$')
+
+# インライン装飾のパターン
+_INLINE_PATTERN = re.compile(
+    r'`(?P<code>[^`\n]+)`'
+    r'|\*\*(?P<bold>[^\n]+?)\*\*'
+    r'|__(?P<bold2>[^\n]+?)__'
+    r'|~~(?P<strike>[^\n]+?)~~'
+    r'|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>https?://[^)\s]+)\)'
+    r'|(?<!\*)\*(?![\s*])(?P<italic>[^*\n]+?)(?<![\s*])\*(?!\*)'
+    r'|(?<![_\w])_(?P<italic2>[^_\n]+?)_(?![_\w])'
+)
+
+# Notionのコードブロックで使用できる主な言語名
+_CODE_LANGUAGES = {
+    "bash", "c", "c++", "c#", "css", "diff", "go", "html", "java", "javascript", "json",
+    "kotlin", "markdown", "php", "python", "ruby", "rust", "shell", "sql", "swift",
+    "typescript", "xml", "yaml",
+}
+
+
+def markdown_to_blocks(markdown):
+    """Markdownテキストを Notion のブロックのリストに変換する
+
+    見出し（#〜###）、箇条書き（-, *, +, ・）、番号付きリスト、チェックボックス、
+    引用、コードブロック、区切り線、インライン装飾（太字・斜体・取り消し線・
+    インラインコード・リンク）に対応する。インデントされたリスト項目は子ブロックとして
+    入れ子にし、連続する通常の行は文字数上限まで1つの段落にまとめる。
+
+    Args:
+        markdown (str): Markdown形式のテキスト
+
+    Returns:
+        list: Notionのブロックのリスト
+    """
+    compiler = _Compiler()
+    compiler.compile(markdown or "")
+    return compiler.blocks
+
+
+def rich_text(text):
+    """インライン装飾を含むテキストを rich_text の配列に変換する
+
+    Args:
+        text (str): インライン装飾を含むテキスト
+
+    Returns:
+        list: Notionの rich_text 要素のリスト
+    """
+    items = []
+    position = 0
+    for match in _INLINE_PATTERN.finditer(text):
+        if match.start() > position:
+            _append_text(items, text[position:match.start()])
+
+        if match.group('code') is not None:
+            _append_text(items, match.group('code'), code=True)
+        elif match.group('bold') is not None or match.group('bold2') is not None:
+            _append_text(items, match.group('bold') or match.group('bold2'), bold=True)
+        elif match.group('strike') is not None:
+            _append_text(items, match.group('strike'), strikethrough=True)
+        elif match.group('link_text') is not None:
+            _append_text(items, match.group('link_text'), link=match.group('link_url'))
+        else:
+            _append_text(items, match.group('italic') or match.group('italic2'), italic=True)
+        position = match.end()
+
+    if position < len(text):
+        _append_text(items, text[position:])
+
+    return _limit_rich_text(items)
+
+
+def count_blocks(blocks):
+    """子ブロックを含めたブロックの総数を数える"""
+    total = 0
+    for block in blocks:
+        total += 1
+        children = block.get(block["type"], {}).get("children")
+        if children:
+            total += count_blocks(children)
+    return total
+
+
+def _append_text(items, content, link=None, **annotations):
+    """rich_text 要素を追加する（同じ装飾の直前の要素とは結合し、文字数上限で分割する）"""
+    if not content:
+        return
+    annotations = {key: value for key, value in annotations.items() if value}
+
+    previous = items[-1] if items else None
+    if (previous is not None
+            and previous.get("annotations", {}) == annotations
+            and previous["text"].get("link") == ({"url": link} if link else None)
+            and len(previous["text"]["content"]) + len(content) <= MAX_TEXT_LENGTH):
+        previous["text"]["content"] += content
+        return
+
+    for start in range(0, len(content), MAX_TEXT_LENGTH):
+        item = {"type": "text", "text": {"content": content[start:start + MAX_TEXT_LENGTH]}}
+        if link:
+            item["text"]["link"] = {"url": link}
+        if annotations:
+            item["annotations"] = dict(annotations)
+        items.append(item)
+
+
+def _limit_rich_text(items):
+    """rich_text 要素数の上限を超える場合、超過分を装飾なしのテキストとしてまとめる"""
+    if len(items) <= MAX_RICH_TEXT_ITEMS:
+        return items
+    limited = items[:MAX_RICH_TEXT_ITEMS - 1]
+    overflow = "".join(item["text"]["content"] for item in items[MAX_RICH_TEXT_ITEMS - 1:])
+    tail = []
+    _append_text(tail, overflow)
+    # 超過分が長すぎる場合は上限に収まる範囲で切り詰める
+    return limited + tail[:MAX_RICH_TEXT_ITEMS - len(limited)]
+
+
+def _block(block_type, text=None, **fields):
+    """ブロックを作成する"""
+    body = dict(fields)
+    if text is not None:
+        body["rich_text"] = rich_text(text)
+    return {"object": "block", "type": block_type, block_type: body}
+
+
+class _Compiler:
+    """Markdownを1行ずつ読み取り、ブロックのツリーを組み立てる"""
+
+    def __init__(self):
+        self.blocks = []
+        self._paragraph = []
+        self._paragraph_length = 0
+        self._quote = []
+        # リストの入れ子を管理するスタック: [(インデント幅, ブロック)]
+        self._list_stack = []
+
+    def compile(self, markdown):
+        lines = markdown.split("\n")
+        index = 0
+        while index < len(lines):
+            line = lines[index].rstrip()
+            stripped = line.strip()
+
+            # コードブロック
+            fence = _FENCE_PATTERN.match(line)
+            if fence:
+                index = self._code_block(lines, index + 1, fence.group(1), fence.group(2))
+                continue
+
+            # 空行: 段落・引用の区切り（リストの入れ子は維持する）
+            if not stripped:
+                self._flush_paragraph()
+                self._flush_quote()
+                index += 1
+                continue
+
+            # 引用
+            quote = _QUOTE_PATTERN.match(line)
+            if quote:
+                self._flush_paragraph()
+                self._list_stack = []
+                self._quote.append(quote.group(1))
+                index += 1
+                continue
+            self._flush_quote()
+
+            # 見出し
+            heading = _HEADING_PATTERN.match(stripped)
+            if heading and line == line.lstrip():
+                self._flush_paragraph()
+                self._list_stack = []
+                level = min(len(heading.group(1)), 3)
+                self.blocks.append(_block(f"heading_{level}", heading.group(2)))
+                index += 1
+                continue
+
+            # 区切り線
+            if _DIVIDER_PATTERN.match(stripped):
+                self._flush_paragraph()
+                self._list_stack = []
+                self.blocks.append({"object": "block", "type": "divider", "divider": {}})
+                index += 1
+                continue
+
+            # リスト項目
+            item = _LIST_ITEM_PATTERN.match(line)
+            if item:
+                self._flush_paragraph()
+                self._list_item(item)
+                index += 1
+                continue
+
+            # リスト項目の継続行（リスト項目よりも深くインデントされた通常の行）
+            indent = _indent_width(line)
+            if self._list_stack and indent > self._list_stack[-1][0]:
+                self._append_to_list_item(self._list_stack[-1][1], stripped)
+                index += 1
+                continue
+
+            # 通常の行: 段落にまとめる
+            self._list_stack = []
+            self._add_paragraph_line(stripped if indent else line)
+            index += 1
+
+        self._flush_paragraph()
+        self._flush_quote()
+
+    def _add_paragraph_line(self, line):
+        added_length = len(line) + (1 if self._paragraph else 0)
+        if self._paragraph and self._paragraph_length + added_length > MAX_TEXT_LENGTH:
+            self._flush_paragraph()
+            added_length = len(line)
+        self._paragraph.append(line)
+        self._paragraph_length += added_length
+
+    def _flush_paragraph(self):
+        if self._paragraph:
+            self.blocks.append(_block("paragraph", "\n".join(self._paragraph)))
+        self._paragraph = []
+        self._paragraph_length = 0
+
+    def _flush_quote(self):
+        if self._quote:
+            self.blocks.append(_block("quote", "\n".join(self._quote)))
+        self._quote = []
+
+    def _code_block(self, lines, index, fence, language):
+        """コードブロックを読み取り、閉じるフェンスの次の行番号を返す"""
+        self._flush_paragraph()
+        self._list_stack = []
+        code_lines = []
+        while index < len(lines) and lines[index].strip() != fence:
+            code_lines.append(lines[index])
+            index += 1
+
+        items = []
+        _append_text(items, "\n".join(code_lines))
+        language = language.lower() if language.lower() in _CODE_LANGUAGES else "plain text"
+        self.blocks.append({
+            "object": "block",
+            "type": "code",
+            "code": {"rich_text": _limit_rich_text(items), "language": language}
+        })
+        return index + 1
+
+    def _list_item(self, item):
+        text = item.group('text')
+        if item.group('number') is not None:
+            block = _block("numbered_list_item", text)
+        else:
+            todo = _TODO_PATTERN.match(text)
+            if todo:
+                block = _block("to_do", todo.group('text'), checked=todo.group('checked') in "xX")
+            else:
+                block = _block("bulleted_list_item", text)
+
+        indent = _indent_width(item.group('indent'))
+        while self._list_stack and self._list_stack[-1][0] >= indent:
+            self._list_stack.pop()
+
+        if not self._list_stack:
+            self.blocks.append(block)
+        else:
+            # APIの入れ子の上限を超える場合は上限の深さに揃える
+            parent_index = min(len(self._list_stack), MAX_NESTING_DEPTH) - 1
+            parent = self._list_stack[parent_index][1]
+            parent[parent["type"]].setdefault("children", []).append(block)
+            del self._list_stack[parent_index + 1:]
+        self._list_stack.append((indent, block))
+
+    def _append_to_list_item(self, block, line):
+        items = block[block["type"]]["rich_text"]
+        _append_text(items, "\n")
+        items.extend(rich_text(line))
+        block[block["type"]]["rich_text"] = _limit_rich_text(items)
+
+
+def _indent_width(text):
+    """インデントの幅を求める（タブは4、全角スペースは2として数える）"""
+    width = 0
+    for char in text:
+        if char == "\t":
+            width += 4
+        elif char == "　":
+            width += 2
+        elif char == " ":
+            width += 1
+        else:
+            break
+    return width
@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 
 import os
+import json
+import time
 import logging
 from datetime import datetime
-from notion_client import Client
+from app.services.client_pool import get_notion_client
+from app.services import stage_timing
+from app.services.notion_blocks import count_blocks, markdown_to_blocks
 
 # 環境変数からNotion APIキーを取得
 NOTION_API_KEY = os.environ.get("NOTION_API_KEY")
@@ -12,6 +16,15 @@ NOTION_API_KEY = os.environ.get("NOTION_API_KEY")
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
+# Notion APIの制限
+NOTION_MAX_BLOCKS_PER_REQUEST = 100  # pages.create / blocks.children.append の children 上限
+NOTION_MAX_TOTAL_BLOCKS_PER_REQUEST = 1000  # 子ブロックを含む1リクエストあたりのブロック総数の上限
+NOTION_MAX_REQUEST_BYTES = 450000  # リクエストボディ上限(500KB)に対する余裕を持たせた値
+
+# ストリーミング書き込みの設定（どちらかの条件を満たしたらまとめて追加する）
+STREAM_APPEND_BATCH_BLOCKS = int(os.environ.get('STREAM_APPEND_BATCH_BLOCKS', '10'))
+STREAM_APPEND_INTERVAL = float(os.environ.get('STREAM_APPEND_INTERVAL', '2'))
+
 def create_notion_page(title, content, notta_title, notta_creation_time, parent_page_id=None):
     """Notionページを作成して議事録を保存する
     
@@ -26,6 +39,7 @@ def create_notion_page(title, content, notta_title, notta_creation_time, parent_
         dict: 作成されたNotionページの情報
             - id: ページID
             - url: ページURL
+            - api_calls: 使用したAPI呼び出し回数
     """
     try:
         # Notion APIキーが設定されているか確認
@@ -33,8 +47,8 @@ def create_notion_page(title, content, notta_title, notta_creation_time, parent_
             logger.error("NOTION_API_KEYが設定されていません")
             raise ValueError("Notion APIキーが設定されていません")
         
-        # Notionクライアントの初期化
-        notion = Client(auth=NOTION_API_KEY)
+        # Notionクライアントの取得（接続プールを再利用）
+        notion = get_notion_client(NOTION_API_KEY)
         
         # 作成日時の整形
         formatted_date = ""
@@ -51,10 +65,7 @@ def create_notion_page(title, content, notta_title, notta_creation_time, parent_
         parent = {}
         if parent_page_id:
             # ページIDの処理: ハイフンが含まれていない場合は追加する（32文字の場合）
-            if '-' not in parent_page_id and len(parent_page_id) == 32:
-                page_id = f"{parent_page_id[0:8]}-{parent_page_id[8:12]}-{parent_page_id[12:16]}-{parent_page_id[16:20]}-{parent_page_id[20:32]}"
-            else:
-                page_id = parent_page_id
+            page_id = format_page_id(parent_page_id)
             
             logger.info(f"Notion親ページID: {page_id}")
             
@@ -73,119 +84,292 @@ def create_notion_page(title, content, notta_title, notta_creation_time, parent_
             }
         }
         
-        # 最初のメタデータブロックを定義
-        initial_blocks = [
-            {
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {
-                    "rich_text": [
-                        {
-                            "type": "text",
-                            "text": {
-                                "content": "元の録音タイトル: " + notta_title
-                            },
-                            "annotations": {"bold": True}
-                        }
-                    ]
-                }
-            },
-            {
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {
-                    "rich_text": [
-                        {
-                            "type": "text",
-                            "text": {
-                                "content": "生成日時: " + datetime.now().strftime("%Y年%m月%d日 %H:%M")
-                            }
-                        }
-                    ]
-                }
-            },
-            {
-                "object": "block",
-                "type": "divider",
-                "divider": {}
-            }
-        ]
+        # メタデータブロックと本文ブロックを作成
+        blocks = build_metadata_blocks(notta_title) + build_content_blocks(content)
         
-        # === ステップ1: Notionページの初期作成 (本文ブロックなし) ===
-        logger.info(f"Notionページの初期作成を開始... (parent: {parent})")
+        # ページ作成時にできるだけ多くのブロックを含め、残りをまとめて追加する
+        logger.info(f"Notionページの作成を開始... (parent: {parent})")
         try:
-            create_response = notion.pages.create(
-                parent=parent,
-                properties=properties,
-                children=initial_blocks # メタデータブロックのみ含める
-            )
-            
-            page_id = create_response["id"]
-            page_url = create_response.get("url", "")
-            logger.info(f"Notionページを初期作成しました (ID: {page_id}): {page_url}")
+            page = publish_page(notion, parent, properties, blocks)
         except Exception as e:
-            logger.error(f"Notionページの初期作成に失敗しました: {str(e)}")
-            # エラーの詳細を記録
+            logger.error(f"Notionページの作成に失敗しました: {str(e)}")
             logger.error(f"エラーの詳細: {type(e).__name__}, {str(e)}")
-            logger.error(f"使用したページID: {page_id if 'page_id' in locals() else parent_page_id}")
             logger.error(f"使用した親設定: {parent}")
-            
-            # 再試行せずにエラーを伝播
             raise
         
-        # === ステップ2: 議事録本文をブロックリストに変換 ===
-        content_blocks = []
-        for line in content.split("\n"):
-            if line.strip():  # 空行は無視しない（空のパラグラフにする）
-                content_blocks.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [
-                            {
-                                "type": "text",
-                                "text": {
-                                    "content": line
-                                }
-                            }
-                        ]
+        return page
+    
+    except Exception as e:
+        logger.error(f"Notionページの作成・更新処理全体でエラーが発生しました: {str(e)}")
+        raise
+
+
+def format_page_id(page_id):
+    """ページIDを整形する（ハイフンなしの32文字の場合はハイフン付きに変換）"""
+    if page_id and '-' not in page_id and len(page_id) == 32:
+        return f"{page_id[0:8]}-{page_id[8:12]}-{page_id[12:16]}-{page_id[16:20]}-{page_id[20:32]}"
+    return page_id
+
+
+def build_metadata_blocks(notta_title):
+    """議事録ページ先頭のメタデータブロック（元のタイトル・生成日時・区切り線）を作成する"""
+    return [
+        {
+            "object": "block",
+            "type": "paragraph",
+            "paragraph": {
+                "rich_text": [
+                    {
+                        "type": "text",
+                        "text": {"content": f"元の録音タイトル: {notta_title}"},
+                        "annotations": {"bold": True}
                     }
-                })
-            else:
-                # 空行の場合は空のパラグラフを追加
-                content_blocks.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": []
+                ]
+            }
+        },
+        {
+            "object": "block",
+            "type": "paragraph",
+            "paragraph": {
+                "rich_text": [
+                    {
+                        "type": "text",
+                        "text": {"content": f"生成日時: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}"}
                     }
-                })
+                ]
+            }
+        },
+        {
+            "object": "block",
+            "type": "divider",
+            "divider": {}
+        }
+    ]
+
+
+def build_content_blocks(content):
+    """議事録本文（Markdown）をNotionのブロックのリストに変換する
+
+    見出し・リスト・区切り線・太字などをNotionのネイティブなブロックに変換し、
+    連続する通常の行は rich_text の文字数上限まで1つの段落ブロックにまとめる。
+
+    Args:
+        content (str): 議事録本文
+
+    Returns:
+        list: Notionのブロックのリスト
+    """
+    return markdown_to_blocks(content)
+
+
+def _batch_blocks(blocks):
+    """ブロックをAPIの上限（ブロック数・子ブロックを含む総数・リクエストサイズ）に収まるバッチに分割する"""
+    batches = []
+    current = []
+    current_total = 0
+    current_bytes = 0
+    for block in blocks:
+        block_total = count_blocks([block])
+        block_bytes = len(json.dumps(block, ensure_ascii=False).encode('utf-8'))
+        if current and (len(current) >= NOTION_MAX_BLOCKS_PER_REQUEST
+                        or current_total + block_total > NOTION_MAX_TOTAL_BLOCKS_PER_REQUEST
+                        or current_bytes + block_bytes > NOTION_MAX_REQUEST_BYTES):
+            batches.append(current)
+            current = []
+            current_total = 0
+            current_bytes = 0
+        current.append(block)
+        current_total += block_total
+        current_bytes += block_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+
+def publish_page(notion, parent, properties, blocks):
+    """ブロックをできるだけ少ないAPI呼び出しでNotionページとして作成する
+
+    最初のバッチを pages.create に含め、残りのバッチを blocks.children.append で追加する。
+
+    Args:
+        notion (Client): Notionクライアント
+        parent (dict): 親の指定 (例: {"page_id": "..."})
+        properties (dict): ページのプロパティ
+        blocks (list): ページに含めるブロック
+
+    Returns:
+        dict: 作成されたNotionページの情報
+            - id: ページID
+            - url: ページURL
+            - api_calls: 使用したAPI呼び出し回数
+    """
+    batches = _batch_blocks(blocks) or [[]]
+    
+    with stage_timing.span("notion.pages.create"):
+        create_response = notion.pages.create(
+            parent=parent,
+            properties=properties,
+            children=batches[0]
+        )
+    page_id = create_response["id"]
+    page_url = create_response.get("url", "")
+    logger.info(f"Notionページを作成しました (ID: {page_id}, ブロック数: {len(batches[0])}): {page_url}")
+    
+    for i, batch in enumerate(batches[1:], start=2):
+        logger.info(f"本文ブロック {i}/{len(batches)} を追加中... ({len(batch)}ブロック)")
+        with stage_timing.span("notion.blocks.append"):
+            notion.blocks.children.append(
+                block_id=page_id,
+                children=batch
+            )
+    
+    logger.info(f"Notionページの作成が完了しました (ブロック数: {len(blocks)}, API呼び出し回数: {len(batches)})")
+    return {
+        "id": page_id,
+        "url": page_url,
+        "api_calls": len(batches)
+    }
+
+
+async def apublish_page(notion, parent, properties, blocks):
+    """ブロックをできるだけ少ないAPI呼び出しでNotionページとして作成する（非同期版）
+
+    Args:
+        notion (AsyncClient): Notionの非同期クライアント
+        その他は publish_page と同じ
+
+    Returns:
+        dict: publish_page と同じ
+    """
+    batches = _batch_blocks(blocks) or [[]]
+
+    with stage_timing.span("notion.pages.create"):
+        create_response = await notion.pages.create(
+            parent=parent,
+            properties=properties,
+            children=batches[0]
+        )
+    page_id = create_response["id"]
+    page_url = create_response.get("url", "")
+    logger.info(f"Notionページを作成しました (ID: {page_id}, ブロック数: {len(batches[0])}): {page_url}")
+
+    # ブロックの順序を保つため、追加は1バッチずつ順番に行う
+    for i, batch in enumerate(batches[1:], start=2):
+        logger.info(f"本文ブロック {i}/{len(batches)} を追加中... ({len(batch)}ブロック)")
+        with stage_timing.span("notion.blocks.append"):
+            await notion.blocks.children.append(
+                block_id=page_id,
+                children=batch
+            )
+
+    logger.info(f"Notionページの作成が完了しました (ブロック数: {len(blocks)}, API呼び出し回数: {len(batches)})")
+    return {
+        "id": page_id,
+        "url": page_url,
+        "api_calls": len(batches)
+    }
+
+
+class StreamingPagePublisher:
+    """生成中の議事録を段落単位でNotionページに書き込むパブリッシャー
+
+    最初の段落が届いた時点でページを作成し、以降の段落はブロック数または経過時間の
+    条件を満たすたびにまとめて追加する。
+    """
+    
+    def __init__(self, notion, parent, title, header_blocks=None,
+                 batch_blocks=STREAM_APPEND_BATCH_BLOCKS, interval=STREAM_APPEND_INTERVAL):
+        """
+        Args:
+            notion (Client): Notionクライアント
+            parent (dict): 親の指定 (例: {"page_id": "..."})
+            title (str): ページタイトル（生成されたタイトルが届いたら set_title で更新する）
+            header_blocks (list, optional): ページ先頭に配置するブロック
+            batch_blocks (int): まとめて追加するブロック数の目安
+            interval (float): 前回の書き込みから次の書き込みまでの最大待ち時間（秒）
+        """
+        self.notion = notion
+        self.parent = parent
+        self.title = title
+        self.batch_blocks = batch_blocks
+        self.interval = interval
+        self.page_id = None
+        self.page_url = None
+        self.api_calls = 0
+        self._pending = list(header_blocks or [])
+        self._page_title = None
+        self._last_flush = 0.0
+    
+    def set_title(self, title):
+        """ページタイトルを設定する（ページ作成後の場合は完了時に更新する）"""
+        if title:
+            self.title = title
+    
+    def add_paragraph(self, text):
+        """段落を追加する（必要に応じてページ作成・ブロック追加を行う）"""
+        self._pending.extend(build_content_blocks(text))
+        if self.page_id is None:
+            self._create_page()
+        elif (len(self._pending) >= self.batch_blocks
+              or time.monotonic() - self._last_flush >= self.interval):
+            self._flush()
+    
+    def finish(self):
+        """残りのブロックを書き込み、タイトルが変わっていれば更新する
+
+        Returns:
+            dict: 作成されたNotionページの情報 (id, url, api_calls)
+        """
+        if self.page_id is None:
+            self._create_page()
+        else:
+            self._flush()
         
-        # === ステップ3: 本文ブロックを100個ずつのチャンクで追加 ===
-        chunk_size = 100  # Notion APIの制限
-        logger.info(f"本文ブロック ({len(content_blocks)}個) の追加を開始...")
-        for i in range(0, len(content_blocks), chunk_size):
-            chunk = content_blocks[i:i + chunk_size]
-            logger.info(f"  ブロック {i+1} から {i+len(chunk)} を追加中...")
-            try:
-                append_response = notion.blocks.children.append(
-                    block_id=page_id,
-                    children=chunk
-                )
-                logger.info(f"  ブロック追加成功: {i+1} から {i+len(chunk)}")
-            except Exception as append_error:
-                logger.error(f"Notionページへのブロック追加中にエラーが発生しました: {append_error}")
-                # エラーが発生した場合でも、ページの作成自体は成功している可能性があるため、
-                # ページ情報は返しつつ、エラーを再raiseする
-                raise append_error
+        if self.title != self._page_title:
+            with stage_timing.span("notion.pages.update"):
+                self.notion.pages.update(page_id=self.page_id, properties=self._properties())
+            self.api_calls += 1
+            self._page_title = self.title
         
-        logger.info(f"全ての本文ブロックの追加が完了しました。")
-
+        logger.info(f"Notionページへのストリーミング書き込みが完了しました (API呼び出し回数: {self.api_calls}): {self.page_url}")
         return {
-            "id": page_id,
-            "url": page_url
+            "id": self.page_id,
+            "url": self.page_url,
+            "api_calls": self.api_calls
         }
     
-    except Exception as e:
-        logger.error(f"Notionページの作成・更新処理全体でエラーが発生しました: {str(e)}")
-        raise 
\ No newline at end of file
+    def _properties(self):
+        return {
+            "title": {
+                "title": [{"text": {"content": self.title}}]
+            }
+        }
+    
+    def _create_page(self):
+        """保留中のブロックを含めてページを作成する"""
+        batches = _batch_blocks(self._pending) or [[]]
+        with stage_timing.span("notion.pages.create"):
+            create_response = self.notion.pages.create(
+                parent=self.parent,
+                properties=self._properties(),
+                children=batches[0]
+            )
+        self.api_calls += 1
+        self.page_id = create_response["id"]
+        self.page_url = create_response.get("url", "")
+        self._page_title = self.title
+        self._pending = [block for batch in batches[1:] for block in batch]
+        logger.info(f"Notionページを作成しました (ストリーミング, ID: {self.page_id}): {self.page_url}")
+        self._flush()
+    
+    def _flush(self):
+        """保留中のブロックをページに追加する"""
+        for batch in _batch_blocks(self._pending):
+            with stage_timing.span("notion.blocks.append"):
+                self.notion.blocks.children.append(
+                    block_id=self.page_id,
+                    children=batch
+                )
+            self.api_calls += 1
+        self._pending = []
+        self._last_flush = time.monotonic()
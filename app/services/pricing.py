@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+モデルごとの料金表とLLM呼び出しのコストの計算
+
+料金は100万トークンあたりの米ドルで、入力（input）・キャッシュから読み込んだ入力（cached_input）・
+キャッシュへの書き込み（cache_write）・出力（output）ごとに指定する。
+cached_input・cache_write を省略した場合は input と同じ料金として計算する。
+
+MODEL_PRICING_FILE に同じ形式のJSONファイル（{"モデル名": {"input": 1.0, "output": 2.0}}）を指定すると、
+既定の料金表を上書き・追加できる。料金表にないモデルのコストは None（不明）とする。
+"""
+
+import os
+import re
+import json
+import logging
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+MODEL_PRICING_FILE = os.environ.get('MODEL_PRICING_FILE')
+
+# 既定の料金表（設定ページで選択できるモデル）
+DEFAULT_PRICING = {
+    "gemini-2.5-pro-exp-03-25": {"input": 1.25, "cached_input": 0.31, "output": 10.0},
+    "gemini-2.0-flash": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "claude-3.7-sonnet": {"input": 3.0, "cached_input": 0.30, "cache_write": 3.75, "output": 15.0},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.0},
+    "gpt-4.5-preview": {"input": 75.0, "cached_input": 37.5, "output": 150.0},
+}
+
+# 日付・バージョンの接尾辞（-20250219、-2024-08-06、-001、@20240620 など）
+_VERSION_SUFFIX = re.compile(r'[-@]\d[\d.-]*')
+
+_pricing = None
+
+
+def get_pricing():
+    """料金表を取得する（MODEL_PRICING_FILE の内容を既定の料金表に上書きしたもの）"""
+    global _pricing
+    if _pricing is None:
+        pricing = dict(DEFAULT_PRICING)
+        if MODEL_PRICING_FILE:
+            try:
+                with open(MODEL_PRICING_FILE, encoding='utf-8') as f:
+                    pricing.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.error(f"料金表を読み込めませんでした ({MODEL_PRICING_FILE}): {str(e)}")
+        _pricing = pricing
+    return _pricing
+
+
+def model_price(ai_model):
+    """モデルの料金を取得する
+
+    完全一致がない場合は、料金表のモデル名に日付・バージョンの接尾辞が付いたものとして扱う
+    （例: gpt-4o-2024-08-06 → gpt-4o。gpt-4o-mini は gpt-4o とはみなさない）。
+
+    Returns:
+        dict: 100万トークンあたりの料金（料金表にない場合はNone）
+    """
+    if not ai_model:
+        return None
+    pricing = get_pricing()
+    if ai_model in pricing:
+        return pricing[ai_model]
+    prefixes = [name for name in pricing if ai_model.startswith(name) and _VERSION_SUFFIX.fullmatch(ai_model[len(name):])]
+    return pricing[max(prefixes, key=len)] if prefixes else None
+
+
+def calculate_cost(ai_model, input_tokens=0, cached_input_tokens=0, cache_write_tokens=0, output_tokens=0):
+    """LLM呼び出しのコスト（米ドル）を計算する
+
+    Args:
+        ai_model (str): モデル名
+        input_tokens (int): 入力トークン数（キャッシュの読み書き分を含む。llm_usage と同じ）
+        cached_input_tokens (int): キャッシュから読み込んだ入力トークン数
+        cache_write_tokens (int): キャッシュに書き込んだ入力トークン数
+        output_tokens (int): 出力トークン数
+
+    Returns:
+        float: コスト（料金表にないモデルの場合はNone）
+    """
+    price = model_price(ai_model)
+    if price is None:
+        return None
+    input_price = price.get("input", 0.0)
+    uncached = max(0, (input_tokens or 0) - (cached_input_tokens or 0) - (cache_write_tokens or 0))
+    cost = (
+        uncached * input_price
+        + (cached_input_tokens or 0) * price.get("cached_input", input_price)
+        + (cache_write_tokens or 0) * price.get("cache_write", input_price)
+        + (output_tokens or 0) * price.get("output", 0.0)
+    )
+    return cost / 1_000_000
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+プロバイダー側のプロンプトキャッシュ
+
+すべての呼び出しで共通のシステムプロンプトを、プロバイダー側にキャッシュさせる。
+- Anthropic: システムプロンプトに cache_control のブレークポイントを付ける
+- Gemini: システムプロンプトを system_instruction として渡し（暗黙的キャッシュの対象になる共通の先頭部分）、
+  十分な長さがある場合は明示的なキャッシュ（CachedContent）を作成して再利用する
+
+いずれもプロバイダーごとの最小トークン数に満たないプロンプトはキャッシュされないが、エラーにはならない。
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from app.services.client_pool import get_gemini_model, load_sdk
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Geminiの明示的キャッシュの有効期間（秒）
+GEMINI_CACHE_TTL = int(os.environ.get('GEMINI_CACHE_TTL', '3600'))
+# Geminiの明示的キャッシュを作成するシステムプロンプトの最小トークン数（推定）
+GEMINI_CACHE_MIN_TOKENS = int(os.environ.get('GEMINI_CACHE_MIN_TOKENS', '1024'))
+# 有効期限の何秒前にキャッシュを作り直すか
+_GEMINI_CACHE_REFRESH_MARGIN = 60
+
+# (APIキー, モデル名, プロンプトのハッシュ) -> (キャッシュを使うモデル（作成できなかった場合はNone）, 有効期限)
+_gemini_caches = {}
+_gemini_cache_lock = None
+
+
+def anthropic_system(system_prompt):
+    """Anthropicの system パラメーターを作成する（キャッシュ有効時はブレークポイントを付ける）"""
+    if not PROMPT_CACHE_ENABLED:
+        return system_prompt
+    return [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+async def gemini_model(api_key, model_name, system_prompt):
+    """システムプロンプトをキャッシュしたGeminiモデルを取得する
+
+    明示的キャッシュを作成できない場合（プロンプトが短い、モデルが非対応など）は
+    system_instruction を指定したモデルを返す。
+
+    Args:
+        api_key (str): Google APIキー
+        model_name (str): モデル名
+        system_prompt (str): システムプロンプト（Noneの場合はシステムプロンプトなしのモデルを返す）
+
+    Returns:
+        GenerativeModel: 生成に使用するモデル
+    """
+    if not system_prompt:
+        return get_gemini_model(api_key, model_name)
+    fallback = get_gemini_model(api_key, model_name, system_instruction=system_prompt)
+    # ai_service._estimate_tokens と同じ概算
+    if not PROMPT_CACHE_ENABLED or len(system_prompt.encode('utf-8')) // 3 < GEMINI_CACHE_MIN_TOKENS:
+        return fallback
+
+    global _gemini_cache_lock
+    if _gemini_cache_lock is None:
+        _gemini_cache_lock = asyncio.Lock()
+
+    key = (api_key, model_name, hashlib.sha256(system_prompt.encode('utf-8')).hexdigest())
+    async with _gemini_cache_lock:
+        entry = _gemini_caches.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            entry = await asyncio.to_thread(_create_gemini_cache, model_name, system_prompt)
+            _gemini_caches[key] = entry
+    return entry[0] or fallback
+
+
+def _create_gemini_cache(model_name, system_prompt):
+    """Geminiの明示的キャッシュを作成する（作成できなかった場合は有効期間の間は再試行しない）"""
+    genai = load_sdk("genai")
+    expires_at = time.monotonic() + GEMINI_CACHE_TTL - _GEMINI_CACHE_REFRESH_MARGIN
+    try:
+        cached_content = genai.caching.CachedContent.create(
+            model=model_name,
+            display_name="minutes-system-prompt",
+            system_instruction=system_prompt,
+            ttl=GEMINI_CACHE_TTL
+        )
+        logger.info(f"Geminiのプロンプトキャッシュを作成しました (model: {model_name}, name: {cached_content.name})")
+        return genai.GenerativeModel.from_cached_content(cached_content), expires_at
+    except Exception as e:
+        logger.warning(f"Geminiのプロンプトキャッシュを作成できませんでした (model: {model_name}): {str(e)}")
+        return None, expires_at
@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM呼び出しの流量制御（プロバイダーのレート制限への対応）
+
+プロバイダー・モデルごとに、1分あたりのリクエスト数（RPM）と入力トークン数（TPM）の上限を
+トークンバケットで管理し、上限に達している間は呼び出しを到着順に待たせてから送信する。
+入力トークン数は呼び出し前にプロンプトの長さから推定する（ai_service._estimate_tokens）。
+
+上限は環境変数の値（プロバイダーごと）から始め、応答から調整する（AIMD）。
+- 429（レート制限）を受けた場合は上限を RATE_LIMIT_DECREASE_FACTOR 倍に下げ、
+  retry-after の間は送信を止めてから再送する（最大 RATE_LIMIT_MAX_RETRIES 回）
+- 成功するごとに上限を少しずつ（最大値の RATE_LIMIT_INCREASE_RATIO ずつ）最大値まで戻す
+- 応答のレート制限ヘッダー（Anthropic・OpenAI）に上限が含まれる場合はその値を最大値とし、
+  残りが0の場合はリセット時刻まで送信を止める
+
+状態はプロセス内に保持するため、複数のプロセス（Webプロセスと worker.py など）で生成する場合は
+プロセスごとに上限を管理する（ヘッダー・429から各プロセスが調整する）。
+async_engine のイベントループ上で使用する。
+"""
+
+import os
+import re
+import math
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from app.services import metrics, stage_timing
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 流量制御を行うかどうか（0 の場合は待たずに送信し、429の再送もSDKに任せる）
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+
+# プロバイダーごとの上限の初期値・最大値（1分あたりのリクエスト数・入力トークン数）
+GEMINI_RPM_LIMIT = int(os.environ.get('GEMINI_RPM_LIMIT', '150'))
+GEMINI_TPM_LIMIT = int(os.environ.get('GEMINI_TPM_LIMIT', '1000000'))
+ANTHROPIC_RPM_LIMIT = int(os.environ.get('ANTHROPIC_RPM_LIMIT', '50'))
+ANTHROPIC_TPM_LIMIT = int(os.environ.get('ANTHROPIC_TPM_LIMIT', '100000'))
+OPENAI_RPM_LIMIT = int(os.environ.get('OPENAI_RPM_LIMIT', '500'))
+OPENAI_TPM_LIMIT = int(os.environ.get('OPENAI_TPM_LIMIT', '300000'))
+
+# まとめて送信できる量（1分あたりの上限に対する割合）。小さいほど送信が均される
+RATE_LIMIT_BURST_RATIO = float(os.environ.get('RATE_LIMIT_BURST_RATIO', '0.2'))
+# 429を受けたときに上限に掛ける係数と、続けて下げるまでの間隔（秒）: 同時に送信した呼び出しの429で何度も下げないようにする
+RATE_LIMIT_DECREASE_FACTOR = float(os.environ.get('RATE_LIMIT_DECREASE_FACTOR', '0.5'))
+RATE_LIMIT_DECREASE_INTERVAL = float(os.environ.get('RATE_LIMIT_DECREASE_INTERVAL', '5'))
+# 成功するごとに上限を戻す量（最大値に対する割合）と、上限の下限（最大値に対する割合）
+RATE_LIMIT_INCREASE_RATIO = float(os.environ.get('RATE_LIMIT_INCREASE_RATIO', '0.02'))
+RATE_LIMIT_MIN_RATIO = float(os.environ.get('RATE_LIMIT_MIN_RATIO', '0.05'))
+# 429を受けた場合の再送回数
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get('RATE_LIMIT_MAX_RETRIES', '5'))
+# 送信を待つ時間の上限（秒）: 超える場合は RateLimitTimeout を送出する（JOB_LOCK_TIMEOUT より短くする）
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '300'))
+
+# プロバイダー -> (RPM, TPM)
+DEFAULT_LIMITS = {
+    "google_gemini": (GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT),
+    "anthropic_claude": (ANTHROPIC_RPM_LIMIT, ANTHROPIC_TPM_LIMIT),
+    "openai_chatgpt": (OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT),
+}
+
+# 上限・残り・リセット時刻のヘッダー: 種類 -> ヘッダー名の候補（先に見つかったものを使う）
+# Anthropicは入力トークン数の上限（input-tokens）を、なければ入出力の合計（tokens）を使う
+_LIMIT_HEADERS = {
+    "requests": ("anthropic-ratelimit-requests-limit", "x-ratelimit-limit-requests"),
+    "tokens": ("anthropic-ratelimit-input-tokens-limit", "anthropic-ratelimit-tokens-limit", "x-ratelimit-limit-tokens"),
+}
+_REMAINING_HEADERS = {
+    "requests": ("anthropic-ratelimit-requests-remaining", "x-ratelimit-remaining-requests"),
+    "tokens": ("anthropic-ratelimit-input-tokens-remaining", "anthropic-ratelimit-tokens-remaining",
+               "x-ratelimit-remaining-tokens"),
+}
+_RESET_HEADERS = {
+    "requests": ("anthropic-ratelimit-requests-reset", "x-ratelimit-reset-requests"),
+    "tokens": ("anthropic-ratelimit-input-tokens-reset", "anthropic-ratelimit-tokens-reset", "x-ratelimit-reset-tokens"),
+}
+
+# OpenAIのリセットまでの期間（例: 1h2m3.5s、20ms）
+_DURATION_PATTERN = re.compile(r'(?:([\d.]+)h)?(?:([\d.]+)m(?!s))?(?:([\d.]+)s)?(?:([\d.]+)ms)?')
+
+# 送信待ちの間に上限の変更（429・ヘッダー）を反映するための再確認の間隔（秒）
+_RECHECK_INTERVAL = 1.0
+
+RATE_LIMIT = metrics.Gauge(
+    "minutes_llm_rate_limit",
+    "LLM呼び出しの現在の上限（kind は requests: 1分あたりのリクエスト数、tokens: 1分あたりの入力トークン数）",
+    ("ai_provider", "ai_model", "kind")
+)
+ADMISSION_WAITING = metrics.Gauge(
+    "minutes_llm_admission_waiting",
+    "送信を待っているLLM呼び出しの数",
+    ("ai_provider", "ai_model")
+)
+RATE_LIMITED = metrics.Counter(
+    "minutes_llm_rate_limited_total",
+    "LLM呼び出しで受けた429（レート制限）の数",
+    ("ai_provider", "ai_model")
+)
+
+_current = contextvars.ContextVar("rate_limiter", default=None)
+
+
+class RateLimitTimeout(Exception):
+    """送信を待つ時間が RATE_LIMIT_MAX_WAIT を超える場合に送出する"""
+
+
+class _Bucket:
+    """1分あたりの上限を均等に補充するトークンバケット"""
+
+    def __init__(self, limit):
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.set_limit(limit)
+        self.level = self.capacity
+
+    def set_limit(self, limit):
+        self.limit = limit
+        self.rate = limit / 60.0
+        self.capacity = max(1.0, limit * RATE_LIMIT_BURST_RATIO)
+        self.level = min(self.level, self.capacity)
+
+    def refill(self, now):
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def pause(self, until):
+        """溜まっている分を空にし、until まで補充を止める（再開直後にまとめて送信しないようにする）"""
+        self.level = min(self.level, 0.0)
+        self.updated = max(self.updated, until)
+
+    def delay(self, amount):
+        """amount を取り出せるまでの時間（秒）。容量を超える量はバケットが満杯になれば取り出せる（不足分は後の補充で返す）"""
+        shortage = min(amount, self.capacity) - self.level
+        return shortage / self.rate if shortage > 0 else 0.0
+
+
+class AdmissionController:
+    """1つのプロバイダー・モデルへの送信を上限の範囲に制御する"""
+
+    def __init__(self, ai_provider, ai_model, rpm, tpm):
+        self.ai_provider = ai_provider
+        self.ai_model = ai_model
+        self.ceilings = {"requests": rpm, "tokens": tpm}
+        self.buckets = {"requests": _Bucket(rpm), "tokens": _Bucket(tpm)}
+        self.blocked_until = 0.0
+        self._last_decrease = -math.inf
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def limits(self):
+        """現在の上限（種類 -> 1分あたりの値）"""
+        return {kind: bucket.limit for kind, bucket in self.buckets.items()}
+
+    async def acquire(self, tokens, max_wait=RATE_LIMIT_MAX_WAIT):
+        """上限の範囲で送信できるまで到着順に待つ
+
+        Args:
+            tokens (int): 推定入力トークン数
+            max_wait (float): 待つ時間の上限（秒）
+
+        Returns:
+            float: 待った時間（秒）
+        """
+        started = time.monotonic()
+        deadline = started + max_wait
+        turn = asyncio.Event()
+        with self._lock:
+            self._waiters.append(turn)
+            if self._waiters[0] is turn:
+                turn.set()
+        ADMISSION_WAITING.inc(ai_provider=self.ai_provider, ai_model=self.ai_model)
+        try:
+            # 先に待っている呼び出しが送信するまで待つ（順番を守り、大きな呼び出しが後続に追い越され続けないようにする）
+            try:
+                await asyncio.wait_for(turn.wait(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._timeout(max_wait) from None
+            while True:
+                with self._lock:
+                    delay = self._reserve(tokens)
+                if delay <= 0:
+                    return time.monotonic() - started
+                if time.monotonic() + delay > deadline:
+                    raise self._timeout(max_wait)
+                await asyncio.sleep(min(delay, _RECHECK_INTERVAL))
+        finally:
+            ADMISSION_WAITING.dec(ai_provider=self.ai_provider, ai_model=self.ai_model)
+            with self._lock:
+                head = self._waiters[0] is turn
+                self._waiters.remove(turn)
+                if head and self._waiters:
+                    self._waiters[0].set()
+
+    def on_success(self):
+        """呼び出しが成功した場合に上限を少し戻す（加算的増加）"""
+        with self._lock:
+            for kind, bucket in self.buckets.items():
+                ceiling = self.ceilings[kind]
+                if bucket.limit < ceiling:
+                    bucket.set_limit(min(ceiling, bucket.limit + ceiling * RATE_LIMIT_INCREASE_RATIO))
+        self._publish()
+
+    def on_rate_limited(self, retry_after=None):
+        """429を受けた場合に上限を下げ（乗算的減少）、retry_after（秒）の間は送信を止める"""
+        RATE_LIMITED.inc(ai_provider=self.ai_provider, ai_model=self.ai_model)
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            for bucket in self.buckets.values():
+                bucket.refill(now)
+                bucket.pause(self.blocked_until)
+            # 送信済みの呼び出しの429が続けて返っても、一度の超過として扱う
+            if now - self._last_decrease < RATE_LIMIT_DECREASE_INTERVAL:
+                return
+            self._last_decrease = now
+            for kind, bucket in self.buckets.items():
+                floor = self.ceilings[kind] * RATE_LIMIT_MIN_RATIO
+                bucket.set_limit(max(floor, bucket.limit * RATE_LIMIT_DECREASE_FACTOR))
+            limits = self.limits
+        logger.warning(
+            f"{self.ai_provider} ({self.ai_model}) でレート制限を受けたため、上限を "
+            f"{limits['requests']:.0f} リクエスト/分・{limits['tokens']:.0f} トークン/分に下げます"
+        )
+        self._publish()
+
+    def observe_headers(self, headers):
+        """応答のレート制限ヘッダーから上限の最大値と、残りが0の場合の送信の停止時刻を反映する"""
+        with self._lock:
+            now = time.monotonic()
+            for kind, bucket in self.buckets.items():
+                limit = _header_number(headers, _LIMIT_HEADERS[kind])
+                if limit and limit != self.ceilings[kind]:
+                    self.ceilings[kind] = limit
+                    if bucket.limit > limit:
+                        bucket.set_limit(limit)
+                if _header_number(headers, _REMAINING_HEADERS[kind]) == 0:
+                    reset = _parse_reset(_header(headers, _RESET_HEADERS[kind]))
+                    if reset:
+                        self.blocked_until = max(self.blocked_until, now + reset)
+                        bucket.refill(now)
+                        bucket.pause(now + reset)
+        self._publish()
+
+    def _reserve(self, tokens):
+        """送信できる場合は上限から差し引いて0を、できない場合は送信できるまでの時間（秒）を返す"""
+        now = time.monotonic()
+        delay = self.blocked_until - now
+        amounts = {"requests": 1, "tokens": tokens}
+        for kind, bucket in self.buckets.items():
+            bucket.refill(now)
+            delay = max(delay, bucket.delay(amounts[kind]))
+        if delay > 0:
+            return delay
+        for kind, bucket in self.buckets.items():
+            bucket.level -= amounts[kind]
+        return 0.0
+
+    def _timeout(self, max_wait):
+        return RateLimitTimeout(
+            f"{self.ai_provider} ({self.ai_model}) のレート制限のため、{max_wait:.0f} 秒以内に送信できませんでした"
+        )
+
+    def _publish(self):
+        for kind, limit in self.limits.items():
+            RATE_LIMIT.set(round(limit), ai_provider=self.ai_provider, ai_model=self.ai_model, kind=kind)
+
+
+class _Call:
+    """流量制御下の1回の呼び出し（応答のフックに制御の対象を渡す）"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.rate_limited = False
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(ai_provider, ai_model):
+    """プロバイダー・モデルの流量制御を取得する（初回は DEFAULT_LIMITS の上限で作成する）"""
+    key = (ai_provider, ai_model)
+    with _controllers_lock:
+        controller = _controllers.get(key)
+        if controller is None:
+            rpm, tpm = DEFAULT_LIMITS.get(ai_provider, DEFAULT_LIMITS["openai_chatgpt"])
+            controller = _controllers[key] = AdmissionController(ai_provider, ai_model, rpm, tpm)
+        return controller
+
+
+def request_tokens(ai_provider, input_tokens, max_tokens=None):
+    """上限の計算に使うトークン数
+
+    OpenAIは入力トークン数に max_tokens を加えた値を上限の計算に使うため、OpenAIのみ max_tokens を加える。
+    """
+    if ai_provider == "openai_chatgpt" and max_tokens:
+        return input_tokens + max_tokens
+    return input_tokens
+
+
+async def run(ai_provider, ai_model, tokens, factory):
+    """上限の範囲で送信できるまで待ってから呼び出し、429の場合は上限を下げて再送する
+
+    Args:
+        ai_provider (str): プロバイダー
+        ai_model (str): モデル
+        tokens (int): 上限の計算に使うトークン数（request_tokens の値）
+        factory (callable): 呼び出しのコルーチンを返す関数（再送のたびに呼び出す）
+
+    Returns:
+        factory のコルーチンの結果
+    """
+    if not RATE_LIMIT_ENABLED:
+        return await factory()
+    controller = get_controller(ai_provider, ai_model)
+    attempt = 0
+    while True:
+        await _admit(controller, tokens)
+        call = _Call(controller)
+        token = _current.set(call)
+        try:
+            result = await factory()
+        except Exception as e:
+            if not _handle_rate_limited(call, e, attempt):
+                raise
+            attempt += 1
+            continue
+        finally:
+            _current.reset(token)
+        controller.on_success()
+        return result
+
+
+async def stream(ai_provider, ai_model, tokens, factory):
+    """上限の範囲で送信できるまで待ってからストリーミング生成を開始する（run のストリーミング版）
+
+    最初の断片を受け取るまでに429を受けた場合は再送する（以降のエラーはそのまま送出する）。
+
+    Args:
+        run と同じ（factory は非同期ジェネレーターを返す関数）
+
+    Yields:
+        factory の非同期ジェネレーターの値
+    """
+    if not RATE_LIMIT_ENABLED:
+        async for item in factory():
+            yield item
+        return
+    controller = get_controller(ai_provider, ai_model)
+    attempt = 0
+    while True:
+        await _admit(controller, tokens)
+        call = _Call(controller)
+        generator = factory()
+        token = _current.set(call)
+        try:
+            first = await generator.__anext__()
+        except StopAsyncIteration:
+            controller.on_success()
+            return
+        except Exception as e:
+            await generator.aclose()
+            if not _handle_rate_limited(call, e, attempt):
+                raise
+            attempt += 1
+            continue
+        finally:
+            _current.reset(token)
+        break
+
+    controller.on_success()
+    try:
+        yield first
+        async for item in generator:
+            yield item
+    finally:
+        await generator.aclose()
+
+
+async def observe_response(response):
+    """HTTPクライアントの応答フック: 流量制御下の呼び出しの応答からレート制限の状態を反映する
+
+    SDKが内部で再送した応答も含めて反映する（client_pool で Anthropic・OpenAIのクライアントに登録する）。
+    """
+    call = _current.get()
+    if call is None:
+        return
+    call.controller.observe_headers(response.headers)
+    if response.status_code == 429:
+        call.rate_limited = True
+        call.controller.on_rate_limited(_retry_after(response.headers))
+
+
+async def _admit(controller, tokens):
+    with stage_timing.span("llm.admission", controller.ai_provider, controller.ai_model):
+        waited = await controller.acquire(tokens)
+    if waited >= 1:
+        logger.info(f"{controller.ai_provider} ({controller.ai_model}) のレート制限のため {waited:.1f} 秒待って送信します")
+
+
+def _handle_rate_limited(call, error, attempt):
+    """429のエラーであれば上限に反映して True（再送する）を返す"""
+    if not _is_rate_limited(error) or attempt >= RATE_LIMIT_MAX_RETRIES:
+        return False
+    if not call.rate_limited:
+        # 応答フックで反映していない場合（Geminiなど）はエラーから反映する
+        response = getattr(error, "response", None)
+        call.controller.on_rate_limited(_retry_after(getattr(response, "headers", None)))
+    logger.warning(
+        f"{call.controller.ai_provider} ({call.controller.ai_model}) でレート制限を受けたため再送します "
+        f"({attempt + 1}/{RATE_LIMIT_MAX_RETRIES})"
+    )
+    return True
+
+
+def _is_rate_limited(error):
+    """429（レート制限）のエラーかどうか（Anthropic・OpenAIは status_code、Geminiは code が429）"""
+    for name in ("status_code", "code"):
+        if getattr(error, name, None) == 429:
+            return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def _header(headers, names):
+    if not headers:
+        return None
+    for name in names:
+        value = headers.get(name)
+        if value:
+            return value
+    return None
+
+
+def _header_number(headers, names):
+    value = _header(headers, names)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _retry_after(headers):
+    """retry-after-ms / retry-after ヘッダーの待ち時間（秒）"""
+    milliseconds = _header_number(headers, ("retry-after-ms",))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    value = _header(headers, ("retry-after",))
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_reset(value):
+    """リセット時刻のヘッダーをリセットまでの秒数に変換する
+
+    OpenAIは期間（例: 1s、6m0s、20ms）、AnthropicはRFC 3339の時刻（例: 2025-01-01T00:00:30Z）で返す。
+    """
+    if not value:
+        return None
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if reset_at.tzinfo is not None:
+            return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    except ValueError:
+        pass
+    match = _DURATION_PATTERN.fullmatch(value.strip())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds, milliseconds = (float(group or 0) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+アプリケーション設定 (Settings) のプロセス内キャッシュ
+
+設定は1行だけのテーブルでほとんど変更されないため、読み込んだ内容をプロセス内に保持する。
+設定の保存時に version を1増やし、キャッシュを持つ各プロセスは version カラムだけを
+主キーで取得して比較することで、変更があった場合のみ行全体を読み直す。
+"""
+
+import os
+import time
+import threading
+from types import SimpleNamespace
+from app import db
+from app.models import Settings
+
+# version を確認する間隔（秒）: この間は別プロセスでの変更を確認せずにキャッシュを返す
+SETTINGS_VERSION_CHECK_INTERVAL = float(os.environ.get('SETTINGS_VERSION_CHECK_INTERVAL', '2'))
+
+# キャッシュした設定と、最後に version を確認した時刻
+_snapshot = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_settings():
+    """キャッシュした設定を取得する（設定がなければデフォルト設定を作成する）
+
+    返り値はセッションに属さない読み取り専用のスナップショットのため、
+    設定を変更する場合は Settings モデルを直接取得して bump_version() を呼ぶこと。
+
+    Returns:
+        SimpleNamespace: Settings.to_dict() の各項目を属性に持つスナップショット
+    """
+    global _snapshot, _checked_at
+
+    now = time.monotonic()
+    with _lock:
+        snapshot = _snapshot
+        checked_at = _checked_at
+
+    if snapshot is not None:
+        if now - checked_at < SETTINGS_VERSION_CHECK_INTERVAL:
+            return snapshot
+
+        # 別プロセスで変更されていないか version だけを確認する
+        version = db.session.query(Settings.version).filter(Settings.id == snapshot.id).scalar()
+        if version == snapshot.version:
+            with _lock:
+                _checked_at = now
+            return snapshot
+
+    settings = Settings.query.first()
+    if settings is None:
+        settings = Settings()
+        db.session.add(settings)
+        db.session.commit()
+        print("デフォルト設定を初期化しました。")
+
+    snapshot = SimpleNamespace(**settings.to_dict())
+    with _lock:
+        _snapshot = snapshot
+        _checked_at = now
+    return snapshot
+
+
+def bump_version(settings):
+    """設定の変更を他のプロセスに知らせるため version を1増やす（コミットは呼び出し側で行う）
+
+    同時に保存された場合も同じ version にならないよう、加算はSQLで行う。
+
+    Args:
+        settings (Settings): 変更する Settings モデル
+
+    Returns:
+        int: 増やした後の version
+    """
+    db.session.flush()
+    Settings.query.filter_by(id=settings.id).update(
+        {Settings.version: db.func.coalesce(Settings.version, 0) + 1}, synchronize_session=False
+    )
+    db.session.refresh(settings, ["version"])
+    return settings.version
+
+
+def invalidate():
+    """このプロセスのキャッシュを破棄する（次回の get_settings() で読み直す）"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+議事録生成の処理段階ごとの時間の計測
+
+処理段階（データベースの読み書き、議事録・タイトルの生成、Notionのページ作成・ブロック追加など）を
+span() で囲むと、所要時間をメトリクス（minutes_stage_duration_seconds）に記録し、
+recording() の中であればジョブごとの記録（JobQueue.spans に保存する）にも追加する。
+集計先はコンテキスト変数で受け渡すため、イベントループ上のタスクやスレッドで実行する処理も
+同じジョブの記録として集計される。
+"""
+
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from app.services import metrics
+
+_current = contextvars.ContextVar("stage_timing", default=None)
+
+
+class SpanRecorder:
+    """1件のジョブの処理段階ごとの時間を記録する"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, started, duration, outcome="ok", ai_provider=None, ai_model=None):
+        """1つの処理段階の時間を追加する（started は time.monotonic() の値）"""
+        span = {
+            "stage": stage,
+            "start_ms": int((started - self.started) * 1000),
+            "duration_ms": int(duration * 1000),
+            "outcome": outcome,
+        }
+        if ai_provider:
+            span["ai_provider"] = ai_provider
+        if ai_model:
+            span["ai_model"] = ai_model
+        with self._lock:
+            self.spans.append(span)
+
+    def to_list(self):
+        """記録を開始時刻の順に並べたリストを返す"""
+        with self._lock:
+            return sorted(self.spans, key=lambda span: span["start_ms"])
+
+
+@contextmanager
+def recording():
+    """このブロック内（およびそこから作成したタスク・スレッド）の処理段階の時間を記録する
+
+    Yields:
+        SpanRecorder: 記録先
+    """
+    recorder = SpanRecorder()
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage, ai_provider=None, ai_model=None):
+    """ブロックの所要時間を処理段階の時間として記録する
+
+    例外で終了した場合は outcome を error（キャンセルされた場合は cancelled）として記録する。
+
+    Args:
+        stage (str): 処理段階の名前（例: llm.minutes, notion.pages.create）
+        ai_provider (str, optional): LLMの呼び出しの場合はプロバイダー
+        ai_model (str, optional): LLMの呼び出しの場合はモデル
+    """
+    started = time.monotonic()
+    outcome = "ok"
+    try:
+        yield
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.monotonic() - started
+        metrics.STAGE_DURATION.observe(
+            duration, stage=stage, ai_provider=ai_provider, ai_model=ai_model, outcome=outcome
+        )
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.add(stage, started, duration, outcome, ai_provider, ai_model)
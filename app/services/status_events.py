@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+議事録の処理状態の変化をブラウザへ配信する（Server-Sent Events）
+
+接続中のクライアント数に関係なく、プロセスごとに1つのスレッドが
+MinutesHistory.updated_at のインデックスを使って変更のあったレコードだけを取得し、
+全購読者のキューに配信する。同一プロセス内のコミットは即座にスレッドを起こし、
+別プロセスのワーカー (worker.py) による変更はポーリング間隔以内に検出する。
+"""
+
+import os
+import json
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session, load_only
+from app import db
+from app.models import MinutesHistory
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 変更を検出するポーリング間隔（秒）
+STATUS_POLL_INTERVAL = float(os.environ.get('STATUS_POLL_INTERVAL', '1'))
+
+# コミットの遅延による取りこぼしを防ぐため、前回の検出位置から遡って確認する時間（秒）
+STATUS_POLL_OVERLAP = float(os.environ.get('STATUS_POLL_OVERLAP', '5'))
+
+# 接続を維持するためのコメントを送る間隔（秒）
+STATUS_STREAM_KEEPALIVE = float(os.environ.get('STATUS_STREAM_KEEPALIVE', '15'))
+
+# 1回の接続の最大時間（秒）: gunicorn のワーカータイムアウト（デフォルト: 30秒）より短くし、ブラウザに再接続させる
+STATUS_STREAM_MAX_DURATION = float(os.environ.get('STATUS_STREAM_MAX_DURATION', '25'))
+
+# ステータス配信を使用するかどうか（auto: サーバーレス環境とスレッドを使わないワーカーでは使用しない、1: 常に使用する、0: 使用しない）
+STATUS_STREAM = os.environ.get('STATUS_STREAM', 'auto').lower()
+
+# 1回のポーリングで取得する最大件数
+STATUS_POLL_BATCH_SIZE = 500
+
+# 購読者ごとのキューの上限（受信が追いつかないクライアントの分は破棄する）
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# 配信対象のカラム（raw_data などの大きなカラムは読み込まない）
+_PAYLOAD_COLUMNS = (
+    MinutesHistory.id,
+    MinutesHistory.status,
+    MinutesHistory.notta_title,
+    MinutesHistory.generated_title,
+    MinutesHistory.received_at,
+    MinutesHistory.processed_at,
+    MinutesHistory.notion_page_url,
+    MinutesHistory.ai_provider,
+    MinutesHistory.ai_model,
+    MinutesHistory.updated_at,
+)
+
+# 同一プロセス内での変更をポーリングスレッドに即座に知らせるためのイベント
+_changed_event = threading.Event()
+
+# コミット時に通知するかどうかを記録する Session.info のキー
+_SESSION_FLAG = "minutes_history_changed"
+
+
+def notify_status_changed():
+    """同一プロセス内のポーリングスレッドを起こす"""
+    _changed_event.set()
+
+
+def status_payload(history):
+    """配信用のステータス情報を作成する
+
+    Args:
+        history (MinutesHistory): 履歴レコード
+
+    Returns:
+        dict: ステータス情報
+    """
+    return {
+        "id": history.id,
+        "status": history.status,
+        "notta_title": history.notta_title,
+        "generated_title": history.generated_title,
+        "received_at": history.received_at.isoformat() if history.received_at else None,
+        "processed_at": history.processed_at.isoformat() if history.processed_at else None,
+        "notion_page_url": history.notion_page_url,
+        "ai_provider": history.ai_provider,
+        "ai_model": history.ai_model,
+        "updated_at": history.updated_at.isoformat() if history.updated_at else None,
+    }
+
+
+def fetch_changes(since, limit=STATUS_POLL_BATCH_SIZE):
+    """指定日時以降に更新されたレコードのステータス情報を取得する
+
+    Args:
+        since (datetime): この日時以降に更新されたレコードを取得する
+        limit (int): 最大件数
+
+    Returns:
+        list: ステータス情報のリスト（更新日時の昇順）
+    """
+    histories = (
+        MinutesHistory.query
+        .options(load_only(*_PAYLOAD_COLUMNS))
+        .filter(MinutesHistory.updated_at >= since)
+        .order_by(MinutesHistory.updated_at, MinutesHistory.id)
+        .limit(limit)
+        .all()
+    )
+    return [status_payload(history) for history in histories]
+
+
+def format_event(payload):
+    """ステータス情報を SSE のイベント形式に変換する（id は再接続時の Last-Event-ID に使われる）"""
+    return (
+        f"id: {payload['updated_at'] or ''}\n"
+        "event: status\n"
+        f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    )
+
+
+def stream_available(environ):
+    """このリクエストを処理しているサーバーでステータス配信を使用できるかどうか
+
+    接続を保持し続けるため、Vercel（関数の実行時間の上限まで実行され続ける）と
+    gunicorn の sync ワーカーなどスレッドを使わないサーバー（接続中は他のリクエストを処理できない）では
+    使用せず、ブラウザは /api/status のポーリングで状態を更新する。
+
+    Args:
+        environ (dict): リクエストのWSGI環境変数
+
+    Returns:
+        bool: ステータス配信を使用できるかどうか
+    """
+    if STATUS_STREAM in ("1", "true", "on"):
+        return True
+    if STATUS_STREAM in ("0", "false", "off") or os.environ.get('VERCEL'):
+        return False
+    return bool(environ.get('wsgi.multithread'))
+
+
+def parse_event_id(value):
+    """Last-Event-ID（または since パラメータ）を日時に変換する（不正な値の場合はNone）"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class StatusBroadcaster:
+    """変更のあったレコードを1つのスレッドで検出し、全購読者に配信する"""
+
+    def __init__(self, app, poll_interval=STATUS_POLL_INTERVAL, overlap=STATUS_POLL_OVERLAP):
+        """
+        Args:
+            app (Flask): アプリケーションコンテキストを作成するためのFlaskアプリ
+            poll_interval (float): ポーリング間隔（秒）
+            overlap (float): 前回の検出位置から遡って確認する時間（秒）
+        """
+        self.app = app
+        self.poll_interval = poll_interval
+        self.overlap = timedelta(seconds=overlap)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        """購読を開始する（ポーリングスレッドが停止していれば起動する）
+
+        Returns:
+            queue.Queue: ステータス情報が届くキュー
+        """
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-broadcaster", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """購読を終了する（購読者がいなくなるとポーリングスレッドは停止する）"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        """購読者数を取得する"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, subscription, backlog=(), keepalive=STATUS_STREAM_KEEPALIVE,
+               max_duration=STATUS_STREAM_MAX_DURATION):
+        """SSEのレスポンスボディを生成する
+
+        Args:
+            subscription (queue.Queue): subscribe() で取得したキュー
+            backlog (list): 接続時点で未配信のステータス情報
+            keepalive (float): キープアライブの送信間隔（秒）
+            max_duration (float): 接続の最大時間（秒）
+
+        Yields:
+            str: SSEのイベント
+        """
+        try:
+            yield f"retry: {int(self.poll_interval * 3000)}\n\n"
+            for payload in backlog:
+                yield format_event(payload)
+
+            deadline = datetime.utcnow() + timedelta(seconds=max_duration)
+            while datetime.utcnow() < deadline:
+                try:
+                    payload = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(payload)
+        finally:
+            self.unsubscribe(subscription)
+
+    def _publish(self, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(payload)
+            except queue.Full:
+                logger.warning("ステータス配信のキューが一杯のため、イベントを破棄しました")
+
+    def _run(self):
+        """ポーリングスレッドのメインループ"""
+        cursor = datetime.utcnow()
+        # 遡って確認する範囲内で配信済みのレコード: id -> updated_at
+        sent = {}
+
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+
+            try:
+                with self.app.app_context():
+                    try:
+                        changes = fetch_changes(cursor - self.overlap)
+                    finally:
+                        db.session.remove()
+
+                for payload in changes:
+                    if sent.get(payload["id"]) == payload["updated_at"]:
+                        continue
+                    sent[payload["id"]] = payload["updated_at"]
+                    self._publish(payload)
+
+                if changes:
+                    cursor = max(cursor, datetime.fromisoformat(changes[-1]["updated_at"]))
+                threshold = cursor - self.overlap
+                sent = {
+                    key: value for key, value in sent.items()
+                    if datetime.fromisoformat(value) >= threshold
+                }
+            except Exception as e:
+                logger.error(f"ステータス変更の取得中にエラーが発生しました: {str(e)}", exc_info=True)
+
+            _changed_event.wait(self.poll_interval)
+            _changed_event.clear()
+
+
+def _after_flush(session, flush_context):
+    """MinutesHistory が追加・更新された場合に、コミット時の通知を予約する"""
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, MinutesHistory):
+            session.info[_SESSION_FLAG] = True
+            return
+
+
+def _after_commit(session):
+    if session.info.pop(_SESSION_FLAG, False):
+        notify_status_changed()
+
+
+def _after_rollback(session):
+    session.info.pop(_SESSION_FLAG, None)
+
+
+def init_app(app):
+    """ステータス配信を初期化する
+
+    Args:
+        app (Flask): Flaskアプリ
+
+    Returns:
+        StatusBroadcaster: 作成した配信オブジェクト
+    """
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+
+    broadcaster = StatusBroadcaster(app)
+    app.extensions['status_broadcaster'] = broadcaster
+    return broadcaster
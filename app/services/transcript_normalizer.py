@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文字起こしの正規化・圧縮
+
+Nottaの文字起こしをプロンプトに入れる前に整形し、入力トークン数を減らす。
+- 発言ごとのタイムスタンプ（「話者1 00:01:23」の見出し行、「[00:01:23]」など）を削除する
+- 連続する同じ話者の発言を1つにまとめ、「話者: 発言」の1行にする
+- 「えー」「あのー」などのフィラーを削除する
+- 空白・空行をまとめる
+- （オプション）直前と同じ文・句の繰り返しを削除する
+"""
+
+import re
+
+# フィラー（長いものから順に照合する）。「あの件」などを削除しないよう、
+# 直後が読点・空白・文末の場合のみフィラーとして扱う
+FILLER_WORDS = (
+    "えーっと", "えーと", "えっと", "ええと", "えー", "あのー", "あの", "そのー",
+    "まあ", "まぁ", "うーん", "んー", "あー",
+)
+
+_TIMESTAMP = r'[\[(（]?\d{1,2}:\d{2}(?::\d{2})?[\])）]?'
+
+# 「話者1 00:01:23」のような発言の見出し行（話者名は _is_speaker で判定する。
+# 「次回の定例は 14:00」のような発言を見出しとして削除しないため）
+_HEADER_LINE_PATTERN = re.compile(r'^(?P<speaker>\S.{0,40}?)\s+' + _TIMESTAMP + r'\s*$')
+# タイムスタンプだけの行
+_TIMESTAMP_LINE_PATTERN = re.compile(r'^\s*' + _TIMESTAMP + r'\s*$')
+# 行頭の括弧付きタイムスタンプ（「[00:01:23] 発言」）
+_LEADING_TIMESTAMP_PATTERN = re.compile(r'^\s*[\[(（]\d{1,2}:\d{2}(?::\d{2})?[\])）]\s*')
+# 「話者: 発言」形式の行（話者名は speakers に含まれるもの、または「話者1」「Speaker 1」形式のみ対象とする）
+_INLINE_SPEAKER_PATTERN = re.compile(r'^(?P<speaker>[^:：\n]{1,40}?)\s*[:：]\s*(?P<text>.*)$')
+_GENERIC_SPEAKER_PATTERN = re.compile(r'^(?:話者|スピーカー|Speaker)\s*\d+$', re.IGNORECASE)
+
+_FILLER_PATTERN = re.compile(
+    r'(?:^|(?<=[\s、。！？!?]))(?:' + '|'.join(FILLER_WORDS) + r')[ーぇ～〜]*'
+    r'(?:[、,，]\s*|\s+|(?=[。！？!?])|$)'
+)
+_WHITESPACE_PATTERN = re.compile(r'[ \t　]+')
+# 1行分（str.splitlines と同じ改行文字で区切る。空行は処理しないため対象外）
+_LINE_PATTERN = re.compile(r'[^\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]+')
+# 繰り返しの判定単位（文・読点で区切った句）
+_PHRASE_SPLIT_PATTERN = re.compile(r'(?<=[、。！？!?])')
+# フィラーの削除で残った句読点だけの文
+_EMPTY_SENTENCE_PATTERN = re.compile(r'(?:^|(?<=[。！？!?]))\s*[、。]+')
+
+
+def normalize(content, speakers=None, strip_fillers=True, dedupe=False):
+    """文字起こしを正規化・圧縮する
+
+    Args:
+        content (str): 文字起こしの内容
+        speakers (list, optional): 話者名のリスト（「話者名: 発言」形式の行の判定に使用する）
+        strip_fillers (bool): フィラーを削除するかどうか
+        dedupe (bool): 直前と同じ文・句の繰り返しを削除するかどうか
+
+    Returns:
+        str: 正規化した文字起こし
+    """
+    if not content:
+        return content or ""
+
+    known_speakers = {
+        speaker.strip() for speaker in (speakers or []) if isinstance(speaker, str) and speaker.strip()
+    }
+    lines = []
+    turn_speaker, turn_texts = None, None  # まとめている途中の発言（話者名またはNone, [発言の行]）
+    current_speaker = None
+
+    # 全行のリストは作らず、1行ずつ処理する
+    for match in _LINE_PATTERN.finditer(content):
+        line = _WHITESPACE_PATTERN.sub(" ", match.group()).strip()
+        if not line or _TIMESTAMP_LINE_PATTERN.match(line):
+            continue
+
+        header = _HEADER_LINE_PATTERN.match(line)
+        if header and _is_speaker(header.group('speaker').strip(), known_speakers):
+            current_speaker = header.group('speaker').strip()
+            continue
+
+        line = _LEADING_TIMESTAMP_PATTERN.sub("", line)
+        inline = _INLINE_SPEAKER_PATTERN.match(line)
+        if inline and _is_speaker(inline.group('speaker').strip(), known_speakers):
+            current_speaker = inline.group('speaker').strip()
+            line = inline.group('text')
+
+        text = _clean_text(line, strip_fillers, dedupe)
+        if not text:
+            continue
+        # 連続する同じ話者の発言は1つにまとめる（話者が変わった時点で前の話者の発言を1行にする）
+        if turn_texts is not None and turn_speaker == current_speaker:
+            turn_texts.append(text)
+        else:
+            if turn_texts is not None:
+                lines.append(_format_turn(turn_speaker, turn_texts, dedupe))
+            turn_speaker, turn_texts = current_speaker, [text]
+
+    if turn_texts is not None:
+        lines.append(_format_turn(turn_speaker, turn_texts, dedupe))
+    return "\n".join(lines)
+
+
+def normalize_or_keep(content, speakers=None, strip_fillers=True, dedupe=False):
+    """文字起こしを正規化する（正規化で内容が空になる場合は元の内容を返す）
+
+    フィラーだけの文字起こしなどが空になり、空の内容から議事録が生成されるのを防ぐ。
+
+    Args:
+        normalize と同じ
+
+    Returns:
+        tuple: (文字起こし, 正規化した結果を使用したかどうか)
+    """
+    normalized = normalize(content, speakers, strip_fillers, dedupe)
+    if not normalized.strip() and content and content.strip():
+        return content, False
+    return normalized, True
+
+
+def _format_turn(speaker, texts, dedupe):
+    """同じ話者の連続する発言を「話者: 発言」の1行にする"""
+    text = _join_texts(texts)
+    if dedupe:
+        text = _dedupe_phrases(text)
+    return f"{speaker}: {text}" if speaker else text
+
+
+def _is_speaker(name, known_speakers):
+    return name in known_speakers or bool(_GENERIC_SPEAKER_PATTERN.match(name))
+
+
+def _clean_text(text, strip_fillers, dedupe):
+    """1行分の発言からフィラーなどを取り除く"""
+    if strip_fillers:
+        text = _FILLER_PATTERN.sub("", text)
+        text = _EMPTY_SENTENCE_PATTERN.sub("", text)
+    if dedupe:
+        text = _dedupe_phrases(text)
+    return text.strip()
+
+
+def _join_texts(texts):
+    """同じ話者の発言をつなげる（文末記号で終わっていない場合は空白で区切る）"""
+    joined = texts[0]
+    for text in texts[1:]:
+        joined += text if joined.endswith(("。", "！", "？", "!", "?", "、")) else " " + text
+    return joined
+
+
+def _dedupe_phrases(text):
+    """直前と同じ文・句の繰り返しを削除する（「はい。はい。はい。」→「はい。」）"""
+    phrases = []
+    for phrase in _PHRASE_SPLIT_PATTERN.split(text):
+        if phrase and (not phrases or phrase.strip() != phrases[-1].strip()):
+            phrases.append(phrase)
+    return "".join(phrases)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Webhookで受信した元データ（文字起こし全文を含むJSON）の圧縮・展開
+
+zstandard パッケージがインストールされていれば zstd、なければ標準ライブラリの zlib で圧縮する。
+展開は保存時のコーデックに従うため、コーデックを切り替えても既存データはそのまま読める。
+Webhookでは受信した本文を再シリアライズせずにそのまま圧縮し、大きな文字起こしのコピーを増やさない。
+"""
+
+import os
+import json
+import zlib
+import codecs
+
+try:
+    import zstandard
+except ImportError:  # zstd はオプション
+    zstandard = None
+
+# 圧縮レベル
+TRANSCRIPT_ZLIB_LEVEL = int(os.environ.get('TRANSCRIPT_ZLIB_LEVEL', '6'))
+TRANSCRIPT_ZSTD_LEVEL = int(os.environ.get('TRANSCRIPT_ZSTD_LEVEL', '10'))
+
+# 使用するコーデック（zstd が利用できない場合は zlib）
+TRANSCRIPT_CODEC = os.environ.get('TRANSCRIPT_CODEC', 'zstd' if zstandard else 'zlib')
+if TRANSCRIPT_CODEC == 'zstd' and zstandard is None:
+    TRANSCRIPT_CODEC = 'zlib'
+
+# update_digest・utf8_length で一度にエンコードする文字数
+_TEXT_CHUNK_CHARS = 64 * 1024
+# decode で一度に展開するバイト数
+_DECOMPRESS_CHUNK_BYTES = 1024 * 1024
+
+
+def encode(data, raw=None):
+    """元データをJSONにシリアライズして圧縮する
+
+    Args:
+        data (dict): Webhookで受信したデータ
+        raw (bytes, optional): 受信したリクエストの本文（data をパースした元のJSON）。
+            指定した場合は再シリアライズせずにそのまま圧縮する
+
+    Returns:
+        tuple: (コーデック名, 圧縮後のバイト列, 圧縮前のバイト数)
+    """
+    if raw is None:
+        # 日本語をエスケープしない（\\uXXXX は1文字6バイトになるため）
+        raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    if TRANSCRIPT_CODEC == 'zstd':
+        compressed = zstandard.ZstdCompressor(level=TRANSCRIPT_ZSTD_LEVEL).compress(raw)
+    else:
+        compressed = zlib.compress(raw, TRANSCRIPT_ZLIB_LEVEL)
+    return TRANSCRIPT_CODEC, compressed, len(raw)
+
+
+def decode(codec, payload):
+    """圧縮されたデータを展開して元データに戻す
+
+    Args:
+        codec (str): 保存時のコーデック名
+        payload (bytes): 圧縮後のバイト列
+
+    Returns:
+        dict: 元データ
+
+    Raises:
+        ValueError: 未対応のコーデック、または展開できないデータの場合
+    """
+    # 展開と文字列への変換を区切って行い、展開後の全文のバイト列を作らない
+    # （全文を一度に変換すると、変換中に文字列の数倍の作業領域を使うため）
+    pieces = []
+    decoder = None
+    for chunk in _decompress_chunks(codec, payload):
+        if decoder is None:
+            # 受信した本文をそのまま保存しているため、エンコーディングは json.loads と同じく判定する
+            decoder = codecs.getincrementaldecoder(json.detect_encoding(chunk))('surrogatepass')
+        pieces.append(decoder.decode(chunk))
+    if decoder is not None:
+        pieces.append(decoder.decode(b"", final=True))
+    text = "".join(pieces)
+    del pieces
+    return json.loads(text)
+
+
+def _decompress_chunks(codec, payload):
+    """圧縮されたデータを _DECOMPRESS_CHUNK_BYTES ずつ展開して返す"""
+    if codec == 'zlib':
+        decompressor = zlib.decompressobj()
+        data = payload
+        while data:
+            chunk = decompressor.decompress(data, _DECOMPRESS_CHUNK_BYTES)
+            data = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd で圧縮されたデータの展開には zstandard パッケージが必要です")
+        yield from zstandard.ZstdDecompressor().read_to_iter(payload, write_size=_DECOMPRESS_CHUNK_BYTES)
+    else:
+        raise ValueError(f"未対応のコーデックです: {codec}")
+
+
+def update_digest(digest, text):
+    """文字列をUTF-8でハッシュに追加する（全文のバイト列を一度に作らず、区切って追加する）"""
+    for start in range(0, len(text), _TEXT_CHUNK_CHARS):
+        digest.update(text[start:start + _TEXT_CHUNK_CHARS].encode('utf-8'))
+
+
+def utf8_length(text):
+    """文字列をUTF-8でエンコードしたときのバイト数を返す（全文のバイト列を一度に作らない）"""
+    if text.isascii():
+        return len(text)
+    return sum(
+        len(text[start:start + _TEXT_CHUNK_CHARS].encode('utf-8'))
+        for start in range(0, len(text), _TEXT_CHUNK_CHARS)
+    )
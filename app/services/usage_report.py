@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+トークン使用量・コストの集計
+
+議事録生成ごとに保存したトークン使用量（TokenUsage）と履歴（MinutesHistory）を集計し、
+日・プロバイダー・モデル別の使用量とコスト、呼び出しの種類（議事録・タイトルなど）別の内訳、
+文字起こしの長さ別の生成時間とコストを返す。どのモデル・どの長さの文字起こしが
+処理時間とコストを押し上げているかを確認し、プロバイダーの選択を調整するために使用する。
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import case
+from app import db
+from app.models import MinutesHistory, TokenUsage
+
+# 文字起こしの長さ（整形後の文字数）の区分の境界
+SIZE_BOUNDARIES = (5000, 20000, 50000, 100000)
+
+_TOKEN_COLUMNS = ("input_tokens", "cached_input_tokens", "cache_write_tokens", "output_tokens")
+
+
+def usage_summary(days=30, ai_provider=None):
+    """直近の期間のトークン使用量・コストを集計する
+
+    Args:
+        days (int): 集計する日数（今日を含む）
+        ai_provider (str, optional): 指定した場合はそのプロバイダーのみ集計する
+
+    Returns:
+        dict: 集計結果
+            - since: 集計の開始日時（UTC）
+            - totals: 期間全体の合計
+            - daily: 日・プロバイダー・モデル別の使用量とコスト
+            - stages: プロバイダー・モデル・呼び出しの種類別の使用量とコスト
+            - sizes: 文字起こしの長さ・プロバイダー・モデル別の件数、平均の生成時間
+              （ストリーミングでは記録しないため最初の出力までの時間も返す）・トークン数・コスト
+    """
+    since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=max(1, days) - 1)
+    return {
+        "since": since.isoformat(),
+        "totals": _totals(since, ai_provider),
+        "daily": _daily(since, ai_provider),
+        "stages": _stages(since, ai_provider),
+        "sizes": _sizes(since, ai_provider),
+    }
+
+
+def _usage_columns():
+    return [
+        db.func.count(db.distinct(TokenUsage.history_id)).label("jobs"),
+        db.func.sum(TokenUsage.calls).label("calls"),
+        *(db.func.sum(getattr(TokenUsage, name)).label(name) for name in _TOKEN_COLUMNS),
+        db.func.sum(TokenUsage.cost_usd).label("cost_usd"),
+    ]
+
+
+def _usage_query(columns, since, ai_provider):
+    query = db.session.query(*columns).filter(TokenUsage.created_at >= since)
+    if ai_provider:
+        query = query.filter(TokenUsage.ai_provider == ai_provider)
+    return query
+
+
+def _usage_row(row):
+    """集計結果の1行を、トークン数・コストの合計を持つディクショナリに変換する"""
+    result = {
+        "jobs": row.jobs or 0,
+        "calls": row.calls or 0,
+        **{name: getattr(row, name) or 0 for name in _TOKEN_COLUMNS},
+        "cost_usd": _round_cost(row.cost_usd),
+    }
+    result["cache_hit_ratio"] = (
+        round(result["cached_input_tokens"] / result["input_tokens"], 4) if result["input_tokens"] else None
+    )
+    return result
+
+
+def _totals(since, ai_provider):
+    return _usage_row(_usage_query(_usage_columns(), since, ai_provider).one())
+
+
+def _daily(since, ai_provider):
+    day = db.func.date(TokenUsage.created_at)
+    rows = (
+        _usage_query([day.label("day"), TokenUsage.ai_provider, TokenUsage.ai_model, *_usage_columns()], since, ai_provider)
+        .group_by(day, TokenUsage.ai_provider, TokenUsage.ai_model)
+        .order_by(day, TokenUsage.ai_provider, TokenUsage.ai_model)
+        .all()
+    )
+    return [
+        dict(day=str(row.day), ai_provider=row.ai_provider, ai_model=row.ai_model, **_usage_row(row))
+        for row in rows
+    ]
+
+
+def _stages(since, ai_provider):
+    rows = (
+        _usage_query([TokenUsage.ai_provider, TokenUsage.ai_model, TokenUsage.stage, *_usage_columns()], since, ai_provider)
+        .group_by(TokenUsage.ai_provider, TokenUsage.ai_model, TokenUsage.stage)
+        .order_by(TokenUsage.ai_provider, TokenUsage.ai_model, TokenUsage.stage)
+        .all()
+    )
+    results = []
+    for row in rows:
+        entry = dict(ai_provider=row.ai_provider, ai_model=row.ai_model, stage=row.stage, **_usage_row(row))
+        entry["avg_input_tokens_per_call"] = round(entry["input_tokens"] / entry["calls"]) if entry["calls"] else None
+        entry["avg_output_tokens_per_call"] = round(entry["output_tokens"] / entry["calls"]) if entry["calls"] else None
+        results.append(entry)
+    return results
+
+
+def _size_bucket():
+    """整形後の文字数を区分の名前（例: 5000-20000）に変換するSQL式"""
+    bounds = (0,) + SIZE_BOUNDARIES
+    whens = [
+        (MinutesHistory.normalized_chars < upper, f"{lower}-{upper}")
+        for lower, upper in zip(bounds, SIZE_BOUNDARIES)
+    ]
+    return case(*whens, else_=f"{SIZE_BOUNDARIES[-1]}-")
+
+
+def _sizes(since, ai_provider):
+    """文字起こしの長さ別に、完了した議事録生成（生成キャッシュのヒットを除く）を集計する"""
+    bucket = _size_bucket()
+    query = db.session.query(
+        bucket.label("size"),
+        MinutesHistory.ai_provider,
+        MinutesHistory.ai_model,
+        db.func.count(MinutesHistory.id).label("jobs"),
+        db.func.min(MinutesHistory.normalized_chars).label("min_chars"),
+        db.func.avg(MinutesHistory.normalized_chars).label("avg_chars"),
+        db.func.avg(MinutesHistory.primary_latency_ms).label("avg_latency_ms"),
+        db.func.max(MinutesHistory.primary_latency_ms).label("max_latency_ms"),
+        db.func.avg(MinutesHistory.first_token_ms).label("avg_first_token_ms"),
+        db.func.avg(MinutesHistory.input_tokens).label("avg_input_tokens"),
+        db.func.avg(MinutesHistory.output_tokens).label("avg_output_tokens"),
+        db.func.avg(MinutesHistory.cost_usd).label("avg_cost_usd"),
+        db.func.sum(MinutesHistory.cost_usd).label("cost_usd"),
+    ).filter(
+        MinutesHistory.processed_at >= since,
+        MinutesHistory.status == "completed",
+        MinutesHistory.cache_hit.isnot(True),
+        MinutesHistory.normalized_chars.isnot(None),
+    )
+    if ai_provider:
+        query = query.filter(MinutesHistory.ai_provider == ai_provider)
+    rows = sorted(
+        query.group_by(bucket, MinutesHistory.ai_provider, MinutesHistory.ai_model).all(),
+        key=lambda row: (row.min_chars or 0, row.ai_provider or "", row.ai_model or "")
+    )
+    return [{
+        "size": row.size,
+        "ai_provider": row.ai_provider,
+        "ai_model": row.ai_model,
+        "jobs": row.jobs,
+        "avg_chars": _round(row.avg_chars),
+        "avg_latency_ms": _round(row.avg_latency_ms),
+        "max_latency_ms": row.max_latency_ms,
+        "avg_first_token_ms": _round(row.avg_first_token_ms),
+        "avg_input_tokens": _round(row.avg_input_tokens),
+        "avg_output_tokens": _round(row.avg_output_tokens),
+        "avg_cost_usd": _round_cost(row.avg_cost_usd),
+        "cost_usd": _round_cost(row.cost_usd),
+    } for row in rows]
+
+
+def _round(value):
+    return round(float(value)) if value is not None else None
+
+
+def _round_cost(value):
+    return round(float(value), 6) if value is not None else None
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ジョブ処理のベンチマーク（ワーカースレッド vs 非同期ランナー）
+
+LLMの呼び出しを指定した待ち時間だけ await する疑似関数に置き換え、同じ件数のジョブを
+ワーカースレッド（WorkerPool）と非同期ランナー（AsyncJobRunner）で処理したときの
+処理時間・スループット・スレッド数を比較する。
+データベースは一時ディレクトリのSQLiteを使用し、Notion連携は行わない。
+
+使い方:
+    python scripts/bench_async_engine.py [--jobs 200] [--latency 1.0] [--threads 4] [--concurrency 64]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def fake_llm(latency):
+    """指定した秒数だけ応答を待つ疑似LLM呼び出しを作成する"""
+    async def complete(model_name, system_prompt, user_prompt, max_tokens=None, **kwargs):
+        await asyncio.sleep(latency)
+        if system_prompt is None:
+            return "ベンチマーク会議"
+        return "タイトル: ベンチマーク会議\n---\n# 議事録\n- 内容"
+    return complete
+
+
+def enqueue_jobs(app, count, label):
+    """重複しない文字起こしで履歴とジョブを作成する（応答キャッシュに当たらないようにする）"""
+    from app import db
+    from app.models import MinutesHistory
+    from app.services.job_queue import enqueue
+
+    with app.app_context():
+        ids = []
+        for i in range(count):
+            history = MinutesHistory(notta_title=f"{label}-{i}", status="pending")
+            history.set_raw_data({"title": f"{label}-{i}", "content": f"{label} の会議 {i} の文字起こし"})
+            db.session.add(history)
+            db.session.flush()
+            enqueue(history.id, commit=False)
+            ids.append(history.id)
+        db.session.commit()
+        return ids
+
+
+def wait_until_done(app, ids, timeout):
+    """全ジョブが完了するまで待ち、(経過秒数, 最大スレッド数, 失敗件数) を返す"""
+    from app.models import MinutesHistory
+
+    start = time.perf_counter()
+    peak_threads = threading.active_count()
+    while time.perf_counter() - start < timeout:
+        peak_threads = max(peak_threads, threading.active_count())
+        with app.app_context():
+            done = MinutesHistory.query.filter(
+                MinutesHistory.id.in_(ids),
+                MinutesHistory.status.in_(["completed", "failed"])
+            ).count()
+            if done == len(ids):
+                failed = MinutesHistory.query.filter(
+                    MinutesHistory.id.in_(ids), MinutesHistory.status == "failed"
+                ).count()
+                return time.perf_counter() - start, peak_threads, failed
+        time.sleep(0.05)
+    raise TimeoutError(f"{timeout} 秒以内に全ジョブが完了しませんでした")
+
+
+def run(app, label, runner, jobs, timeout):
+    """ランナーでジョブを処理して結果を表示する"""
+    from app.services.job_queue import notify_workers
+
+    ids = enqueue_jobs(app, jobs, label)
+    runner.start()
+    notify_workers()
+    elapsed, peak_threads, failed = wait_until_done(app, ids, timeout)
+    runner.stop()
+    print(f"{label:<28} {elapsed:>8.2f} 秒 {jobs / elapsed:>10.1f} 件/秒 {peak_threads:>8} スレッド  失敗 {failed} 件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ワーカースレッドと非同期ランナーのジョブ処理性能を比較します")
+    parser.add_argument('--jobs', type=int, default=200, help="処理するジョブ数")
+    parser.add_argument('--latency', type=float, default=1.0, help="疑似LLM呼び出しの待ち時間（秒）")
+    parser.add_argument('--threads', type=int, default=4, help="ワーカースレッド数")
+    parser.add_argument('--concurrency', type=int, default=64, help="非同期ランナーの同時実行数")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="bench_async_engine_")
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from app import create_app
+    from app.services import ai_service
+    from app.services.job_queue import AsyncJobRunner, WorkerPool
+
+    # 疑似LLMに置き換え、Notion親ページ未設定（Notion連携なし）のデフォルト設定で実行する
+    ai_service._acomplete_with_gemini = fake_llm(args.latency)
+    app = create_app({'JOB_WORKER_THREADS': 0, 'JOB_ASYNC_CONCURRENCY': 0})
+    timeout = args.jobs * args.latency * 4 + 60
+
+    print(f"ジョブ数: {args.jobs} / LLM待ち時間: {args.latency} 秒")
+    print("")
+    run(app, f"ワーカースレッド x{args.threads}",
+        WorkerPool(app, num_threads=args.threads, poll_interval=0.5), args.jobs, timeout)
+    run(app, f"非同期ランナー x{args.concurrency}",
+        AsyncJobRunner(app, concurrency=args.concurrency, poll_interval=0.5), args.jobs, timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+大きな文字起こしの受信・議事録生成のメモリ使用量のベンチマーク
+
+文字起こしの大きさごとに、/webhook/notta での受信（本文の読み込み・保存）と、
+ワーカーでの議事録生成（元データの読み込み・整形・プロンプトの作成・LLMとNotionの呼び出し）を
+それぞれ別プロセス（Webプロセスとワーカープロセスに相当）で実行し、増えたピークRSSを計測して
+文字起こし1MBあたりの値を表示する。
+LLMとNotionは代替サーバー（scripts/fake_api_servers.py）を使用するため、実際のAPIキーは不要。
+ピークRSSのリセットに /proc/self/clear_refs を使用するため、Linuxでのみ動作する。
+
+使い方:
+    python scripts/bench_ingest_memory.py [--sizes 1,4,16] [--provider anthropic_claude] [--json result.json]
+"""
+
+import os
+import gc
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api_servers import FakeLLMServer, FakeNotionServer
+from bench_pipeline import FAKE_NOTION_PARENT_ID, build_transcript
+
+MB = 1024 * 1024
+
+
+def read_status(field):
+    """/proc/self/status の値（kB）をバイト数で返す"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"{field} を取得できませんでした")
+
+
+def reset_peak():
+    """ピークRSSを現在のRSSにリセットし、現在のRSSを返す"""
+    gc.collect()
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    return read_status('VmRSS')
+
+
+def post_webhook(app, body):
+    """本文をコピーせずにアプリのWSGI関数へ /webhook/notta のリクエストを渡す"""
+    from werkzeug.test import EnvironBuilder
+
+    environ = EnvironBuilder(
+        path='/webhook/notta', method='POST', input_stream=io.BytesIO(body),
+        content_type='application/json', content_length=len(body)
+    ).get_environ()
+    status = []
+    chunks = app(environ, lambda code, headers, exc_info=None: status.append(code))
+    response = b"".join(chunks)
+    return status[0], json.loads(response)
+
+
+def ingest(app, body):
+    """文字起こしを受信し、履歴IDと受信中のピークRSSの増加量を返す"""
+    baseline = reset_peak()
+    status, response = post_webhook(app, body)
+    peak = read_status('VmHWM') - baseline
+    if not status.startswith('202'):
+        raise RuntimeError(f"Webhookの受信に失敗しました: {status} {response}")
+    return response["history_id"], peak
+
+
+def process(app, history_id):
+    """議事録を生成し、生成中のピークRSSの増加量を返す"""
+    from app.models import MinutesHistory
+    from app.routes.webhook import process_minutes_generation
+
+    baseline = reset_peak()
+    with app.app_context():
+        process_minutes_generation(history_id)
+        peak = read_status('VmHWM') - baseline
+        history = MinutesHistory.query.get(history_id)
+        if history.status != "completed":
+            raise RuntimeError(f"議事録生成に失敗しました: {history.error_message}")
+    return peak
+
+
+def build_body(transcript_bytes, seed):
+    """指定したバイト数（UTF-8）の文字起こしを含むWebhookの本文を作成する"""
+    content = build_transcript(transcript_bytes // 3, seed)
+    return json.dumps({
+        "title": f"メモリ計測 {seed}",
+        "content": content,
+        "creation_time": str(int(time.time())),
+        "speakers": ["話者1", "話者2", "話者3", "話者4"],
+    }, ensure_ascii=False).encode('utf-8'), len(content.encode('utf-8'))
+
+
+def child(args):
+    """1つの大きさの受信または生成の計測（子プロセス）。結果をJSONで標準出力の最終行に出力する"""
+    logging.disable(logging.WARNING)
+    from app import create_app, db
+    from app.models import Settings
+    from app.services.settings_cache import bump_version, invalidate
+
+    app = create_app()
+    with app.app_context():
+        settings = Settings.query.first() or Settings()
+        db.session.add(settings)
+        settings.ai_provider = args.provider
+        settings.single_call_mode = True
+        settings.streaming_mode = False
+        settings.normalize_transcript = True
+        settings.notion_parent_page_id = FAKE_NOTION_PARENT_ID
+        bump_version(settings)
+        db.session.commit()
+        invalidate()
+
+    # SDKの読み込み・接続プールの作成などの初回のみの増加を除くため、小さな文字起こしで一度実行する
+    body, _ = build_body(64 * 1024, seed=0)
+    process(app, ingest(app, body)[0])
+
+    if args.history_id:
+        print(json.dumps({"process_peak_mb": process(app, args.history_id) / MB}))
+        return
+    body, transcript_bytes = build_body(int(args.child * MB), seed=1)
+    history_id, peak = ingest(app, body)
+    print(json.dumps({
+        "history_id": history_id,
+        "transcript_mb": transcript_bytes / MB,
+        "body_mb": len(body) / MB,
+        "ingest_peak_mb": peak / MB,
+    }))
+
+
+def run_child(env, size, provider, history_id=None):
+    """子プロセスで計測し、結果を返す（history_id を指定した場合は生成、それ以外は受信を計測する）"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', str(size), '--provider', provider]
+    if history_id:
+        command += ['--history-id', str(history_id)]
+    proc = subprocess.run(command, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        raise SystemExit(f"{size} MB の計測に失敗しました")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大きな文字起こしの受信・議事録生成のピークRSSを計測します")
+    parser.add_argument('--sizes', default='1,4,16', help="文字起こしの大きさ（MB、カンマ区切り）")
+    parser.add_argument('--provider', default='anthropic_claude', choices=['google_gemini', 'anthropic_claude', 'openai_chatgpt'])
+    parser.add_argument('--json', help="結果をJSONで保存するファイル（変更前後の比較用）")
+    parser.add_argument('--child', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--history-id', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args)
+        return
+
+    llm = FakeLLMServer(latency=0.01, jitter=0.0, output_chars=3000, chunk_delay=0.0).start()
+    notion = FakeNotionServer(latency=0.01, jitter=0.0).start()
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_memory_")
+    env = dict(os.environ)
+    env.update({
+        'ANTHROPIC_BASE_URL': llm.url,
+        'OPENAI_BASE_URL': f"{llm.url}/v1",
+        'GEMINI_API_ENDPOINT': llm.url,
+        'NOTION_BASE_URL': notion.url,
+        'JOB_WORKER_THREADS': '0',
+        'GENERATION_CACHE_ENABLED': '0',
+    })
+    for name in ('GOOGLE_API_KEY', 'ANTHROPIC_API_KEY', 'OPENAI_API_KEY', 'NOTION_API_KEY'):
+        env[name] = 'bench-dummy-key'
+
+    results = []
+    print(f"プロバイダー: {args.provider}")
+    print(f"{'文字起こし(MB)':>14}{'本文(MB)':>10}{'受信(MB)':>10}{'受信/MB':>9}{'生成(MB)':>10}{'生成/MB':>9}")
+    for size in [float(value) for value in args.sizes.split(',')]:
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, f'bench_{size}.db')}"
+        result = run_child(env, size, args.provider)
+        result.update(run_child(env, size, args.provider, result["history_id"]))
+        results.append(result)
+        mb = result["transcript_mb"]
+        print(f"{mb:>14.2f}{result['body_mb']:>10.2f}"
+              f"{result['ingest_peak_mb']:>10.1f}{result['ingest_peak_mb'] / mb:>9.2f}"
+              f"{result['process_peak_mb']:>10.1f}{result['process_peak_mb'] / mb:>9.2f}")
+
+    llm.stop()
+    notion.stop()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"provider": args.provider, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
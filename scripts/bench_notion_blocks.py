@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Markdown→Notionブロック変換のベンチマーク
+
+大きな議事録（Markdown）を生成して markdown_to_blocks の変換時間を計測し、
+1行1ブロックで変換した場合と比べたブロック数・APIリクエスト数を表示する。
+
+使い方:
+    python scripts/bench_notion_blocks.py [セクション数]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.notion_blocks import count_blocks, markdown_to_blocks
+from app.services.notion_service import NOTION_MAX_BLOCKS_PER_REQUEST, _batch_blocks
+
+
+def build_sample(sections):
+    """ベンチマーク用のMarkdown議事録を生成する"""
+    lines = ["# 定例会議 議事録", ""]
+    for i in range(sections):
+        lines.append(f"## 議題{i + 1}: **新機能**の進捗確認")
+        lines.append("")
+        for j in range(5):
+            lines.append(f"担当者{j}より、[仕様書](https://example.com/spec/{i}/{j})に基づき進捗の報告があった。")
+        lines.append("")
+        lines.append("- 決定事項")
+        lines.append("  - リリース日は*来月末*とする")
+        lines.append("  - `feature-flag` で段階的に公開する")
+        lines.append("1. 次回までに見積もりを更新する")
+        lines.append("2. ~~旧プランは破棄~~ 保留とする")
+        lines.append("- [ ] テスト計画を作成する")
+        lines.append("")
+        lines.append("---")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main():
+    sections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    markdown = build_sample(sections)
+    naive_blocks = sum(1 for line in markdown.split("\n") if line.strip())
+
+    start = time.perf_counter()
+    blocks = markdown_to_blocks(markdown)
+    elapsed = time.perf_counter() - start
+    batches = _batch_blocks(blocks)
+
+    print(f"入力: {len(markdown):,} 文字 / {len(markdown.splitlines()):,} 行")
+    print(f"変換時間: {elapsed * 1000:.1f} ms")
+    print(f"ブロック数: トップレベル {len(blocks):,} / 子ブロック含む {count_blocks(blocks):,}")
+    print(f"APIリクエスト数: {len(batches)}")
+    naive_requests = -(-naive_blocks // NOTION_MAX_BLOCKS_PER_REQUEST)
+    print(f"参考（1行1ブロック）: {naive_blocks:,} ブロック / {naive_requests} リクエスト")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+議事録生成パイプライン全体のベンチマーク
+
+LLM（Anthropic・OpenAI・Gemini）と Notion API の代替サーバー（scripts/fake_api_servers.py）を起動し、
+アプリをローカルのHTTPサーバーで動かして /webhook/notta に指定した同時実行数でリクエストを送る。
+全ジョブの完了後に、スループット、処理段階ごとの応答時間（p50/p95/p99）、
+データベースへのクエリ数、APIの呼び出し回数を表示する。実際のAPIキーは不要。
+
+使い方:
+    python scripts/bench_pipeline.py [--provider anthropic_claude] [--jobs 100] [--concurrency 10]
+        [--transcript-chars 20000] [--llm-latency 1.0] [--streaming] [--rate-limit-ratio 0.05]
+        [--async-concurrency 32] [--llm-rpm 20] [--json result.json]
+
+--llm-rpm・--llm-tpm を指定すると代替サーバーが1分あたりの上限を超えたリクエストに429を返すため、
+流量制御（app/services/rate_limiter.py）の効果を確認できる（RATE_LIMIT_ENABLED=0 で無効にした場合と比較する）。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api_servers import FakeLLMServer, FakeNotionServer
+
+# Notion親ページID（代替サーバーはどのIDでも受け付ける）
+FAKE_NOTION_PARENT_ID = "1c9a18c6848c80afbbc3edb875805be4"
+
+FILLERS = ("えー、", "あのー、", "まあ、", "")
+
+
+def build_transcript(chars, seed):
+    """Notta形式（話者とタイムスタンプの見出し行＋発言）の文字起こしを生成する"""
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    second = 0
+    while total < chars:
+        speaker = f"話者{rng.randint(1, 4)}"
+        second += rng.randint(3, 40)
+        text = (f"{rng.choice(FILLERS)}議題{rng.randint(1, 20)}について、"
+                f"{rng.choice(FILLERS)}担当者から進捗の報告がありました（会議 {seed}）。")
+        lines.append(f"{speaker} {second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}")
+        lines.append(text)
+        total += len(lines[-2]) + len(text) + 2
+    return "\n".join(lines)
+
+
+def percentiles(values):
+    """p50/p95/p99（nearest-rank 法）と件数・平均を返す"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    def rank(p):
+        return values[min(len(values), max(1, -(-len(values) * p // 100))) - 1]
+    return {"count": len(values), "mean": sum(values) / len(values), "p50": rank(50), "p95": rank(95), "p99": rank(99)}
+
+
+def configure_environment(args, llm, notion, workdir):
+    """アプリを読み込む前に、接続先・APIキー・ワーカーの設定を環境変数に設定する"""
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['ANTHROPIC_BASE_URL'] = llm.url
+    os.environ['OPENAI_BASE_URL'] = f"{llm.url}/v1"
+    os.environ['GEMINI_API_ENDPOINT'] = llm.url
+    os.environ['NOTION_BASE_URL'] = notion.url
+    for name in ('GOOGLE_API_KEY', 'ANTHROPIC_API_KEY', 'OPENAI_API_KEY', 'NOTION_API_KEY'):
+        os.environ[name] = 'bench-dummy-key'
+    os.environ['JOB_WORKER_THREADS'] = str(args.workers)
+    os.environ['JOB_ASYNC_CONCURRENCY'] = str(args.async_concurrency)
+    os.environ['JOB_POLL_INTERVAL'] = '0.2'
+    # 代替サーバーの内容は毎回同じため、生成キャッシュは使わない
+    os.environ['GENERATION_CACHE_ENABLED'] = '0'
+
+
+def configure_settings(app, args):
+    """ベンチマーク用の設定を保存する"""
+    from app import db
+    from app.models import Settings
+    from app.services.settings_cache import bump_version, invalidate
+
+    with app.app_context():
+        settings = Settings.query.first() or Settings()
+        db.session.add(settings)
+        settings.ai_provider = args.provider
+        settings.single_call_mode = not args.two_calls
+        settings.streaming_mode = args.streaming
+        settings.normalize_transcript = not args.no_normalize
+        settings.notion_parent_page_id = None if args.no_notion else FAKE_NOTION_PARENT_ID
+        bump_version(settings)
+        db.session.commit()
+        invalidate()
+
+
+def count_queries(app):
+    """データベースへのクエリ数を数えるカウンターを登録する"""
+    from sqlalchemy import event
+    from app import db
+
+    counter = {"queries": 0}
+    lock = threading.Lock()
+
+    def before_cursor_execute(*_):
+        with lock:
+            counter["queries"] += 1
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+def serve(app):
+    """アプリをローカルのHTTPサーバーで起動する"""
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def send_webhooks(base_url, args):
+    """/webhook/notta に指定した同時実行数でリクエストを送り、(履歴ID, 応答時間, ステータス) のリストを返す"""
+    client = httpx.Client(timeout=60, limits=httpx.Limits(max_connections=args.concurrency))
+    run_id = int(time.time())
+
+    def post(i):
+        payload = {
+            "title": f"ベンチマーク会議 {i}",
+            "content": build_transcript(args.transcript_chars, seed=run_id * 100000 + i),
+            "creation_time": str(int(time.time())),
+            "speakers": ["話者1", "話者2", "話者3", "話者4"],
+        }
+        started = time.perf_counter()
+        response = client.post(f"{base_url}/webhook/notta", json=payload)
+        elapsed = time.perf_counter() - started
+        history_id = response.json().get("history_id") if response.status_code < 500 else None
+        return history_id, elapsed, response.status_code
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(post, range(args.jobs)))
+    client.close()
+    return results
+
+
+def wait_for_jobs(app, history_ids, timeout):
+    """全履歴が完了または失敗になるまで待つ"""
+    from app.models import MinutesHistory
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with app.app_context():
+            done = MinutesHistory.query.filter(
+                MinutesHistory.id.in_(history_ids),
+                MinutesHistory.status.in_(["completed", "failed"])
+            ).count()
+        if done >= len(history_ids):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def collect_stages(app, history_ids):
+    """履歴・ジョブの記録から処理段階ごとの時間（秒）を集める
+
+    Returns:
+        tuple: (処理段階 -> 時間のリスト, ジョブに記録したスパンの段階 -> 時間のリスト, 状態ごとの件数, 完了時刻のリスト)
+    """
+    from app.models import JobQueue, MinutesHistory
+
+    stages = {"queue_wait": [], "processing": [], "generation": [], "first_token": [], "end_to_end": []}
+    spans = {}
+    statuses = {}
+    finished = []
+    with app.app_context():
+        histories = {h.id: h for h in MinutesHistory.query.filter(MinutesHistory.id.in_(history_ids))}
+        jobs = JobQueue.query.filter(JobQueue.history_id.in_(history_ids)).all()
+        for history in histories.values():
+            statuses[history.status] = statuses.get(history.status, 0) + 1
+            if history.primary_latency_ms is not None:
+                stages["generation"].append(history.primary_latency_ms / 1000)
+            if history.first_token_ms is not None:
+                stages["first_token"].append(history.first_token_ms / 1000)
+        for job in jobs:
+            if job.locked_at and job.created_at:
+                stages["queue_wait"].append((job.locked_at - job.created_at).total_seconds())
+            if job.finished_at and job.locked_at:
+                stages["processing"].append((job.finished_at - job.locked_at).total_seconds())
+            if job.finished_at and job.created_at:
+                stages["end_to_end"].append((job.finished_at - job.created_at).total_seconds())
+                finished.append(job.finished_at)
+            for span in job.get_spans():
+                name = span["stage"] + (f" [{span['outcome']}]" if span.get("outcome", "ok") != "ok" else "")
+                spans.setdefault(name, []).append(span["duration_ms"] / 1000)
+    return stages, spans, statuses, finished
+
+
+def print_table(title, rows):
+    print(title)
+    print(f"  {'':<32}{'件数':>6}{'平均':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in rows:
+        if stats:
+            print(f"  {name:<32}{stats['count']:>6}{stats['mean']:>10.3f}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+    print("")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代替APIサーバーを使って議事録生成パイプライン全体の性能を計測します")
+    parser.add_argument('--provider', default='anthropic_claude', choices=['google_gemini', 'anthropic_claude', 'openai_chatgpt'])
+    parser.add_argument('--jobs', type=int, default=50, help="送信するWebhookの数")
+    parser.add_argument('--concurrency', type=int, default=10, help="Webhookの同時送信数")
+    parser.add_argument('--transcript-chars', type=int, default=20000, help="文字起こしの文字数")
+    parser.add_argument('--output-chars', type=int, default=3000, help="生成する議事録の文字数")
+    parser.add_argument('--llm-latency', type=float, default=1.0, help="LLMの応答時間の中央値（秒）")
+    parser.add_argument('--llm-jitter', type=float, default=0.3, help="LLMの応答時間のばらつき（対数正規分布のσ）")
+    parser.add_argument('--chunk-delay', type=float, default=0.01, help="ストリーミングのチャンク間隔（秒）")
+    parser.add_argument('--notion-latency', type=float, default=0.2, help="Notionの応答時間の中央値（秒）")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="LLMが429を返す割合")
+    parser.add_argument('--failure-ratio', type=float, default=0.0, help="LLMが500を返す割合")
+    parser.add_argument('--llm-rpm', type=int, help="LLMの1分あたりのリクエスト数の上限（超えた場合は429を返す）")
+    parser.add_argument('--llm-tpm', type=int, help="LLMの1分あたりの入力トークン数の上限（同上）")
+    parser.add_argument('--streaming', action='store_true', help="ストリーミングモードで生成する")
+    parser.add_argument('--two-calls', action='store_true', help="議事録とタイトルを別々の呼び出しで生成する")
+    parser.add_argument('--no-normalize', action='store_true', help="文字起こしの整形を行わない")
+    parser.add_argument('--no-notion', action='store_true', help="Notion連携を行わない")
+    parser.add_argument('--workers', type=int, default=4, help="ワーカースレッド数")
+    parser.add_argument('--async-concurrency', type=int, default=0, help="1以上の場合は非同期ランナーの同時実行数")
+    parser.add_argument('--database-url', help="使用するデータベース（省略時は一時ディレクトリのSQLite）")
+    parser.add_argument('--timeout', type=float, default=600, help="全ジョブの完了を待つ最大時間（秒）")
+    parser.add_argument('--json', help="結果をJSONで保存するファイル（回帰の比較用）")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    llm = FakeLLMServer(
+        latency=args.llm_latency, jitter=args.llm_jitter, output_chars=args.output_chars,
+        chunk_delay=args.chunk_delay, rate_limit_ratio=args.rate_limit_ratio, failure_ratio=args.failure_ratio,
+        rpm_limit=args.llm_rpm, tpm_limit=args.llm_tpm
+    ).start()
+    notion = FakeNotionServer(latency=args.notion_latency).start()
+    configure_environment(args, llm, notion, tempfile.mkdtemp(prefix="bench_pipeline_"))
+
+    from app import create_app
+    app = create_app()
+    configure_settings(app, args)
+    queries = count_queries(app)
+    server, base_url = serve(app)
+
+    started = time.perf_counter()
+    sent = send_webhooks(base_url, args)
+    history_ids = [history_id for history_id, _, _ in sent if history_id]
+    completed = wait_for_jobs(app, history_ids, args.timeout)
+    wall = time.perf_counter() - started
+    db_queries = queries["queries"]
+    usage = httpx.get(f"{base_url}/api/usage/summary", params={"days": 1}, timeout=30).json()
+    server.shutdown()
+
+    stages, spans, statuses, _ = collect_stages(app, history_ids)
+    llm_routes = llm.stats.snapshot()
+    notion_routes = notion.stats.snapshot()
+    finished = statuses.get("completed", 0)
+
+    print(f"プロバイダー: {args.provider} / ジョブ数: {args.jobs} / 同時送信数: {args.concurrency} / "
+          f"文字起こし: {args.transcript_chars:,} 文字 / ストリーミング: {'あり' if args.streaming else 'なし'}")
+    print(f"ワーカー: {'非同期ランナー x' + str(args.async_concurrency) if args.async_concurrency else 'スレッド x' + str(args.workers)}")
+    print("")
+    if not completed:
+        print(f"※ {args.timeout} 秒以内に完了しなかったジョブがあります")
+    print(f"結果: {statuses}")
+    print(f"経過時間: {wall:.2f} 秒 / スループット: {finished / wall:.2f} 件/秒")
+    print("")
+
+    print_table("処理段階ごとの時間（秒）", [
+        ("webhook（受信〜応答）", percentiles([elapsed for _, elapsed, _ in sent])),
+        ("queue_wait（投入〜取得）", percentiles(stages["queue_wait"])),
+        ("generation（議事録生成）", percentiles(stages["generation"])),
+        ("first_token（最初の出力）", percentiles(stages["first_token"])),
+        ("processing（取得〜完了）", percentiles(stages["processing"])),
+        ("end_to_end（投入〜完了）", percentiles(stages["end_to_end"])),
+    ])
+    print_table("処理段階ごとの時間（秒、ジョブに記録したスパン。1回の呼び出しごと）", [
+        (name, percentiles(values)) for name, values in sorted(spans.items())
+    ])
+    print_table("API呼び出しごとの応答時間（秒、代替サーバー側）", [
+        (route, percentiles(entry["durations"])) for route, entry in sorted({**llm_routes, **notion_routes}.items())
+    ])
+
+    print("呼び出し回数")
+    for route, entry in sorted({**llm_routes, **notion_routes}.items()):
+        print(f"  {route:<36}{entry['count']:>6}  {entry['statuses']}")
+    print(f"  {'Notionに送信したブロック数':<34}{notion.blocks_received:>6}")
+    print(f"  {'データベースのクエリ数':<35}{db_queries:>6}  (1ジョブあたり {db_queries / max(len(history_ids), 1):.1f})")
+    print("")
+
+    print("トークン使用量と推定コスト（/api/usage/summary）")
+    print(f"  {'':<40}{'呼び出し':>8}{'入力':>10}{'キャッシュ':>10}{'出力':>10}{'コスト(USD)':>14}")
+    for entry in usage["stages"]:
+        name = f"{entry['ai_model']} {entry['stage']}"
+        cost = f"{entry['cost_usd']:.4f}" if entry["cost_usd"] is not None else "-"
+        print(f"  {name:<40}{entry['calls']:>8}{entry['input_tokens']:>10}{entry['cached_input_tokens']:>10}"
+              f"{entry['output_tokens']:>10}{cost:>14}")
+    totals = usage["totals"]
+    if totals["cost_usd"] is not None:
+        print(f"  合計 {totals['cost_usd']:.4f} USD（1ジョブあたり {totals['cost_usd'] / max(totals['jobs'], 1):.4f} USD）")
+
+    if args.json:
+        result = {
+            "args": vars(args),
+            "wall_seconds": wall,
+            "throughput": finished / wall,
+            "statuses": statuses,
+            "stages": {name: percentiles(values) for name, values in stages.items()},
+            "spans": {name: percentiles(values) for name, values in spans.items()},
+            "webhook": percentiles([elapsed for _, elapsed, _ in sent]),
+            "routes": {route: {"count": e["count"], "statuses": e["statuses"], "latency": percentiles(e["durations"])}
+                       for route, e in {**llm_routes, **notion_routes}.items()},
+            "notion_blocks": notion.blocks_received,
+            "db_queries": db_queries,
+            "usage": usage,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\n結果を {args.json} に保存しました")
+
+
+if __name__ == '__main__':
+    main()
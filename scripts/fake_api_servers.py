@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ベンチマーク用のLLM・Notion APIの代替サーバー
+
+Anthropic (Messages API)・OpenAI (Chat Completions API)・Gemini (REST) と Notion API の
+議事録生成で使用するエンドポイントを、ローカルのHTTPサーバーで再現する。
+応答時間（対数正規分布のばらつき付き）、ストリーミング、429（レート制限）・500エラーの発生率、
+1分あたりのリクエスト数・入力トークン数の上限（超えた場合は429を返す）を指定でき、
+エンドポイントごとの呼び出し回数・ステータス・応答時間を記録する。
+
+単体で起動する場合:
+    python scripts/fake_api_servers.py [--llm-port 8901] [--notion-port 8902] [--llm-latency 2.0] [--llm-rpm 60]
+"""
+
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# タイトル生成の呼び出しを判定するための文言（ai_service._build_title_prompt の指示文）
+TITLE_PROMPT_MARKER = "タイトルのみを出力"
+
+
+class RouteStats:
+    """エンドポイントごとの呼び出し回数・ステータス・応答時間を記録する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, status, seconds):
+        with self._lock:
+            entry = self.routes.setdefault(route, {"count": 0, "statuses": {}, "durations": []})
+            entry["count"] += 1
+            entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+            entry["durations"].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: {"count": e["count"], "statuses": dict(e["statuses"]), "durations": list(e["durations"])}
+                for route, e in self.routes.items()
+            }
+
+
+class FakeServer:
+    """代替サーバーの共通処理（応答時間・エラーの発生・記録）"""
+
+    def __init__(self, latency=1.0, jitter=0.3, rate_limit_ratio=0.0, failure_ratio=0.0, seed=None):
+        """
+        Args:
+            latency (float): 応答時間の中央値（秒）。ストリーミングの場合は最初の出力までの時間
+            jitter (float): 応答時間のばらつき（対数正規分布のσ）
+            rate_limit_ratio (float): 429を返す割合
+            failure_ratio (float): 500を返す割合
+            seed (int, optional): 乱数のシード
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.failure_ratio = failure_ratio
+        self.stats = RouteStats()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._httpd = None
+
+    def start(self, host="127.0.0.1", port=0):
+        """バックグラウンドスレッドでサーバーを起動する"""
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def sample_latency(self):
+        with self._random_lock:
+            return self.latency * self._random.lognormvariate(0, self.jitter) if self.jitter else self.latency
+
+    def sample_error(self):
+        """発生させるエラーのステータスコード（エラーなしの場合はNone）"""
+        with self._random_lock:
+            value = self._random.random()
+        if value < self.rate_limit_ratio:
+            return 429
+        if value < self.rate_limit_ratio + self.failure_ratio:
+            return 500
+        return None
+
+    def handle(self, handler, method, path, body):
+        """リクエストを処理する（route名を返す。未対応のパスはNone）"""
+        raise NotImplementedError
+
+
+class FakeLLMServer(FakeServer):
+    """Anthropic・OpenAI・Gemini の代替サーバー"""
+
+    def __init__(self, output_chars=3000, chunk_chars=40, chunk_delay=0.02, rpm_limit=None, tpm_limit=None, **kwargs):
+        """
+        Args:
+            output_chars (int): 生成する議事録のおおよその文字数
+            chunk_chars (int): ストリーミングで1回に送る文字数
+            chunk_delay (float): ストリーミングのチャンクの間隔（秒）
+            rpm_limit (int, optional): 直近60秒のリクエスト数の上限（超えた場合は429を返す）
+            tpm_limit (int, optional): 直近60秒の入力トークン数の上限（同上）
+            その他は FakeServer と同じ
+        """
+        super().__init__(**kwargs)
+        self.output_chars = output_chars
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self._cached_prefixes = set()
+        self._cache_lock = threading.Lock()
+        self._window = deque()  # 直近60秒に受け付けた (時刻, 入力トークン数)
+        self._window_tokens = 0
+        self._window_lock = threading.Lock()
+
+    def handle(self, handler, method, path, body):
+        if method != "POST":
+            return None
+        if path.startswith("/v1/messages"):
+            return self._anthropic(handler, body)
+        if path.startswith("/v1/chat/completions"):
+            return self._openai(handler, body)
+        if path.startswith("/v1beta/models/") and ":generateContent" in path:
+            return self._gemini(handler, path, body, stream=False)
+        if path.startswith("/v1beta/models/") and ":streamGenerateContent" in path:
+            return self._gemini(handler, path, body, stream=True)
+        return None
+
+    # --- 各プロバイダーの形式 ---
+
+    def _anthropic(self, handler, body):
+        route = "anthropic.messages" + (".stream" if body.get("stream") else "")
+        if self._reject(handler, route, _anthropic_error):
+            return route
+        system = body.get("system")
+        system_text = "".join(block.get("text", "") for block in system) if isinstance(system, list) else (system or "")
+        prompt = system_text + "".join(_message_text(m) for m in body.get("messages", []))
+        # cache_control 付きのシステムプロンプトは2回目以降キャッシュから読み込んだものとして扱う
+        cached = written = 0
+        if isinstance(system, list) and any(block.get("cache_control") for block in system):
+            if self._remember(system_text):
+                cached = _tokens(system_text)
+            else:
+                written = _tokens(system_text)
+        input_tokens = _tokens(prompt) - cached - written
+        capacity = self._take_capacity(_tokens(prompt))
+        if capacity.get("retry_after") is not None:
+            self._reject_over_limit(handler, capacity, _anthropic_error, _anthropic_rate_headers)
+            return route
+        text = self._output(prompt, body.get("max_tokens"))
+        usage = {"input_tokens": input_tokens, "cache_read_input_tokens": cached,
+                 "cache_creation_input_tokens": written}
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+            "model": body.get("model"), "stop_reason": "end_turn", "stop_sequence": None,
+        }
+
+        if not body.get("stream"):
+            time.sleep(self.sample_latency())
+            message["content"] = [{"type": "text", "text": text}]
+            message["usage"] = dict(usage, output_tokens=_tokens(text))
+            handler.send_json(200, message, _anthropic_rate_headers(capacity))
+            return route
+
+        def events():
+            yield _sse(dict(message, content=[], usage=dict(usage, output_tokens=1)), "message_start")
+            yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            for piece in self._pieces(text):
+                yield _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}, "content_block_delta")
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                        "usage": {"output_tokens": _tokens(text)}}, "message_delta")
+            yield _sse({"type": "message_stop"}, "message_stop")
+
+        self._stream(handler, events(), "text/event-stream", _anthropic_rate_headers(capacity))
+        return route
+
+    def _openai(self, handler, body):
+        route = "openai.chat" + (".stream" if body.get("stream") else "")
+        if self._reject(handler, route, _openai_error):
+            return route
+        prompt = "".join(_message_text(m) for m in body.get("messages", []))
+        capacity = self._take_capacity(_tokens(prompt))
+        if capacity.get("retry_after") is not None:
+            self._reject_over_limit(handler, capacity, _openai_error, _openai_rate_headers)
+            return route
+        text = self._output(prompt, body.get("max_tokens"))
+        usage = {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(text),
+                 "total_tokens": _tokens(prompt) + _tokens(text), "prompt_tokens_details": {"cached_tokens": 0}}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "created": int(time.time()), "model": body.get("model")}
+
+        if not body.get("stream"):
+            time.sleep(self.sample_latency())
+            handler.send_json(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+            ]), _openai_rate_headers(capacity))
+            return route
+
+        def events():
+            for piece in self._pieces(text):
+                yield _sse(dict(base, object="chat.completion.chunk", choices=[
+                    {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                ]))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield _sse(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+            yield b"data: [DONE]\n\n"
+
+        self._stream(handler, events(), "text/event-stream", _openai_rate_headers(capacity))
+        return route
+
+    def _gemini(self, handler, path, body, stream):
+        route = "gemini.generate" + (".stream" if stream else "")
+        if self._reject(handler, route, _gemini_error):
+            return route
+        prompt = "".join(
+            part.get("text", "")
+            for content in ([body.get("systemInstruction") or body.get("system_instruction") or {}] + body.get("contents", []))
+            for part in content.get("parts", [])
+        )
+        capacity = self._take_capacity(_tokens(prompt))
+        if capacity.get("retry_after") is not None:
+            self._reject_over_limit(handler, capacity, _gemini_error, lambda _: {})
+            return route
+        text = self._output(prompt, (body.get("generationConfig") or {}).get("maxOutputTokens"))
+        usage = {"promptTokenCount": _tokens(prompt), "candidatesTokenCount": _tokens(text),
+                 "totalTokenCount": _tokens(prompt) + _tokens(text)}
+
+        def chunk(piece, final):
+            candidate = {"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}
+            if final:
+                candidate["finishReason"] = 1  # STOP（enum-encoding=int）
+            return {"candidates": [candidate], "usageMetadata": usage}
+
+        if not stream:
+            time.sleep(self.sample_latency())
+            handler.send_json(200, chunk(text, True))
+            return route
+
+        def pieces():
+            # RESTのストリーミングはJSON配列を少しずつ送る形式
+            items = list(self._pieces(text))
+            yield b"["
+            for i, piece in enumerate(items):
+                data = json.dumps(chunk(piece, i == len(items) - 1), ensure_ascii=False).encode("utf-8")
+                yield data + (b"," if i < len(items) - 1 else b"]")
+
+        self._stream(handler, pieces(), "application/json")
+        return route
+
+    # --- 共通処理 ---
+
+    def _reject(self, handler, route, error_body):
+        status = self.sample_error()
+        if status is None:
+            return False
+        time.sleep(min(self.latency, 0.05))
+        handler.send_json(status, error_body(status), {"retry-after": "1", "retry-after-ms": "100"})
+        return True
+
+    def _take_capacity(self, tokens):
+        """RPM・TPMの上限の範囲でリクエストを受け付ける
+
+        Returns:
+            dict: 上限と残り（requests_limit / requests_remaining / tokens_limit / tokens_remaining）、
+                残りが戻り始めるまでの時間（reset_after、秒）。
+                上限を超えたため受け付けなかった場合は retry_after（秒）も含む
+        """
+        if not self.rpm_limit and not self.tpm_limit:
+            return {}
+        with self._window_lock:
+            now = time.monotonic()
+            while self._window and self._window[0][0] <= now - 60:
+                self._window_tokens -= self._window.popleft()[1]
+            over_requests = self.rpm_limit and len(self._window) + 1 > self.rpm_limit
+            over_tokens = self.tpm_limit and self._window and self._window_tokens + tokens > self.tpm_limit
+            if not over_requests and not over_tokens:
+                self._window.append((now, tokens))
+                self._window_tokens += tokens
+            capacity = {
+                "requests_limit": self.rpm_limit,
+                "requests_remaining": max(0, self.rpm_limit - len(self._window)) if self.rpm_limit else None,
+                "tokens_limit": self.tpm_limit,
+                "tokens_remaining": max(0, self.tpm_limit - self._window_tokens) if self.tpm_limit else None,
+            }
+            # 最も古いリクエストが60秒の範囲から外れるまでの時間
+            capacity["reset_after"] = self._window[0][0] + 60 - now if self._window else 0.0
+            if over_requests or over_tokens:
+                capacity["retry_after"] = capacity["reset_after"]
+        return capacity
+
+    def _reject_over_limit(self, handler, capacity, error_body, rate_headers):
+        time.sleep(min(self.latency, 0.05))
+        headers = dict(rate_headers(capacity), **{"retry-after": str(max(1, round(capacity["retry_after"])))})
+        handler.send_json(429, error_body(429), headers)
+
+    def _remember(self, text):
+        """プロンプトを記録し、既に記録済み（キャッシュヒット）ならTrueを返す"""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._cache_lock:
+            if key in self._cached_prefixes:
+                return True
+            self._cached_prefixes.add(key)
+            return False
+
+    def _output(self, prompt, max_tokens):
+        if TITLE_PROMPT_MARKER in prompt or (max_tokens and max_tokens <= 100):
+            return "ベンチマーク会議"
+        return _minutes_text(self.output_chars)
+
+    def _pieces(self, text):
+        for i in range(0, len(text), self.chunk_chars):
+            yield text[i:i + self.chunk_chars]
+
+    def _stream(self, handler, chunks, content_type, headers=None):
+        """最初の出力まで待ってから、チャンクを一定間隔で送る"""
+        time.sleep(self.sample_latency())
+        handler.start_chunked(200, content_type, headers)
+        for i, data in enumerate(chunks):
+            if i and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            handler.write_chunk(data)
+        handler.end_chunked()
+
+
+class FakeNotionServer(FakeServer):
+    """Notion API（ページ作成・ブロック追加・ページ更新）の代替サーバー"""
+
+    def __init__(self, latency=0.2, jitter=0.2, **kwargs):
+        super().__init__(latency=latency, jitter=jitter, **kwargs)
+        self.blocks_received = 0
+        self._blocks_lock = threading.Lock()
+
+    def handle(self, handler, method, path, body):
+        if method == "POST" and path.startswith("/v1/pages"):
+            route = "notion.pages.create"
+        elif method == "PATCH" and path.startswith("/v1/blocks/") and path.endswith("/children"):
+            route = "notion.blocks.children.append"
+        elif method == "PATCH" and path.startswith("/v1/pages/"):
+            route = "notion.pages.update"
+        else:
+            return None
+
+        status = self.sample_error()
+        time.sleep(self.sample_latency())
+        if status is not None:
+            code = "rate_limited" if status == 429 else "internal_server_error"
+            handler.send_json(status, {"object": "error", "status": status, "code": code, "message": code},
+                              {"retry-after": "1"})
+            return route
+
+        with self._blocks_lock:
+            self.blocks_received += len(body.get("children") or [])
+        if route == "notion.blocks.children.append":
+            handler.send_json(200, {"object": "list", "results": [], "next_cursor": None, "has_more": False})
+        else:
+            page_id = path.split("/")[3] if route == "notion.pages.update" else str(uuid.uuid4())
+            handler.send_json(200, {
+                "object": "page", "id": page_id, "properties": {},
+                "url": f"https://www.notion.so/{page_id.replace('-', '')}"
+            })
+        return route
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def _dispatch(self, method):
+        started = time.perf_counter()
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        self._status = None
+        path = self.path.split("?", 1)[0]
+        try:
+            route = self.fake.handle(self, method, path, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントがキャンセルした（ヘッジで採用されなかったなど）
+            route, self._status = f"{method} {path}", 499
+        if route is None:
+            route = f"{method} {path}"
+            self.send_json(404, {"error": {"message": f"not found: {path}"}})
+        self.fake.stats.record(route, self._status, time.perf_counter() - started)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._status = status
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_chunked(self, status, content_type, headers=None):
+        self._status = status
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _tokens(text):
+    """トークン数の概算（ai_service._estimate_tokens と同じ）"""
+    return len((text or "").encode("utf-8")) // 3
+
+
+def _message_text(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _sse(payload, event=None):
+    data = json.dumps(payload, ensure_ascii=False)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n".encode("utf-8")
+
+
+def _minutes_text(chars):
+    """1回呼び出し形式（先頭行がタイトル）の議事録を生成する"""
+    lines = ["タイトル: ベンチマーク会議", "---", "# 議事録", ""]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < chars:
+        i += 1
+        lines += [f"## 議題{i}: 進捗確認", "", f"- 担当者{i}より**進捗**の報告があった。", "- 次回までに見積もりを更新する。", ""]
+    return "\n".join(lines)
+
+
+def _anthropic_error(status):
+    kind = "rate_limit_error" if status == 429 else "api_error"
+    return {"type": "error", "error": {"type": kind, "message": kind}}
+
+
+def _openai_error(status):
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    return {"error": {"message": kind, "type": kind, "code": kind}}
+
+
+def _gemini_error(status):
+    kind = "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"
+    return {"error": {"code": status, "message": kind, "status": kind}}
+
+
+def _rate_values(capacity, defaults):
+    """レート制限ヘッダーの値（上限を設定していない項目は defaults の値）"""
+    return [str(defaults[i] if capacity.get(name) is None else capacity[name])
+            for i, name in enumerate(("requests_limit", "requests_remaining", "tokens_limit", "tokens_remaining"))]
+
+
+def _anthropic_rate_headers(capacity=None):
+    capacity = capacity or {}
+    values = _rate_values(capacity, (4000, 3999, 400000, 399000))
+    headers = dict(zip(("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining",
+                        "anthropic-ratelimit-input-tokens-limit", "anthropic-ratelimit-input-tokens-remaining"), values))
+    if capacity.get("reset_after") is not None:
+        # AnthropicはリセットのRFC 3339の時刻を返す
+        reset = (datetime.now(timezone.utc) + timedelta(seconds=capacity["reset_after"])).isoformat(timespec="seconds")
+        headers["anthropic-ratelimit-requests-reset"] = headers["anthropic-ratelimit-input-tokens-reset"] = reset
+    return headers
+
+
+def _openai_rate_headers(capacity=None):
+    capacity = capacity or {}
+    values = _rate_values(capacity, (5000, 4999, 800000, 799000))
+    headers = dict(zip(("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests",
+                        "x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens"), values))
+    if capacity.get("reset_after") is not None:
+        # OpenAIはリセットまでの期間（例: 1.5s）を返す
+        headers["x-ratelimit-reset-requests"] = headers["x-ratelimit-reset-tokens"] = f"{capacity['reset_after']:.3f}s"
+    return headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM・Notion APIの代替サーバーを起動します")
+    parser.add_argument('--llm-port', type=int, default=8901)
+    parser.add_argument('--notion-port', type=int, default=8902)
+    parser.add_argument('--llm-latency', type=float, default=2.0, help="LLMの応答時間の中央値（秒）")
+    parser.add_argument('--notion-latency', type=float, default=0.2, help="Notionの応答時間の中央値（秒）")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="429を返す割合")
+    parser.add_argument('--failure-ratio', type=float, default=0.0, help="500を返す割合")
+    parser.add_argument('--llm-rpm', type=int, help="LLMの1分あたりのリクエスト数の上限")
+    parser.add_argument('--llm-tpm', type=int, help="LLMの1分あたりの入力トークン数の上限")
+    args = parser.parse_args()
+
+    llm = FakeLLMServer(latency=args.llm_latency, rate_limit_ratio=args.rate_limit_ratio,
+                        failure_ratio=args.failure_ratio, rpm_limit=args.llm_rpm,
+                        tpm_limit=args.llm_tpm).start(port=args.llm_port)
+    notion = FakeNotionServer(latency=args.notion_latency).start(port=args.notion_port)
+    print(f"ANTHROPIC_BASE_URL={llm.url}")
+    print(f"OPENAI_BASE_URL={llm.url}/v1")
+    print(f"GEMINI_API_ENDPOINT={llm.url}")
+    print(f"NOTION_BASE_URL={notion.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
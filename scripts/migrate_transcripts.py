@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+既存の履歴の元データ (minutes_history.raw_data) を圧縮して transcript_blob テーブルに移行する
+
+移行後は raw_data を NULL にする。削減したバイト数を最後に表示する。
+（PostgreSQL では VACUUM、SQLite では VACUUM を実行するまでファイルサイズは縮小されません）
+
+使い方:
+    python scripts/migrate_transcripts.py [--batch-size 100] [--dry-run]
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.orm import selectinload, undefer
+from app import create_app, db
+from app.models import MinutesHistory, TranscriptBlob
+
+
+def migrate(batch_size, dry_run):
+    """raw_data を持つ履歴をバッチ単位で移行する
+
+    Returns:
+        tuple: (移行件数, 移行前のバイト数, 移行後のバイト数, 失敗件数)
+    """
+    migrated = 0
+    failed = 0
+    before_bytes = 0
+    after_bytes = 0
+    last_id = 0
+
+    while True:
+        histories = (
+            MinutesHistory.query
+            .filter(MinutesHistory.id > last_id, MinutesHistory.raw_data.isnot(None))
+            # 1件ずつの読み込みにならないよう、元データと移行済みの圧縮データのサイズをまとめて読み込む
+            .options(
+                undefer(MinutesHistory.raw_data),
+                selectinload(MinutesHistory.transcript).load_only(
+                    TranscriptBlob.history_id, TranscriptBlob.compressed_size
+                )
+            )
+            .order_by(MinutesHistory.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not histories:
+            break
+
+        for history in histories:
+            last_id = history.id
+            raw_data = history.raw_data
+            try:
+                data = json.loads(raw_data)
+            except json.JSONDecodeError:
+                print(f"  履歴 {history.id}: JSONとして読み込めないためスキップします")
+                failed += 1
+                continue
+
+            before_bytes += len(raw_data.encode('utf-8'))
+            if history.transcript is not None:
+                # 既に移行済み（旧データの削除のみ行う）
+                history.raw_data = None
+            else:
+                history.set_raw_data(data)
+            after_bytes += history.transcript.compressed_size
+            migrated += 1
+
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        # 移行済みのオブジェクトを保持し続けないよう解放する
+        db.session.expunge_all()
+        print(f"  {migrated} 件処理しました (ID {last_id} まで)")
+
+    return migrated, before_bytes, after_bytes, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="元データを圧縮テーブルに移行します")
+    parser.add_argument('--batch-size', type=int, default=100, help="1回のコミットで移行する件数")
+    parser.add_argument('--dry-run', action='store_true', help="変更をコミットせず、削減量のみ表示する")
+    args = parser.parse_args()
+
+    app = create_app({'JOB_WORKER_THREADS': 0})
+    with app.app_context():
+        migrated, before_bytes, after_bytes, failed = migrate(args.batch_size, args.dry_run)
+
+    saved = before_bytes - after_bytes
+    ratio = (saved / before_bytes * 100) if before_bytes else 0
+    print("")
+    print(f"{'[dry-run] ' if args.dry_run else ''}移行件数: {migrated} 件 (失敗: {failed} 件)")
+    print(f"移行前: {before_bytes:,} バイト / 移行後: {after_bytes:,} バイト")
+    print(f"削減量: {saved:,} バイト ({ratio:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
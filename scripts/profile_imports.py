@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+起動時のインポート時間を計測するスクリプト
+
+`python -X importtime` で create_app() を別プロセスで実行し、モジュールごとの
+インポート時間（子モジュールを含む累積時間）を多い順に表示する。
+--sdks を指定すると、初回使用時まで読み込みを遅らせている各プロバイダーSDKの
+インポート時間も個別に計測する。
+
+使い方:
+    python scripts/profile_imports.py [--top 20] [--sdks]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# create_app() の実行時間を計測するコード（ワーカースレッドは起動しない）
+STARTUP_CODE = (
+    "import time; start = time.perf_counter(); "
+    "from app import create_app; create_app({'JOB_WORKER_THREADS': 0}); "
+    "print(f'__STARTUP__ {time.perf_counter() - start:.3f}')"
+)
+
+
+def run_importtime(code):
+    """-X importtime 付きでコードを実行し、(モジュール別の計測結果, 標準出力) を返す
+
+    Returns:
+        tuple: ([(累積マイクロ秒, 自身のマイクロ秒, モジュール名, 深さ)], 標準出力)
+    """
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    return entries, result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時のインポート時間を計測します")
+    parser.add_argument('--top', type=int, default=20, help="表示するモジュール数")
+    parser.add_argument('--sdks', action='store_true', help="遅延読み込みしているSDKのインポート時間も計測する")
+    args = parser.parse_args()
+
+    entries, stdout = run_importtime(STARTUP_CODE)
+    startup = next((line.split()[1] for line in stdout.splitlines() if line.startswith('__STARTUP__')), None)
+    # トップレベル（深さ1）のモジュールの合計がインポート全体の時間
+    total_us = sum(cumulative for cumulative, _, _, depth in entries if depth == 1)
+
+    print(f"create_app() の実行時間: {startup or '計測失敗'} 秒")
+    print(f"インポート時間の合計: {total_us / 1000:.1f} ms ({len(entries)} モジュール)")
+    print("")
+    print(f"{'累積(ms)':>10} {'自身(ms)':>10}  モジュール")
+    for cumulative, self_us, name, depth in sorted(entries, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>10.1f} {self_us / 1000:>10.1f}  {'  ' * (depth - 1)}{name}")
+
+    loaded = {name for _, _, name, _ in entries}
+    sys.path.insert(0, ROOT)
+    from app.services.client_pool import SDK_MODULES
+
+    print("")
+    print("プロバイダーSDK:")
+    for sdk_name, module_name in SDK_MODULES.items():
+        status = "起動時に読み込み" if module_name in loaded else "初回使用時に読み込み"
+        line = f"  {sdk_name:<14} {status}"
+        if args.sdks:
+            sdk_entries, _ = run_importtime(f"import {module_name}")
+            sdk_us = next((cumulative for cumulative, _, name, _ in sdk_entries if name == module_name), 0)
+            line += f" ({sdk_us / 1000:.1f} ms)"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
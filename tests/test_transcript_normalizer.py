@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文字起こしの正規化を確認するテストスクリプト
+アプリケーションを起動せずに実行できます
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.transcript_normalizer import normalize, normalize_or_keep
+
+# 話者ごとの見出し行を含む文字起こし
+content = """話者1 00:00:05
+えー、今日は来期の予算について話します。
+話者2 00:00:12
+あの件は確認済みです。
+次回の定例は 14:00
+締め切りは金曜 17:30
+話者1 00:01:03
+了解です。
+"""
+
+expected = (
+    "話者1: 今日は来期の予算について話します。\n"
+    "話者2: あの件は確認済みです。次回の定例は 14:00 締め切りは金曜 17:30\n"
+    "話者1: 了解です。"
+)
+
+
+def test_normalize():
+    print("=== 文字起こし正規化テスト ===")
+    result = normalize(content)
+    print(f"正規化結果:\n{result}")
+
+    # 時刻で終わる発言は見出し行として削除されず、話者も変わらないこと
+    assert result == expected, f"期待値:\n{expected}"
+    print("\n✅ 正規化結果は期待どおりです")
+
+
+def test_filler_only():
+    print("\n=== フィラーだけの文字起こしのテスト ===")
+    filler_only = "話者1 00:00:01\nえー。\n"
+    print(f"正規化結果: {normalize(filler_only)!r}")
+
+    # 正規化で空になる場合は元の内容をそのまま使うこと
+    result, normalized = normalize_or_keep(filler_only)
+    assert normalize(filler_only) == ""
+    assert (result, normalized) == (filler_only, False), f"結果: {result!r}"
+    print("✅ 元の文字起こしを使用します")
+
+
+if __name__ == "__main__":
+    test_normalize()
+    test_filler_only()
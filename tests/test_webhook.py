@@ -34,7 +34,8 @@ def test_webhook():
         # 結果の確認
         print(f"\nステータスコード: {response.status_code}")
         
-        if response.status_code == 200:
+        # ジョブキュー導入後は 202 Accepted で即時に応答する
+        if response.status_code in (200, 202):
             response_data = response.json()
             print(f"レスポンス: {json.dumps(response_data, ensure_ascii=False, indent=2)}")
             print(f"\n✅ ウェブフック呼び出し成功！")
@@ -54,7 +55,7 @@ def check_processing_status(history_id, max_attempts=10):
         return
     
     # 結果確認用の簡易的なエンドポイント
-    status_url = f"http://localhost:5002/results/api/status/{history_id}"
+    status_url = f"http://localhost:5002/api/status/{history_id}"
     
     print(f"\n=== 処理状態の確認 (履歴ID: {history_id}) ===")
     print("非同期処理の完了を待機中...")
@@ -93,6 +94,5 @@ if __name__ == "__main__":
     history_id = test_webhook()
     
     if history_id:
-        # 処理状態の確認
-        print("\nNote: ステータス確認のためには、Flask側に /results/api/status/<history_id> エンドポイントが必要です")
-        print("このエンドポイントが実装されていない場合は、手動でアプリの履歴ページを確認してください。") 
\ No newline at end of file
+        # 処理状態の確認（議事録生成はワーカーで非同期に行われる）
+        check_processing_status(history_id, max_attempts=60) 
\ No newline at end of file
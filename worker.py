@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+議事録生成ジョブを処理するワーカープロセス
+Webプロセスとは別にキューを処理する場合に使用します（例: JOB_WORKER_THREADS=0 でWebを起動し、本スクリプトを別途起動）
+--drain を指定すると、キューが空になるまで処理して終了します（cronなどで定期実行する場合）
+"""
+
+import os
+import sys
+from app import create_app
+from app.services import metrics
+from app.services.job_queue import drain, queue_counts, start_async_runner, start_worker_pool
+
+# Webプロセス用のワーカースレッドは起動せず、このプロセスで明示的に起動する
+app = create_app({'JOB_WORKER_THREADS': 0})
+
+
+def refresh_queue_metrics():
+    """メトリクスの出力前にキューの状態を取得する"""
+    with app.app_context():
+        metrics.set_queue_counts(queue_counts())
+
+
+if __name__ == '__main__':
+    if '--drain' in sys.argv[1:]:
+        processed = drain(app)
+        print(f"キューが空になったため終了します (処理したジョブ数: {processed})")
+        sys.exit(0)
+    # Webサーバーを持たないため、指定されたポートでメトリクスを公開する
+    metrics_port = int(os.environ.get('WORKER_METRICS_PORT', '0'))
+    if metrics_port > 0:
+        metrics.start_http_server(metrics_port, refresh=refresh_queue_metrics)
+        print(f"メトリクスを公開しました (ポート: {metrics_port})")
+    async_concurrency = int(os.environ.get('WORKER_ASYNC_CONCURRENCY', '0'))
+    if async_concurrency > 0:
+        # 1つのイベントループで複数のジョブを同時に処理する
+        pool = start_async_runner(app, concurrency=async_concurrency, poll_interval=app.config['JOB_POLL_INTERVAL'])
+        print(f"ワーカープロセスを起動しました (非同期ランナー, 同時実行数: {async_concurrency})")
+    else:
+        num_threads = int(os.environ.get('WORKER_THREADS', '4'))
+        pool = start_worker_pool(app, num_threads=num_threads, poll_interval=app.config['JOB_POLL_INTERVAL'])
+        print(f"ワーカープロセスを起動しました (スレッド数: {num_threads})")
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        print("ワーカープロセスを停止します（処理中のジョブの完了を待機）...")
+        pool.stop()